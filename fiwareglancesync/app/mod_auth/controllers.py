@@ -24,6 +24,7 @@
 
 import httplib
 import threading
+import datetime
 
 from flask import Blueprint, abort, make_response
 from flask import request
@@ -31,11 +32,12 @@ from flask import request
 from fiwareglancesync.app.app import db
 from fiwareglancesync.app.mod_auth.models import User
 from fiwareglancesync.app.settings.settings import CONTENT_TYPE, SERVER_HEADER, SERVER, JSON_TYPE
-from fiwareglancesync.app.settings.settings import logger_api
+from fiwareglancesync.app.settings.settings import logger_api, ENGINE_REFRESH
 from fiwareglancesync.glancesync import GlanceSync
 from fiwareglancesync.utils.utils import Images, Task
 from openstack_auth import authorized
 from region_manager import check_region
+from engine import GlanceSyncEngine
 
 
 # Define the blueprint: 'auth', set its url prefix: app.url/regions
@@ -43,6 +45,9 @@ mod_auth = Blueprint('auth', __name__, url_prefix='/regions')
 
 GlanceSync.init_logs()
 
+# GlanceSync object shared by all the requests
+engine = GlanceSyncEngine(lambda: GlanceSync(options_dict=None), ENGINE_REFRESH)
+
 
 # Set the route and accepted methods
 @mod_auth.route('/<regionid>', methods=['GET'])
@@ -67,16 +72,43 @@ def get_status(regionid, token=None):
 
     image_name = request.args.get('image')
 
-    glancesync = GlanceSync(options_dict=None)
-    list_images = glancesync.get_images_region(regionid, only_tenant_images=False)
+    # The status saved by the last synchronisation or status report is used
+    # if it is available: it does not require listing the glance servers.
+    store = engine.get_status_store(lambda: GlanceSync.get_status_store(options_dict=None))
+    if store is not None:
+        list_images = store.get_region(regionid, image_name)
+
+        # The region has a recorded status, but not of this image: it is not
+        # listed again, the image is not synchronised to the region.
+        if not list_images and image_name is not None and regionid in store.get_regions():
+            msg = "The image {} was not found in the region {}.".format(image_name, regionid)
+
+            message = {
+                "error": {
+                    "message": msg,
+                    "code": httplib.NOT_FOUND
+                }
+            }
+
+            abort(httplib.NOT_FOUND, message)
+    else:
+        list_images = None
 
     x = Images()
-    for item in list_images:
-        try:
-            if image_name is None or item.name == image_name:
-                x.add([item.id, item.name, item.status, None])
-        except Exception as e:
-            print(e)
+    if list_images:
+        for item in list_images:
+            checked = datetime.datetime.utcfromtimestamp(item['checked'])
+            x.add([item['id'], item['name'], item['status'], None],
+                  checked=checked.strftime('%Y-%m-%dT%H:%M:%SZ'))
+    else:
+        list_images = engine.get().get_images_region(regionid, only_tenant_images=False)
+
+        for item in list_images:
+            try:
+                if image_name is None or item.name == image_name:
+                    x.add([item.id, item.name, item.status, None])
+            except Exception as e:
+                print(e)
 
     if list_images:
         logger_api.info('Return result: %s', x.dump())
@@ -99,8 +131,7 @@ def run_in_thread(regionid, user):
 
     logger_api.info('Sync region {}, running in thread: {}'.format(regionid, threading.currentThread().getName()))
     try:
-        glancesync = GlanceSync(options_dict=None)
-        glancesync.sync_region(regionid, dry_run=False)
+        engine.get().sync_region(regionid, dry_run=False)
 
         row_changed = User.query.filter(User.task_id == user.task_id).one()
         row_changed.change_status(Task.SYNCED)
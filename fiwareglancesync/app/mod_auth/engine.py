@@ -0,0 +1,168 @@
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+import threading
+
+from fiwareglancesync.app.settings.settings import logger_api
+
+
+class GlanceSyncEngine(object):
+    """
+    A GlanceSync object shared by all the requests of the API process.
+
+    Creating a GlanceSync object parses the configuration, creates the facades
+    (and their keystone sessions) and lists the master region. The engine does
+    it once and then a background thread replaces the object every refresh
+    seconds, so the requests neither authenticate with keystone nor list the
+    master region. A request always uses the same object from the beginning to
+    the end, although the engine is refreshed in the meantime.
+
+    If a refresh fails, the previous object is kept and the next refresh is
+    tried after the same interval.
+
+    The requests use the object concurrently: the tenant id of each target is
+    obtained when the object is built, so the requests do not modify the
+    targets, and the facades create their sessions and clients under a lock.
+    """
+
+    def __init__(self, factory, refresh=300):
+        """
+        Create the engine. The GlanceSync object is not built until it is used.
+
+        :param factory: a function without parameters that returns a new
+                        GlanceSync object.
+        :param refresh: seconds between two refreshes of the GlanceSync object.
+        """
+        self.factory = factory
+        self.refresh_interval = refresh
+        self._glancesync = None
+        self._status_store = None
+        self._status_store_read = False
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def get(self):
+        """
+        Return the current GlanceSync object. The first invocation builds it
+        and starts the background refresh.
+
+        :return: a GlanceSync object.
+        """
+        glancesync = self._glancesync
+        if glancesync is None:
+            with self._lock:
+                if self._glancesync is None:
+                    self._glancesync = self._build()
+                    self._start()
+                glancesync = self._glancesync
+
+        return glancesync
+
+    def get_status_store(self, function):
+        """
+        Return the store with the synchronization status saved in status_db, read
+        only once.
+
+        :param function: a function without parameters that returns the store
+                         (e.g. GlanceSync.get_status_store) or None if it is not
+                         configured.
+        :return: a SyncStatusStore object or None.
+        """
+        with self._lock:
+            if not self._status_store_read:
+                self._status_store = function()
+                self._status_store_read = True
+
+            return self._status_store
+
+    def refresh(self):
+        """
+        Build a new GlanceSync object and replace the current one with it.
+
+        :return: True if the object was replaced.
+        """
+        try:
+            glancesync = self._build()
+        except Exception as e:
+            logger_api.warn('Error refreshing the GlanceSync engine, the previous one is kept: {}'.format(e))
+            return False
+
+        self._glancesync = glancesync
+        return True
+
+    def stop(self):
+        """
+        Stop the background refresh and discard the GlanceSync object and the
+        status store. The next invocation of get builds them again.
+
+        :return: Nothing.
+        """
+        with self._lock:
+            self._stopped.set()
+            if self._thread is not None and self._thread is not threading.currentThread():
+                self._thread.join()
+
+            self._thread = None
+            self._glancesync = None
+            self._status_store = None
+            self._status_store_read = False
+            self._stopped = threading.Event()
+
+    def _build(self):
+        """
+        Create a new GlanceSync object and authenticate all its targets, so the
+        sessions are ready to be used and the tenant id of each target is known.
+
+        :return: a GlanceSync object.
+        """
+        glancesync = self.factory()
+
+        for (name, target) in glancesync.targets.items():
+            try:
+                target['tenant_id'] = target['facade'].get_tenant_id()
+            except Exception as e:
+                logger_api.warn('Error authenticating the target {}: {}'.format(name, e))
+
+        logger_api.info('GlanceSync engine refreshed')
+
+        return glancesync
+
+    def _start(self):
+        """
+        Start the background refresh, if it is not running.
+        """
+        if self._thread is None and self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._run, args=(self._stopped,))
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self, stopped):
+        """
+        Body of the thread that refreshes the GlanceSync object.
+
+        :param stopped: the event set to stop the thread.
+        """
+        while not stopped.wait(self.refresh_interval):
+            self.refresh()
@@ -25,11 +25,16 @@
 import httplib
 from flask import request, abort, json
 from fiwareglancesync.app.mod_auth.AuthorizationManager import AuthorizationManager
+from fiwareglancesync.app.mod_auth.token_cache import TokenCache
 from fiwareglancesync.app.settings.settings import logger_api
 from fiwareglancesync.app.settings.settings import X_AUTH_TOKEN_HEADER, KEYSTONE_URL, AUTH_API_V2, ADM_PASS, ADM_USER, \
     ADM_TENANT_ID, ADM_TENANT_NAME, USER_DOMAIN_NAME
+from fiwareglancesync.app.settings.settings import TOKEN_CACHE_TTL, TOKEN_CACHE_SIZE, TOKEN_CACHE_DB
 from functools import wraps
 
+# Tokens already validated by keystone
+token_cache = TokenCache(ttl=TOKEN_CACHE_TTL, max_size=TOKEN_CACHE_SIZE, db_path=TOKEN_CACHE_DB or None)
+
 
 def build_keystone_url():
     return KEYSTONE_URL + '/' + AUTH_API_V2
@@ -126,7 +131,7 @@ def authorized(func):
             logger_api.info("Checking token: {}...".format(request.headers[X_AUTH_TOKEN_HEADER]))
 
         try:
-            token = validate_token(access_token=request.headers[X_AUTH_TOKEN_HEADER])
+            token = token_cache.get(request.headers[X_AUTH_TOKEN_HEADER], validate_token)
 
         except Exception as excep:
             # The exception could be a json message for the application
@@ -0,0 +1,214 @@
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+import json
+import sqlite3
+import threading
+import time
+
+from fiwareglancesync.app.settings.settings import logger_api
+
+# Seconds to wait for the lock of the database, held by other process
+LOCK_TIMEOUT = 30
+
+
+class RegionCatalog(object):
+    """
+    Cache of the names of the regions registered in keystone.
+
+    The first lookup obtains the catalog. After ttl seconds the catalog is stale:
+    the lookups still use it, while a background thread obtains it again, so the
+    requests only wait for keystone when there is no catalog at all.
+
+    When keystone fails, it is not asked again until a backoff delay passes: retry
+    seconds after the first error, doubled after each consecutive error up to
+    max_retry seconds. Meanwhile the previous catalog is kept or, if there is
+    none, the lookups raise the last error.
+
+    If db_path is set, the catalog is saved in a SQLite database, so all the
+    workers of the server share the catalog obtained by any of them.
+    """
+
+    def __init__(self, fetch, ttl=600, retry=10, max_retry=600, db_path=None, clock=time.time):
+        """
+        Create the catalog. The database is created if it does not exist.
+
+        :param fetch: a function without parameters that returns the list of region names.
+        :param ttl: seconds before obtaining again the catalog.
+        :param retry: seconds before trying again after the first error.
+        :param max_retry: maximum seconds before trying again after several errors.
+        :param db_path: path of the SQLite database shared by the workers, or None.
+        :param clock: function returning the current time in seconds.
+        """
+        self.fetch = fetch
+        self.ttl = ttl
+        self.retry = retry
+        self.max_retry = max_retry
+        self.db_path = db_path
+        self._clock = clock
+        self._regions = None
+        self._expires = 0
+        self._next_try = 0
+        self._failures = 0
+        self._error = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+        if self.db_path:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute('CREATE TABLE IF NOT EXISTS catalog (id INTEGER PRIMARY KEY, regions TEXT, '
+                                 'fetched REAL)')
+            finally:
+                conn.close()
+
+    def contains(self, region_name):
+        """
+        Check if a region is registered in keystone.
+
+        :param region_name: The name of the region.
+        :return: True if the region is in the catalog.
+        """
+        return region_name in self.get_regions()
+
+    def get_regions(self):
+        """
+        Return the names of the regions, obtaining the catalog only if there is none
+        and starting a background refresh if it is stale.
+
+        :return: a frozenset with the names of the regions.
+        """
+        regions = self._regions
+        now = self._clock()
+        if regions is not None and now < self._expires:
+            return regions
+
+        with self._lock:
+            if self._regions is None:
+                if now < self._next_try:
+                    raise self._error
+
+                self.refresh()
+                if self._regions is None:
+                    raise self._error
+
+            elif now >= self._expires and now >= self._next_try and not self._refreshing:
+                self._refreshing = True
+                thread = threading.Thread(target=self._refresh_background)
+                thread.daemon = True
+                thread.start()
+
+            return self._regions
+
+    def refresh(self):
+        """
+        Obtain the catalog from the database, if another worker obtained it recently,
+        or from keystone.
+
+        :return: True if the catalog was obtained.
+        """
+        regions, fetched = self._load()
+        if regions is None:
+            try:
+                regions = frozenset(self.fetch())
+            except Exception as e:
+                self._failures += 1
+                delay = min(self.max_retry, self.retry * 2 ** (self._failures - 1))
+                self._next_try = self._clock() + delay
+                self._error = e
+                logger_api.warn('Error obtaining the regions, retrying in {} seconds: {}'.format(delay, e))
+                return False
+
+            fetched = self._clock()
+            self._save(regions, fetched)
+            logger_api.debug(sorted(regions))
+
+        self._regions = regions
+        self._expires = fetched + self.ttl
+        self._failures = 0
+        self._error = None
+
+        return True
+
+    def _refresh_background(self):
+        """
+        Body of the thread that refreshes a stale catalog.
+        """
+        try:
+            self.refresh()
+        finally:
+            self._refreshing = False
+
+    def _load(self):
+        """
+        Return the regions saved in the database and the time they were obtained, or
+        (None, None) if there are not recent regions.
+        """
+        if not self.db_path:
+            return None, None
+
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute('SELECT regions, fetched FROM catalog WHERE id = 0').fetchone()
+            finally:
+                conn.close()
+
+        except sqlite3.Error as e:
+            logger_api.warn('Error reading the region catalog {}: {}'.format(self.db_path, e))
+            return None, None
+
+        if row is None or row[1] + self.ttl <= self._clock():
+            return None, None
+
+        return frozenset(json.loads(row[0])), row[1]
+
+    def _save(self, regions, fetched):
+        """
+        Save the regions in the database. The errors are only logged: the database is optional.
+        """
+        if not self.db_path:
+            return
+
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute('INSERT OR REPLACE INTO catalog VALUES (0, ?, ?)',
+                                 (json.dumps(sorted(regions)), fetched))
+            finally:
+                conn.close()
+
+        except sqlite3.Error as e:
+            logger_api.warn('Error writing the region catalog {}: {}'.format(self.db_path, e))
+
+    def _connect(self):
+        """
+        Open a new connection to the database.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=LOCK_TIMEOUT)
+        conn.text_factory = str
+
+        return conn
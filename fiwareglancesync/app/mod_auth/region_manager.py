@@ -28,15 +28,64 @@ from flask import abort, Response
 from fiwareglancesync.app.settings.settings import logger_api
 from functools import wraps
 from fiwareglancesync.app.mod_auth.AuthorizationManager import AuthorizationManager
+from fiwareglancesync.app.mod_auth.region_catalog import RegionCatalog
 import requests
 import json
 import httplib
 from fiwareglancesync.app.settings.settings import KEYSTONE_URL, AUTH_API_V2, AUTH_API_V3, REGION_LIST_API_V3, \
     ADM_USER, ADM_PASS, ADM_TENANT_ID, ADM_TENANT_NAME, USER_DOMAIN_NAME, X_AUTH_TOKEN_HEADER
+from fiwareglancesync.app.settings.settings import REGION_CACHE_TTL, REGION_CACHE_RETRY, REGION_CACHE_DB
 
 
-class region():
+def fetch_regions():
+    """
+    Get the region list from the endpoint groups of Keystone.
+    GET http://cloud.lab.fiware.org:4730/v3/OS-EP-FILTER/endpoint_groups
+
+    :return: a list with the names of the regions.
+    """
+    keystone_url = KEYSTONE_URL + '/' + AUTH_API_V2
+
+    a = AuthorizationManager(identity_url=keystone_url, api_version=AUTH_API_V2)
+
+    # Get the Admin token to validate the access_token
+    adm_token = a.get_auth_token(username=ADM_USER, password=ADM_PASS, tenant_id=ADM_TENANT_ID,
+                                 tenant_name=ADM_TENANT_NAME,
+                                 user_domain_name=USER_DOMAIN_NAME)
+
+    s = requests.Session()
+    s.headers.update({X_AUTH_TOKEN_HEADER: adm_token})
+
+    keystone_url = KEYSTONE_URL + '/' + AUTH_API_V3 + '/' + REGION_LIST_API_V3
+    response = s.get(keystone_url)
+
+    try:
+        r = json.loads(response.text)
+
+        endpoint_groups = r['endpoint_groups']
+
+    except (ValueError, KeyError):
+        # The admin token may be expired: get a new one the next time.
+        AuthorizationManager.auth_token = None
+        raise Exception('Cannot get the region list: {}'.format(response.text))
+
     regions = []
+    for i in range(0, len(endpoint_groups)):
+        # If the specific endpoint_groups has not a filters, it is not a correct
+        # region and we discard it.
+        region_filter = endpoint_groups[i]['filters']
+        if region_filter and 'region_id' in region_filter:
+            regions.append(region_filter['region_id'])
+
+    return regions
+
+
+# Regions registered in Keystone, shared by all the requests
+catalog = RegionCatalog(fetch_regions, ttl=REGION_CACHE_TTL, retry=REGION_CACHE_RETRY, max_retry=REGION_CACHE_TTL,
+                        db_path=REGION_CACHE_DB or None)
+
+
+class region():
     ERROR_MESSAGE = '''
     {
         "error": {
@@ -48,39 +97,9 @@ class region():
 
     def __init__(self):
         """
-        Contructor of the class region
+        Contructor of the class region. The region list is obtained from the catalog.
         """
-        # Get the region list
-        # GET http://cloud.lab.fiware.org:4730/v3/OS-EP-FILTER/endpoint_groups
-
-        if not self.regions:
-            keystone_url = KEYSTONE_URL + '/' + AUTH_API_V2
-
-            a = AuthorizationManager(identity_url=keystone_url, api_version=AUTH_API_V2)
-
-            # Get the Admin token to validate the access_token
-            adm_token = a.get_auth_token(username=ADM_USER, password=ADM_PASS, tenant_id=ADM_TENANT_ID,
-                                         tenant_name=ADM_TENANT_NAME,
-                                         user_domain_name=USER_DOMAIN_NAME)
-
-            s = requests.Session()
-            s.headers.update({X_AUTH_TOKEN_HEADER: adm_token})
-
-            keystone_url = KEYSTONE_URL + '/' + AUTH_API_V3 + '/' + REGION_LIST_API_V3
-            response = s.get(keystone_url)
-
-            r = json.loads(response.text)
-
-            endpoint_groups = r['endpoint_groups']
-
-            for i in range(0, len(endpoint_groups)):
-                # If the specific endpoint_groups has not a filters, it is not a correct
-                # region and we discard it.
-                region_filter = endpoint_groups[i]['filters']
-                if region_filter and 'region_id' in region_filter:
-                    self.regions.append(region_filter['region_id'])
-
-            logger_api.debug(self.regions)
+        self.regions = catalog.get_regions()
 
     def validate_region(self, region_name):
         """
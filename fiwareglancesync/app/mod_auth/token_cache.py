@@ -0,0 +1,263 @@
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+import calendar
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from fiwareglancesync.app.settings.settings import logger_api
+from fiwareglancesync.utils.utils import TokenModel
+
+# Seconds to wait for the lock of the database, held by other process
+LOCK_TIMEOUT = 30
+
+
+def parse_expires(expires):
+    """
+    Convert the expiration time of a keystone token (e.g. "2016-02-10T11:16:56Z" or
+    "2016-02-10T11:16:56.000000Z") to seconds since the epoch.
+
+    :param expires: The expiration time returned by keystone.
+    :return: The seconds since the epoch or None if the format is unknown.
+    """
+    try:
+        value = expires.rstrip('Z').split('.')[0]
+        return calendar.timegm(time.strptime(value, '%Y-%m-%dT%H:%M:%S'))
+    except (AttributeError, ValueError):
+        return None
+
+
+class _Call(object):
+    """
+    A validation of a token in progress, shared by the requests with the same token.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class TokenCache(object):
+    """
+    Cache of the tokens validated by keystone.
+
+    A token is kept until the first of its expiration time and ttl seconds, so a
+    revoked token is accepted at most ttl seconds. Only the valid tokens are cached.
+    The requests with the same token that arrive while it is being validated wait
+    for that validation instead of asking keystone again.
+
+    The tokens are kept in memory (at most max_size, the least recently used are
+    discarded first) and, if db_path is set, in a SQLite database shared by all
+    the workers of the server. The database saves a hash of the token, never the
+    token itself.
+    """
+
+    def __init__(self, ttl=300, max_size=1000, db_path=None, clock=time.time):
+        """
+        Create the cache. The database is created if it does not exist.
+
+        :param ttl: maximum seconds a validated token is kept. Zero disables the cache.
+        :param max_size: maximum number of tokens kept in memory.
+        :param db_path: path of the SQLite database shared by the workers, or None.
+        :param clock: function returning the current time in seconds.
+        """
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self.db_path = db_path
+        self._clock = clock
+        self._tokens = OrderedDict()
+        self._calls = dict()
+        self._lock = threading.Lock()
+
+        if self.db_path:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute('CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, username TEXT, '
+                                 'tenant TEXT, expires TEXT, deadline REAL)')
+            finally:
+                conn.close()
+
+    def get(self, access_token, function):
+        """
+        Return the TokenModel of a valid token, validating it with function only if it
+        is not cached.
+
+        :param access_token: The token to be checked.
+        :param function: a function that receives the token and returns its TokenModel
+                         or raises an exception if it is not valid (e.g. validate_token).
+        :return: The TokenModel of the token.
+        """
+        if self.ttl <= 0:
+            return function(access_token)
+
+        key = hashlib.sha256(access_token).hexdigest()
+
+        with self._lock:
+            token = self._get_memory(key)
+            if token is not None:
+                return token
+
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            token = self._get_db(key, access_token)
+            if token is None:
+                token = function(access_token)
+                self._put(key, token)
+
+            call.result = token
+            return token
+
+        except Exception as e:
+            call.error = e
+            raise
+
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
+
+    def invalidate(self, access_token):
+        """
+        Remove a token from the cache.
+
+        :param access_token: The token to be removed.
+        :return: Nothing.
+        """
+        key = hashlib.sha256(access_token).hexdigest()
+
+        with self._lock:
+            self._tokens.pop(key, None)
+
+        if self.db_path:
+            self._execute('DELETE FROM tokens WHERE key = ?', (key,))
+
+    def _get_memory(self, key):
+        """
+        Return the token cached in memory, or None if it is missing or too old.
+        It must be called with the lock held.
+        """
+        entry = self._tokens.pop(key, None)
+        if entry is None or entry[0] <= self._clock():
+            return None
+
+        # Move the token to the end, as the most recently used.
+        self._tokens[key] = entry
+
+        return entry[1]
+
+    def _get_db(self, key, access_token):
+        """
+        Return the token saved in the database by any worker, or None if it is missing or too old.
+        """
+        if not self.db_path:
+            return None
+
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute('SELECT username, tenant, expires, deadline FROM tokens WHERE key = ?',
+                                   (key,)).fetchone()
+            finally:
+                conn.close()
+
+        except sqlite3.Error as e:
+            logger_api.warn('Error reading the token cache {}: {}'.format(self.db_path, e))
+            return None
+
+        if row is None or row[3] <= self._clock():
+            return None
+
+        token = TokenModel(username=row[0], id=access_token, expires=row[2], tenant=row[1])
+        self._remember(key, row[3], token)
+
+        return token
+
+    def _put(self, key, token):
+        """
+        Cache a token just validated, unless it is already expired or its expiration time is unknown.
+        """
+        now = self._clock()
+        expires = parse_expires(token.expires)
+        if expires is None or expires <= now:
+            return
+
+        deadline = min(now + self.ttl, expires)
+        self._remember(key, deadline, token)
+
+        if self.db_path:
+            self._execute('INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?, ?)',
+                          (key, token.username, token.tenant, token.expires, deadline))
+            self._execute('DELETE FROM tokens WHERE deadline <= ?', (now,))
+
+    def _remember(self, key, deadline, token):
+        """
+        Save a token in memory, discarding the least recently used ones above max_size.
+        """
+        with self._lock:
+            self._tokens.pop(key, None)
+            self._tokens[key] = (deadline, token)
+            while len(self._tokens) > self.max_size:
+                self._tokens.popitem(last=False)
+
+    def _execute(self, sql, parameters):
+        """
+        Execute a statement that modifies the database. The errors are only logged: the cache is optional.
+        """
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(sql, parameters)
+            finally:
+                conn.close()
+
+        except sqlite3.Error as e:
+            logger_api.warn('Error writing the token cache {}: {}'.format(self.db_path, e))
+
+    def _connect(self):
+        """
+        Open a new connection to the database.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=LOCK_TIMEOUT)
+        conn.text_factory = str
+
+        return conn
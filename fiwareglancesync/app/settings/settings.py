@@ -77,6 +77,34 @@ STATUS = config.get('glancesync', 'STATUS')
 UPDATED = config.get('glancesync', 'UPDATED')
 PORT = config.get('glancesync', 'PORT')
 HOST = config.get('glancesync', 'HOST')
+if config.has_option('glancesync', 'ENGINE_REFRESH'):
+    ENGINE_REFRESH = config.getint('glancesync', 'ENGINE_REFRESH')
+else:
+    ENGINE_REFRESH = 300
+if config.has_option('glancesync', 'TOKEN_CACHE_TTL'):
+    TOKEN_CACHE_TTL = config.getint('glancesync', 'TOKEN_CACHE_TTL')
+else:
+    TOKEN_CACHE_TTL = 300
+if config.has_option('glancesync', 'TOKEN_CACHE_SIZE'):
+    TOKEN_CACHE_SIZE = config.getint('glancesync', 'TOKEN_CACHE_SIZE')
+else:
+    TOKEN_CACHE_SIZE = 1000
+if config.has_option('glancesync', 'TOKEN_CACHE_DB'):
+    TOKEN_CACHE_DB = config.get('glancesync', 'TOKEN_CACHE_DB')
+else:
+    TOKEN_CACHE_DB = None
+if config.has_option('glancesync', 'REGION_CACHE_TTL'):
+    REGION_CACHE_TTL = config.getint('glancesync', 'REGION_CACHE_TTL')
+else:
+    REGION_CACHE_TTL = 600
+if config.has_option('glancesync', 'REGION_CACHE_RETRY'):
+    REGION_CACHE_RETRY = config.getint('glancesync', 'REGION_CACHE_RETRY')
+else:
+    REGION_CACHE_RETRY = 10
+if config.has_option('glancesync', 'REGION_CACHE_DB'):
+    REGION_CACHE_DB = config.get('glancesync', 'REGION_CACHE_DB')
+else:
+    REGION_CACHE_DB = None
 
 # HTTP CONSTANTS
 CONTENT_TYPE = config.get('http', 'CONTENT_TYPE')
@@ -26,12 +26,25 @@
 import os
 import csv
 import copy
+import functools
+import threading
+from multiprocessing.pool import ThreadPool
 
 from settings.glancesync_config import GlanceSyncConfig
 from glancesync_region import GlanceSyncRegion
 from glancesync_image import GlanceSyncImage
+from glancesync_streams import TeeReader, ThrottledReader
+from glancesync_scheduler import UploadScheduler
+from glancesync_cache import ImageListCache
+from glancesync_index import ImagesDirIndex
+from glancesync_filter import PropertyIndex
+from glancesync_source import LocalImageSource, RemoteImageSource
+from glancesync_state import SyncState, master_fingerprint
+from glancesync_status import SyncStatusStore
+from glancesync_plan import SyncPlan, upload_status
 import glancesync_ami
-from glancesync_serversfacade import ServersFacade
+from glancesync_serversfacade import ServersFacade, ServersFacadeV2,\
+    GlanceFacadeChecksumException
 from glancesync_serverfacade_mock import ServersFacade as ServersFacadeMock
 from app.settings.settings import logger_cli
 
@@ -39,6 +52,14 @@ from app.settings.settings import logger_cli
 the master region.
 """
 
+# Maximum number of regions evaluated at the same time by sync_images and
+# sync_regions_scheduled
+_max_concurrent_plans = 8
+
+# Transfer modes where the images are not read from images_dir (unless the
+# location can not be registered)
+_remote_transfer_modes = ('copy_from', 'location')
+
 
 class GlanceSync(object):
     """Class to synchronize glance servers in different regions taking the base
@@ -72,16 +93,94 @@ class GlanceSync(object):
                 target['facade'] = ServersFacadeMock(target)
                 target['facade'].init_persistence(
                     os.environ['GLANCESYNC_MOCKPERSISTENT_PATH'])
+            elif target.get('glance_api_version', 1) == 2:
+                target['facade'] = ServersFacadeV2(target)
+                target['facade'].images_dir = self.images_dir
             else:
                 target['facade'] = ServersFacade(target)
+                target['facade'].images_dir = self.images_dir
 
         self.preferable_order = glancesyncconfig.preferable_order
         self.max_children = glancesyncconfig.max_children
+        self.fanout_buffer_mb = glancesyncconfig.fanout_buffer_mb
+        self.bandwidth_mb = glancesyncconfig.bandwidth_mb
+        self.max_uploads = glancesyncconfig.max_uploads
+        self.scheduler_policy = glancesyncconfig.scheduler_policy
+        self.relays = glancesyncconfig.relays
+        if glancesyncconfig.cache_dir:
+            self.cache = ImageListCache(glancesyncconfig.cache_dir,
+                                        glancesyncconfig.cache_ttl)
+        else:
+            self.cache = None
+        if glancesyncconfig.images_index:
+            self.images_index = ImagesDirIndex(self.images_dir,
+                                               glancesyncconfig.images_index)
+        else:
+            self.images_index = None
+        # the index is refreshed only once, before checking the first plan
+        self.__index_lock = threading.Lock()
+        self.__index_refreshed = False
         master_region = GlanceSyncRegion(self.master_region, self.targets)
-        images = master_region.target['facade'].get_imagelist(master_region)
+        if glancesyncconfig.image_source == 'remote':
+            self.image_source = RemoteImageSource(
+                master_region, glancesyncconfig.staging_dir,
+                glancesyncconfig.staging_mb)
+        else:
+            self.image_source = LocalImageSource(self.images_dir)
+        images = self.__get_imagelist(master_region, {'status': 'active'})
 
         self.master_region_dict = self._master_images_to_dict(images)
         glancesync_ami.clean_ami_ids(self.master_region_dict)
+        # master images to synchronise, by target name (see images_to_sync)
+        self.__images_to_sync = dict()
+        self.__images_to_sync_lock = threading.Lock()
+        # index of the master images, shared by the targets that use
+        # metadata_filter. Building it is only worth with several targets.
+        filters = list(target for target in self.targets.values()
+                       if target.get('metadata_filter', None))
+        if len(filters) > 1:
+            self.__master_index = PropertyIndex(self.master_region_dict)
+        else:
+            self.__master_index = None
+
+        # master fingerprint of the regions evaluated, by region fullname
+        self.__master_fingerprints = dict()
+        # UUIDs of the master images whose file in images_dir is corrupt
+        self.__corrupt_images = set()
+        if glancesyncconfig.state_file:
+            self.state = SyncState(glancesyncconfig.state_file,
+                                   glancesyncconfig.state_max_age)
+            changed = self.state.update_master(self.master_region_dict)
+            msg = '{0} master images changed since the last synchronisation'
+            self.log.info(msg.format(len(changed)))
+        else:
+            self.state = None
+        if glancesyncconfig.status_db:
+            self.status_store = SyncStatusStore(glancesyncconfig.status_db)
+        else:
+            self.status_store = None
+
+    @staticmethod
+    def get_status_store(config_stream=None, options_dict=None):
+        """return the store with the synchronisation status of the images of
+        each region, saved by the previous plans, synchronisations and status
+        reports. Unlike creating a GlanceSync object, it does not list the
+        master region.
+
+        :param config_stream: the configuration, as in the constructor
+        :param options_dict: the options to override, as in the constructor
+        :return: a SyncStatusStore object, or None if status_db is not
+          configured.
+        """
+        if config_stream is None:
+            glancesyncconfig = GlanceSyncConfig(override_d=options_dict)
+        else:
+            glancesyncconfig = GlanceSyncConfig(
+                stream=config_stream, override_d=options_dict)
+        if glancesyncconfig.status_db:
+            return SyncStatusStore(glancesyncconfig.status_db)
+        else:
+            return None
 
     def get_regions(self, omit_master_region=True, target='master'):
         """It returns the list of regions
@@ -111,6 +210,44 @@ class GlanceSync(object):
 
         return regions_filtered
 
+    def images_to_sync(self, regionstr):
+        """return the master images to synchronise to the region, according
+        to the configuration of its target.
+
+        The result only depends on the target, so it is obtained once for
+        each target and reused for all its regions. Calling this method
+        before forking the processes that synchronise the regions shares the
+        result with them.
+
+        :param regionstr: A region specified as 'target:region'. The prefix
+         'master:' may be omitted.
+        :return: a dictionary of master images indexed by name. The caller
+          may modify the dictionary, but not the images.
+        """
+        return self.__filter_master(GlanceSyncRegion(regionstr, self.targets))
+
+    def refresh_images_index(self):
+        """update the index of images_dir with the files of the master
+        images, if it is configured and it was not updated before by this
+        object.
+
+        The files are read only once: calling this method before forking the
+        processes that synchronise the regions shares the updated index with
+        them, instead of each process reading again the new files.
+
+        :return: Nothing
+        """
+        if self.images_index is None or self.image_source.remote:
+            return
+        with self.__index_lock:
+            if not self.__index_refreshed:
+                count = self.images_index.refresh(
+                    list(image.id for image in
+                         self.master_region_dict.values()))
+                self.log.info('Index of images_dir updated: {0} files '
+                              'read'.format(count))
+                self.__index_refreshed = True
+
     def sync_region(self, regionstr, dry_run=False):
         """sync the specified region with the master region
         Only the images that check the configured condition are synchronised.
@@ -133,127 +270,183 @@ class GlanceSync(object):
         :return: Nothing
         """
 
-        regionobj = GlanceSyncRegion(regionstr, self.targets)
-        facade = regionobj.target['facade']
-        target = regionobj.target
-        only_tenant_images = target['only_tenant_images']
-        target['tenant_id'] = target['facade'].get_tenant_id()
-        imagesregion = self.get_images_region(regionstr, only_tenant_images)
+        self.execute_plan(self.plan_region(regionstr), dry_run)
 
-        # Get a list of obsolete images in the region
-        # they are managed differently that the other images to sync, because:
-        # * they are not uploaded if not present
-        # * the name is changed (the _obsolete suffix is added)
-        if target['support_obsolete_images']:
-            syncprops = target.get('obsolete_syncprops', None)
-            obsolete = regionobj.image_list_to_obsolete(
-                self.master_region_dict, imagesregion, syncprops)
-        else:
-            obsolete = list()
+    def plan_region(self, regionstr):
+        """compute the operations needed to sync the specified region with the
+        master region, without modifying anything.
 
-        # previous step: manage obsolete images. Obsolete images are not
-        # synchronisable.
-        for image in obsolete:
-            self.log.info(regionobj.fullname +
-                          ': updating obsolete image ' + image.name)
-            facade.update_metadata(regionobj, image)
+        The plan includes the data of the images involved, so it can be
+        executed later (even by other process, after serialising it with
+        glancesync_plan.dump_plans) without listing again the images.
 
-        master_images = regionobj.images_to_sync_dict(self.master_region_dict)
-        dictimages = regionobj.local_images_filtered(master_images,
-                                                     imagesregion)
-        imagesregion = dictimages.values()
+        :param regionstr: A region specified as 'target:region'. The prefix
+         'master:' may be omitted.
+        :return: a SyncPlan object
+        """
+        regionobj = GlanceSyncRegion(regionstr, self.targets)
+        return self.__plan(regionobj)
 
-        # Important: tuples are sorted by image.size, in ascending order. This
-        # is important because:
-        # with AMI images, kernel/ramdisk must be uploaded before the image
-        # that refers them. They are smaller.
-        tuples = regionobj.image_list_to_sync(master_images, imagesregion)
-        totalmbs = 0
-        was_synchronised = True
+    def execute_plan(self, plan, dry_run=False):
+        """execute a plan obtained with plan_region. The effect is the same
+        that invoking sync_region when the plan was computed.
 
-        # First, update metadata
-        for tuple in tuples:
-            if tuple[0] == 'pending_metadata':
-                was_synchronised = False
-                if dry_run:
-                    self.log.info(regionobj.fullname +
-                                  ': Image pending to update the metadata ' +
-                                  tuple[1].name)
-                else:
-                    self.log.info(regionobj.fullname +
-                                  ': Updating the metadata of image ' +
-                                  tuple[1].name)
-                    self.__update_meta(tuple[1], dictimages, regionobj)
+        The plan is not modified, but it is not checked if the images of the
+        region have changed since then.
 
-        # Then, upload, replace, and rename_n_replace
+        :param plan: a SyncPlan object
+        :param dry_run: If true, images are not uploaded nor modified
+        :return: Nothing
+        """
+        regionobj = GlanceSyncRegion(plan.region, self.targets)
+        (dictimages, tuples) = self.__prepare_sync(plan, regionobj, dry_run)
+
+        # Then, upload, replace, and rename_n_replace. When upload_workers is
+        # greater than one, the uploads are done concurrently, but kernel and
+        # ramdisk images are always uploaded before the AMI images using them.
+        upload_workers = regionobj.target.get('upload_workers', 1)
+        pending = list()
         for tuple in tuples:
-            uploaded = False
-            sizeimage = float(tuple[1].size) / 1024 / 1024
-            if tuple[0] == 'pending_upload':
-                uploaded = True
-                if not dry_run:
-                    self.log.info(regionobj.fullname + ': Uploading image ' +
-                                  tuple[1].name + ' (' + str(sizeimage) +
-                                  ' MB)')
-                    self.__upload_image(tuple[1], dictimages, regionobj)
-
-            elif tuple[0] == 'pending_replace':
-                uploaded = True
-                region_image = dictimages[tuple[1].name]
-                self.log.info(regionobj.fullname + ': Replacing image ' +
-                              tuple[1].name + ' (' + str(sizeimage) +
-                              ' MB)')
+            if tuple[0] in upload_status:
+                if upload_workers > 1 and not dry_run:
+                    pending.append(tuple)
+                    continue
+            self.__sync_tuple(tuple, dictimages, regionobj, dry_run)
+
+        if pending:
+            self.__upload_concurrently(pending, dictimages, regionobj,
+                                       upload_workers)
+
+        self.__finish_sync(regionobj, dictimages, tuples, dry_run)
+        if not dry_run:
+            self.__mark_converged(regionobj)
+
+    def sync_regions_fanout(self, regionstrs, dry_run=False):
+        """sync the specified regions with the master region, reading only
+        once each master image.
+
+        The result is the same that invoking sync_region with each region,
+        but an image that must be uploaded to several regions is read once
+        from images_dir and its content is streamed simultaneously to all
+        these regions. Each region has a buffer of fanout_buffer_mb; when it
+        is exhausted, the reading waits for the slowest region.
+
+        Images are processed one by one, in ascending size order, but kernel
+        and ramdisk images go always first.
+
+        A region where an upload fails is not updated anymore, but this does
+        not affect the other regions.
+
+        :param regionstrs: A list of regions specified as 'target:region'. The
+         prefix 'master:' may be omitted.
+        :param dry_run: If true, images are not uploaded nor modified
+        :return: a list with the regions whose synchronisation failed.
+        """
+        failed = list()
+        regions = list()
+        regionstrs_dict = dict()
+        for regionstr in regionstrs:
+            try:
+                regionobj = GlanceSyncRegion(regionstr, self.targets)
+                regionstrs_dict[regionobj.fullname] = regionstr
+                (dictimages, tuples) = self.__prepare_sync(
+                    self.__plan(regionobj), regionobj, dry_run)
+                regions.append((regionobj, dictimages, tuples))
+            except Exception:
+                # Don't do anything. Message has been already printed
+                failed.append(regionstr)
+
+        # group the uploads by image
+        uploads = dict()
+        master_images = list()
+        for (regionobj, dictimages, tuples) in regions:
+            for tuple in tuples:
+                # the regions with transfer_mode = copy_from or location
+                # do not need the content of the images
+                if dry_run or tuple[0] not in upload_status or\
+                        regionobj.target.get('transfer_mode') in\
+                        _remote_transfer_modes:
+                    self.__sync_tuple(tuple, dictimages, regionobj, dry_run)
+                    continue
+                if tuple[1].name not in uploads:
+                    uploads[tuple[1].name] = list()
+                    master_images.append(tuple[1])
+                uploads[tuple[1].name].append((tuple, dictimages, regionobj))
+
+        master_images.sort(key=lambda image: int(image.size))
+        dependencies = self.__ami_dependencies(master_images)
+        master_images.sort(key=lambda image: image.name not in dependencies)
+        for image in master_images:
+            destinations = list(
+                d for d in uploads[image.name]
+                if regionstrs_dict[d[2].fullname] not in failed)
+            for fullname in self.__upload_fanout(image, destinations):
+                failed.append(regionstrs_dict[fullname])
+
+        for (regionobj, dictimages, tuples) in regions:
+            if regionstrs_dict[regionobj.fullname] not in failed:
+                self.__finish_sync(regionobj, dictimages, tuples, dry_run)
                 if not dry_run:
-                    self.__upload_image(tuple[1], dictimages, regionobj)
-                    facade.delete_image(regionobj, region_image.id,
-                                        confirm=False)
-            elif tuple[0] == 'pending_rename':
-                uploaded = True
-                region_image = dictimages[tuple[1].name]
-                self.log.info(
-                    regionobj.fullname + ': Renaming and replacing image ' + tuple[1].name + ' (' + str(sizeimage) +
-                    ' MB)')
+                    self.__mark_converged(regionobj)
+        return failed
 
-                if not dry_run:
-                    self.__upload_image(tuple[1], dictimages, regionobj)
-                    region_image.name += '.old'
-                    region_image.is_public = False
-                    facade.update_metadata(regionobj, region_image)
-            elif tuple[0] == 'error_checksum':
-                region_image = dictimages[tuple[1].name]
-                msg =\
-                    'Image {0} has a different checksum ({2}) in region {1} '\
-                    'than in the master region. It was not set what to do. '\
-                    'Please, fill either dontupdate, replace or rename '\
-                    'with the checksum.'
-                self.log.warning(msg.format(region_image.name,
-                                            regionobj.fullname,
-                                            region_image.checksum))
-            if uploaded:
-                was_synchronised = False
-                totalmbs += sizeimage
-                if dry_run:
-                    self.log.info(regionobj.fullname + ': Pending: ' +
-                                  tuple[1].name + ' (' + str(sizeimage) +
-                                  ' MB)')
-                else:
-                    self.log.info(regionobj.fullname + ': Image uploaded.')
+    def sync_regions_scheduled(self, regionstrs, dry_run=False):
+        """sync the specified regions with the master region, running the
+        uploads of all the regions at the same time with a global scheduler.
 
-        # Finally, update pending AMI ids
-        for tuple in tuples:
-            if tuple[0] == 'pending_ami':
-                self.__update_meta(tuple[1], dictimages, regionobj)
+        The scheduler limits the bandwidth used by all the uploads
+        (bandwidth_mb), the number of simultaneous uploads (max_uploads) and
+        the simultaneous uploads to each region (upload_workers of its
+        target). The next upload is chosen according to scheduler_policy:
+        smallest, priority (regions in preferable_order first) or completion
+        (the region closer to be synchronised first).
 
-        if was_synchronised:
-            self.log.info(regionobj.fullname + ': Region is synchronized.')
-        else:
-            if dry_run:
-                self.log.info(regionobj.fullname + ': MBs pending : ' +
-                              str(int(totalmbs)))
-            else:
-                self.log.info(regionobj.fullname +
-                              ':   Total uploaded to region: ' +
-                              str(int(totalmbs)) + ' (MB) ')
+        A region where an upload fails is not updated anymore, but this does
+        not affect the other regions.
+
+        :param regionstrs: A list of regions specified as 'target:region'. The
+         prefix 'master:' may be omitted.
+        :param dry_run: If true, images are not uploaded nor modified
+        :return: a list with the regions whose synchronisation failed.
+        """
+        return self.__sync_scheduled(regionstrs, dry_run)
+
+    def sync_images(self, names, regionstrs, dry_run=False):
+        """sync only the specified master images, and the kernel and ramdisk
+        images they refer, to the specified regions.
+
+        This is much faster than synchronising all the images when only a few
+        images have been published: the listings of the regions include only
+        these names (when the glance API allows it) and the regions are
+        evaluated concurrently. The uploads are run as in
+        sync_regions_scheduled.
+
+        The obsolete images are only considered if their names (with the
+        '_obsolete' suffix) are specified.
+
+        :param names: a list with the names of the master images
+        :param regionstrs: A list of regions specified as 'target:region'. The
+         prefix 'master:' may be omitted.
+        :param dry_run: If true, images are not uploaded nor modified
+        :return: a list with the regions whose synchronisation failed.
+        """
+        master_dict = dict()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name in master_dict:
+                continue
+            if name not in self.master_region_dict:
+                msg = 'Image {0} is not an active image of the master ' \
+                    'region (or its name is duplicated); it is ignored'
+                self.log.warning(msg.format(name))
+                continue
+            image = self.master_region_dict[name]
+            master_dict[name] = image
+            for prop in ('kernel_id', 'ramdisk_id'):
+                if prop in image.user_properties:
+                    pending.append(image.user_properties[prop])
+        return self.__sync_scheduled(regionstrs, dry_run, master_dict)
 
     def export_sync_region_status(self, regionstr, stream):
         """export a csv report about the images pending to sync in this region
@@ -286,13 +479,19 @@ class GlanceSync(object):
         :return: Nothing
         """
         regionobj = GlanceSyncRegion(regionstr, self.targets)
-        target = regionobj.target
-        target['tenant_id'] = target['facade'].get_tenant_id()
-        imagesregion = self.get_images_region(regionstr)
+        self.__tenant_id(regionobj.target)
+        imagesregion = self.get_images_region(
+            regionstr, names=self.__names_to_list())
         path = 'syncstatus_' + regionobj.fullname + '.csv'
         try:
-            tuples = regionobj.image_list_to_sync(self.master_region_dict,
-                                                  imagesregion)
+            master_images = self.__filter_master(regionobj)
+            tuples = regionobj.image_list_to_sync(
+                self.master_region_dict, imagesregion, master_images)
+            if self.status_store:
+                self.status_store.update_region(
+                    regionobj.fullname, tuples,
+                    regionobj.local_images_filtered(master_images,
+                                                    imagesregion))
             tuples.sort(key=lambda tuple: int(tuple[1].size))
             writer = csv.writer(stream)
             for tuple in tuples:
@@ -324,6 +523,7 @@ class GlanceSync(object):
         """
         regionobj = GlanceSyncRegion(regionstr, self.targets)
         facade = regionobj.target['facade']
+        self.__invalidate_cache(regionobj)
         facade.update_metadata(regionobj, image)
 
     def delete_image(self, regionstr, uuid, confirm=True):
@@ -340,6 +540,11 @@ class GlanceSync(object):
         """
         regionobj = GlanceSyncRegion(regionstr, self.targets)
         facade = regionobj.target['facade']
+        self.__invalidate_cache(regionobj)
+        if self.state:
+            self.state.forget_region(regionobj.fullname)
+        if self.status_store:
+            self.status_store.forget_region(regionobj.fullname)
         return facade.delete_image(regionobj, uuid, confirm)
 
     def backup_glancemetadata_region(self, regionstr, path=None):
@@ -374,27 +579,34 @@ class GlanceSync(object):
         msg = 'Backup of region ' + regionstr
         self.log.info(msg)
 
-    def get_images_region(self, regionstr, only_tenant_images=False):
+    def get_images_region(self, regionstr, only_tenant_images=False,
+                          names=None):
         """It returns a list with all the tenant's images in that region
 
         :param regionstr: A region specified as 'target:region'. The prefix
          'master:' may be omitted.
         :param only_tenant_images: If true, only include the images owned by
-        the tenant or without owner.
+        the tenant or without owner. With the version 2 of the glance API,
+        the images without owner are not included.
+        :param names: if not None, a set of names; the images with other names
+        may be omitted (the filter is applied by the server when possible).
         :return: a list of GlanceSyncImage objects
         """
 
         region = GlanceSyncRegion(regionstr, self.targets)
-        facade = region.target['facade']
-        region.target['tenant_id'] = facade.get_tenant_id()
+        tenant_id = self.__tenant_id(region.target)
+        filters = dict()
+        if names is not None:
+            filters['names'] = names
         if only_tenant_images:
+            filters['owner'] = tenant_id
             return list(
-                image for image in facade.get_imagelist(region)
+                image for image in self.__get_imagelist(region, filters)
                 if image.name and
                 (not image.owner or image.owner.zfill(32) ==
-                 region.target['tenant_id'].zfill(32) or image.owner == ''))
+                 tenant_id.zfill(32) or image.owner == ''))
         else:
-            return facade.get_imagelist(region)
+            return self.__get_imagelist(region, filters or None)
 
     @staticmethod
     def init_logs(include_date=False):
@@ -430,7 +642,620 @@ class GlanceSync(object):
         # Just duplicate the assignement of logger_cli to the log variable
         # log = logger_cli
 
-    def __upload_image(self, master_image, images_dict, regionobj):
+    def __sync_scheduled(self, regionstrs, dry_run=False, master_dict=None):
+        """Implementation of sync_regions_scheduled and sync_images.
+
+        :param regionstrs: A list of regions specified as 'target:region'.
+        :param dry_run: If true, images are not uploaded nor modified
+        :param master_dict: the master images to synchronise, by name. By
+          default, all the master images.
+        :return: a list with the regions whose synchronisation failed.
+        """
+        failed = list()
+        regions = list()
+        scheduler = UploadScheduler(self.bandwidth_mb, self.max_uploads,
+                                    self.scheduler_policy,
+                                    self.preferable_order)
+
+        def prepare(regionstr):
+            try:
+                regionobj = GlanceSyncRegion(regionstr, self.targets)
+                plan = self.__plan(regionobj, master_dict)
+                (dictimages, tuples) = self.__prepare_sync(
+                    plan, regionobj, dry_run)
+                return (regionstr, regionobj, dictimages, plan)
+            except Exception:
+                # Don't do anything. Message has been already printed
+                return None
+
+        # the regions are listed and compared concurrently
+        if regionstrs:
+            pool = ThreadPool(min(_max_concurrent_plans, len(regionstrs)))
+            try:
+                results = pool.map(prepare, regionstrs, 1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = list()
+        for (regionstr, result) in zip(regionstrs, results):
+            if result is None:
+                failed.append(regionstr)
+            else:
+                regions.append(result)
+
+        if self.relays and not dry_run:
+            sources = self.__relay_sources(regions, master_dict)
+        else:
+            sources = dict()
+        for (regionstr, regionobj, dictimages, plan) in regions:
+            scheduler.add_region(regionstr,
+                                 regionobj.target.get('upload_workers', 1))
+            if regionobj.target.get('transfer_mode') in _remote_transfer_modes:
+                chain = list()
+            else:
+                chain = list(sources[fullname] for fullname in
+                             self.__relay_chain(regionobj.fullname)
+                             if fullname in sources)
+            for tuple in plan.tuples:
+                if dry_run or tuple[0] not in upload_status:
+                    self.__sync_tuple(tuple, dictimages, regionobj, dry_run)
+                    continue
+                if chain:
+                    # the upload waits for the uploads of the same image to
+                    # the regions used as source.
+                    function = functools.partial(
+                        self.__upload_relayed, tuple, dictimages, regionobj,
+                        list(source[1:] for source in chain))
+                    after = list((source[0], tuple[1].name)
+                                 for source in chain if source[0])
+                else:
+                    function = functools.partial(
+                        self.__upload_throttled, tuple, dictimages, regionobj)
+                    after = None
+                scheduler.add(regionstr, tuple[1].name, tuple[1].size,
+                              function, plan.dependencies(tuple[1]), after)
+
+        failed.extend(scheduler.run())
+        for (regionstr, regionobj, dictimages, plan) in regions:
+            if regionstr not in failed:
+                self.__finish_sync(regionobj, dictimages, plan.tuples,
+                                   dry_run)
+                if not dry_run:
+                    self.__mark_converged(regionobj)
+        return failed
+
+    def __plan(self, regionobj, master_dict=None):
+        """Obtain the status of the images of the region and the operations
+        needed to synchronise it.
+
+        :param regionobj: the GlanceSyncRegion object
+        :param master_dict: the master images to consider, indexed by name.
+          By default, all the master images; with a subset, the incremental
+          state is not used.
+        :return: a SyncPlan object
+        """
+        target = regionobj.target
+        if master_dict is None:
+            master_dict = self.master_region_dict
+        self.__master_fingerprints.pop(regionobj.fullname, None)
+        if self.state and master_dict is self.master_region_dict:
+            region_fingerprint = target['facade'].get_imagelist_fingerprint(
+                regionobj)
+        else:
+            region_fingerprint = None
+        # None also if the facade does not support the fingerprint (glance
+        # API v2): then the state is not used with this region.
+        if region_fingerprint is not None:
+            # Nothing to do if neither the master images to synchronise nor
+            # the region have changed since the last synchronisation.
+            fingerprint = master_fingerprint(
+                self.__master_images_relevant(regionobj), target)
+            if self.state.is_converged(regionobj.fullname, fingerprint,
+                                       region_fingerprint):
+                self.log.info(regionobj.fullname +
+                              ': Region is unchanged since the last '
+                              'synchronisation.')
+                if self.status_store:
+                    self.status_store.touch_region(regionobj.fullname)
+                return SyncPlan(regionobj.fullname, list(), dict())
+            self.__master_fingerprints[regionobj.fullname] = fingerprint
+
+        only_tenant_images = target['only_tenant_images']
+        self.__tenant_id(target)
+        if target.get('adopt_images', False):
+            # all the images are needed to find the ones to adopt
+            names = None
+        else:
+            names = self.__names_to_list(master_dict)
+        imagesregion = self.get_images_region(
+            regionobj.fullname, only_tenant_images, names)
+        allimagesregion = imagesregion
+
+        # Get a list of obsolete images in the region
+        # they are managed differently that the other images to sync, because:
+        # * they are not uploaded if not present
+        # * the name is changed (the _obsolete suffix is added)
+        if target['support_obsolete_images']:
+            syncprops = target.get('obsolete_syncprops', None)
+            obsolete = regionobj.image_list_to_obsolete(
+                master_dict, imagesregion, syncprops)
+        else:
+            obsolete = list()
+
+        master_images = self.__filter_master(regionobj, master_dict)
+        dictimages = regionobj.local_images_filtered(master_images,
+                                                     imagesregion)
+        imagesregion = dictimages.values()
+
+        # Important: tuples are sorted by image.size, in ascending order. This
+        # is important because:
+        # with AMI images, kernel/ramdisk must be uploaded before the image
+        # that refers them. They are smaller.
+        tuples = regionobj.image_list_to_sync(master_images, imagesregion,
+                                              master_images)
+        if target.get('adopt_images', False):
+            tuples = self.__adopt(regionobj, tuples, dictimages,
+                                  allimagesregion)
+        tuples = self.__check_local_files(regionobj, tuples)
+        if self.status_store:
+            self.status_store.update_region(
+                regionobj.fullname, tuples, dictimages,
+                complete=master_dict is self.master_region_dict)
+        return SyncPlan(regionobj.fullname, tuples, dictimages, obsolete)
+
+    def __adopt(self, regionobj, tuples, dictimages, images_region):
+        """replace the uploads of the images whose content is already in the
+        region with other name by 'pending_adopt' operations, that rename the
+        existing image and update its metadata.
+
+        :param regionobj: the GlanceSyncRegion object
+        :param tuples: the list of tuples (status, master_image) of the plan
+        :param dictimages: the dictionary with the region images of the plan,
+          by name. The images to adopt are added, already renamed.
+        :param images_region: the list of all the images of the region
+        :return: the list of tuples
+        """
+        adopted = regionobj.images_to_adopt(self.master_region_dict,
+                                            images_region, tuples)
+        result = list()
+        for (status, image) in tuples:
+            if image.name in adopted and status == 'pending_upload':
+                region_image = copy.deepcopy(adopted[image.name])
+                msg = '{0}: Image {1} (UUID {2}) has the content of {3}; it '\
+                    'is adopted instead of uploading it'
+                self.log.info(msg.format(regionobj.fullname,
+                                         region_image.name, region_image.id,
+                                         image.name))
+                region_image.name = image.name
+                dictimages[image.name] = region_image
+                status = 'pending_adopt'
+            result.append((status, image))
+        return result
+
+    def __check_local_files(self, regionobj, tuples):
+        """check with the index of images_dir that the files of the images
+        to upload exist and match the master checksum. The uploads of the
+        other images are replaced by tuples with status 'error_file'.
+
+        :param regionobj: the GlanceSyncRegion object
+        :param tuples: the list of tuples (status, master_image) of the plan
+        :return: the list of tuples
+        """
+        if self.images_index is None or self.image_source.remote or\
+                regionobj.target.get('transfer_mode') in _remote_transfer_modes:
+            return tuples
+        self.refresh_images_index()
+        result = list()
+        for (status, image) in tuples:
+            cause = None
+            if status in upload_status:
+                cause = self.images_index.check(image)
+            if cause:
+                msg = '{0}: Image {1} can not be uploaded: {2}'
+                self.log.error(msg.format(regionobj.fullname, image.name,
+                                          cause))
+                # the region is not synchronised while the file is wrong
+                self.__master_fingerprints.pop(regionobj.fullname, None)
+                result.append(('error_file', image))
+            else:
+                result.append((status, image))
+        return result
+
+    def __prepare_sync(self, plan, regionobj, dry_run=False):
+        """First step of the execution of a plan: update the obsolete images
+        and the metadata.
+
+        :param plan: the SyncPlan object
+        :param regionobj: the GlanceSyncRegion object
+        :param dry_run: If true, images are not uploaded nor modified
+        :return: a tuple with a dictionary of the region images, indexed by
+          name, and the list of tuples of the plan
+        """
+        facade = regionobj.target['facade']
+        if not dry_run or plan.obsolete:
+            self.__invalidate_cache(regionobj)
+        # the plan is not modified: the dictionary is updated with the
+        # uploaded images and the new metadata.
+        dictimages = copy.deepcopy(plan.region_images)
+        tuples = plan.tuples
+
+        # previous step: manage obsolete images. Obsolete images are not
+        # synchronisable.
+        for image in plan.obsolete:
+            self.log.info(regionobj.fullname +
+                          ': updating obsolete image ' + image.name)
+            facade.update_metadata(regionobj, image)
+
+        # First, update metadata
+        for tuple in tuples:
+            if tuple[0] == 'pending_metadata':
+                if dry_run:
+                    self.log.info(regionobj.fullname +
+                                  ': Image pending to update the metadata ' +
+                                  tuple[1].name)
+                else:
+                    self.log.info(regionobj.fullname +
+                                  ': Updating the metadata of image ' +
+                                  tuple[1].name)
+                    self.__update_meta(tuple[1], dictimages, regionobj)
+                    self.__save_status(regionobj, tuple[1], dictimages)
+
+        return dictimages, tuples
+
+    def __finish_sync(self, regionobj, dictimages, tuples, dry_run=False):
+        """Last step of the synchronisation of a region: update the AMI
+        images pending of the upload of their kernel/ramdisk and print a
+        summary.
+
+        :param regionobj: the GlanceSyncRegion object
+        :param dictimages: a dictionary with the region images, by name.
+        :param tuples: the list of tuples returned by image_list_to_sync
+        :param dry_run: If true, images are not uploaded nor modified
+        :return: Nothing
+        """
+        totalmbs = 0
+        was_synchronised = True
+        for tuple in tuples:
+            if tuple[0] == 'pending_metadata':
+                was_synchronised = False
+            elif tuple[0] in upload_status:
+                was_synchronised = False
+                totalmbs += float(tuple[1].size) / 1024 / 1024
+            elif tuple[0] in ('error_file', 'pending_adopt'):
+                was_synchronised = False
+
+        # Finally, update pending AMI ids and adopt the images with other
+        # name (after the uploads, because they may be AMI images too)
+        for tuple in tuples:
+            if tuple[0] == 'pending_ami':
+                self.__update_meta(tuple[1], dictimages, regionobj)
+                if not dry_run:
+                    self.__save_status(regionobj, tuple[1], dictimages)
+            elif tuple[0] == 'pending_adopt':
+                image = dictimages[tuple[1].name]
+                if dry_run:
+                    msg = '{0}: Image pending to adopt {1} (UUID {2})'
+                else:
+                    msg = '{0}: Adopting the image with UUID {2} as {1}'
+                    self.__update_meta(tuple[1], dictimages, regionobj)
+                    self.__save_status(regionobj, tuple[1], dictimages)
+                self.log.info(msg.format(regionobj.fullname, tuple[1].name,
+                                         image.id))
+
+        if was_synchronised:
+            self.log.info(regionobj.fullname + ': Region is synchronized.')
+        else:
+            if dry_run:
+                self.log.info(regionobj.fullname + ': MBs pending : ' +
+                              str(int(totalmbs)))
+            else:
+                self.log.info(regionobj.fullname +
+                              ':   Total uploaded to region: ' +
+                              str(int(totalmbs)) + ' (MB) ')
+
+    def __sync_tuple(self, tuple, dictimages, regionobj, dry_run=False,
+                     data=None, source=None):
+        """Upload, replace or rename_n_replace the image of the tuple, or
+        print a warning if it has a different checksum than the master image.
+        Tuples with other status are ignored.
+
+        :param tuple: a tuple (status, master_image)
+        :param dictimages: a dictionary with the region images, by name.
+        :param regionobj: the GlanceSyncRegion object
+        :param dry_run: If true, images are not uploaded nor modified
+        :param data: optional file-like object with the content of the image.
+        :param source: the GlanceSyncRegion object of the region where data
+          is read from, if it is not the master region.
+        :return: Nothing
+        """
+        facade = regionobj.target['facade']
+        uploaded = False
+        sizeimage = float(tuple[1].size) / 1024 / 1024
+        if tuple[0] == 'pending_upload':
+            uploaded = True
+            if not dry_run:
+                self.log.info(regionobj.fullname + ': Uploading image ' +
+                              tuple[1].name + ' (' + str(sizeimage) +
+                              ' MB)')
+                self.__upload_image(tuple[1], dictimages, regionobj,
+                                    data, source)
+
+        elif tuple[0] == 'pending_replace':
+            uploaded = True
+            region_image = dictimages[tuple[1].name]
+            self.log.info(regionobj.fullname + ': Replacing image ' +
+                          tuple[1].name + ' (' + str(sizeimage) +
+                          ' MB)')
+            if not dry_run:
+                self.__upload_image(tuple[1], dictimages, regionobj,
+                                    data, source)
+                facade.delete_image(regionobj, region_image.id,
+                                    confirm=False)
+        elif tuple[0] == 'pending_rename':
+            uploaded = True
+            region_image = dictimages[tuple[1].name]
+            self.log.info(
+                regionobj.fullname + ': Renaming and replacing image ' + tuple[1].name + ' (' + str(sizeimage) +
+                ' MB)')
+
+            if not dry_run:
+                self.__upload_image(tuple[1], dictimages, regionobj,
+                                    data, source)
+                region_image.name += '.old'
+                region_image.is_public = False
+                facade.update_metadata(regionobj, region_image)
+        elif tuple[0] == 'error_checksum':
+            region_image = dictimages[tuple[1].name]
+            msg =\
+                'Image {0} has a different checksum ({2}) in region {1} '\
+                'than in the master region. It was not set what to do. '\
+                'Please, fill either dontupdate, replace or rename '\
+                'with the checksum.'
+            self.log.warning(msg.format(region_image.name,
+                                        regionobj.fullname,
+                                        region_image.checksum))
+        elif tuple[0] == 'error_file':
+            msg = '{0}: Image {1} is not uploaded: its file in images_dir is '\
+                'missing or corrupt'
+            self.log.error(msg.format(regionobj.fullname, tuple[1].name))
+        if uploaded:
+            if dry_run:
+                self.log.info(regionobj.fullname + ': Pending: ' +
+                              tuple[1].name + ' (' + str(sizeimage) +
+                              ' MB)')
+            else:
+                self.log.info(regionobj.fullname + ': Image uploaded.')
+                self.__save_status(regionobj, tuple[1], dictimages)
+
+    def __upload_concurrently(self, tuples, dictimages, regionobj, workers):
+        """Upload the images of the tuples using a pool of threads.
+
+        The images referred as kernel_id or ramdisk_id by other images to
+        upload are uploaded first, in a separated wave, because the UUID of
+        the new kernel/ramdisk is required to upload the AMI image.
+
+        If some upload fails, the other uploads of the wave are completed,
+        but the next wave is not started and the first error is raised.
+
+        :param tuples: a list of tuples (status, master_image) to upload
+        :param dictimages: a dictionary with the region images, by name.
+        :param regionobj: the GlanceSyncRegion object
+        :param workers: the maximum number of simultaneous uploads
+        :return: Nothing
+        """
+        dependencies = self.__ami_dependencies(
+            list(tuple[1] for tuple in tuples))
+        first_wave = list(t for t in tuples if t[1].name in dependencies)
+        second_wave = list(t for t in tuples if t[1].name not in dependencies)
+
+        def upload(tuple):
+            try:
+                self.__sync_tuple(tuple, dictimages, regionobj)
+                return None
+            except Exception, e:
+                return e
+
+        pool = ThreadPool(min(workers, len(tuples)))
+        try:
+            for wave in (first_wave, second_wave):
+                if not wave:
+                    continue
+                errors = list(e for e in pool.map(upload, wave, 1) if e)
+                if errors:
+                    raise errors[0]
+        finally:
+            pool.close()
+            pool.join()
+
+    def __upload_fanout(self, master_image, destinations):
+        """Upload a master image to several regions, reading the file only
+        once.
+
+        :param master_image: the master image to upload
+        :param destinations: a list of (tuple, dictimages, regionobj), one for
+          each region where the image is uploaded.
+        :return: a list with the regions where the upload failed.
+        """
+        failed = list()
+        if not destinations:
+            return failed
+        try:
+            file_obj = self.image_source.open(master_image)
+        except IOError, e:
+            for (tuple, dictimages, regionobj) in destinations:
+                msg = regionobj.fullname + ': Cannot open the image ' +\
+                    master_image.name + ' to upload. Cause: ' + str(e)
+                self.log.error(msg)
+                failed.append(regionobj.fullname)
+            return failed
+
+        tee = TeeReader(file_obj, len(destinations),
+                        self.fanout_buffer_mb * 1024 * 1024)
+
+        def upload(destination, branch):
+            (tuple, dictimages, regionobj) = destination
+            try:
+                self.__sync_tuple(tuple, dictimages, regionobj, data=branch)
+            except Exception:
+                # Don't do anything. Message has been already printed
+                failed.append(regionobj.fullname)
+            finally:
+                branch.close()
+
+        threads = list()
+        for (destination, branch) in zip(destinations, tee.branches):
+            thread = threading.Thread(target=upload,
+                                      args=(destination, branch))
+            thread.start()
+            threads.append(thread)
+        tee.start()
+        for thread in threads:
+            thread.join()
+        tee.join()
+        return failed
+
+    def __upload_throttled(self, tuple, dictimages, regionobj, bucket):
+        """Upload the image of the tuple, reading the file with the rate
+        limited by the bucket.
+
+        :param tuple: a tuple (status, master_image) to upload
+        :param dictimages: a dictionary with the region images, by name.
+        :param regionobj: the GlanceSyncRegion object
+        :param bucket: the TokenBucket shared by all the uploads
+        :return: Nothing
+        """
+        if bucket.rate <= 0 or\
+                regionobj.target.get('transfer_mode') in _remote_transfer_modes:
+            # no limit or the content is not transferred from this host: the
+            # content is read by __upload_image, if needed
+            self.__sync_tuple(tuple, dictimages, regionobj)
+            return
+        try:
+            data = ThrottledReader(self.image_source.open(tuple[1]), bucket)
+        except IOError, e:
+            msg = regionobj.fullname + ': Cannot open the image ' +\
+                tuple[1].name + ' to upload. Cause: ' + str(e)
+            self.log.error(msg)
+            raise Exception(msg)
+        try:
+            self.__sync_tuple(tuple, dictimages, regionobj, data=data)
+        finally:
+            data.close()
+
+    def __upload_relayed(self, tuple, dictimages, regionobj, sources,
+                         bucket):
+        """Upload the image of the tuple using as source the first region of
+        the relay chain that already has the image with the same checksum
+        than the master. If no region has it (or the copies are corrupt), the
+        image is uploaded from the master (see __upload_throttled).
+
+        :param tuple: a tuple (status, master_image) to upload
+        :param dictimages: a dictionary with the region images, by name.
+        :param regionobj: the GlanceSyncRegion object
+        :param sources: a list of tuples (regionobj, dictimages) with the
+          source regions, in order of preference
+        :param bucket: the TokenBucket shared by all the uploads
+        :return: Nothing
+        """
+        master_image = tuple[1]
+        for (sourceobj, source_images) in sources:
+            image = source_images.get(master_image.name, None)
+            if image is None or not master_image.checksum or\
+                    image.checksum != master_image.checksum or\
+                    image.status not in (None, 'active'):
+                continue
+            try:
+                data = sourceobj.target['facade'].download_image(
+                    sourceobj, image.id)
+            except Exception:
+                # Don't do anything. Message has been already printed
+                continue
+            msg = '{0}: Relaying image {1} from region {2}'
+            self.log.info(msg.format(regionobj.fullname, master_image.name,
+                                     sourceobj.fullname))
+            if bucket.rate > 0:
+                data = ThrottledReader(data, bucket)
+            try:
+                self.__sync_tuple(tuple, dictimages, regionobj, data=data,
+                                  source=sourceobj)
+                return
+            except GlanceFacadeChecksumException:
+                msg = '{0}: The copy of {1} in region {2} is corrupt'
+                self.log.warning(msg.format(regionobj.fullname,
+                                            master_image.name,
+                                            sourceobj.fullname))
+            finally:
+                data.close()
+        self.__upload_throttled(tuple, dictimages, regionobj, bucket)
+
+    def __relay_chain(self, fullname):
+        """return the full names of the regions that can be used as source
+        of the region, following the relays option: its relay, the relay of
+        its relay, and so on. The master region is omitted.
+
+        :param fullname: the full name of the region
+        :return: a list of full names, in order of preference
+        """
+        chain = list()
+        source = self.relays.get(fullname, None)
+        while source is not None and source not in chain:
+            if source != self.master_region:
+                chain.append(source)
+            source = self.relays.get(source, None)
+        return chain
+
+    def __relay_sources(self, regions, master_dict=None):
+        """return the regions that can be used as source of the regions
+        to synchronise. The regions to synchronise use the dictionary updated
+        with the new images; the image list of other regions is obtained.
+
+        :param regions: a list of tuples (regionstr, regionobj, dictimages,
+          plan) with the regions to synchronise
+        :param master_dict: the master images to synchronise, by name.
+        :return: a dictionary of tuples (regionstr, regionobj, dictimages)
+          indexed by full name; regionstr is None if the region is not
+          synchronised.
+        """
+        sources = dict()
+        for (regionstr, regionobj, dictimages, plan) in regions:
+            sources[regionobj.fullname] = (regionstr, regionobj, dictimages)
+        needed = set()
+        for (regionstr, regionobj, dictimages, plan) in regions:
+            needed.update(self.__relay_chain(regionobj.fullname))
+        filters = {'names': sorted(self.__names_to_list(master_dict))}
+        for fullname in needed - set(sources.keys()):
+            try:
+                regionobj = GlanceSyncRegion(fullname, self.targets)
+                images = self.__get_imagelist(regionobj, filters)
+            except Exception, e:
+                msg = '{0}: The region can not be used as relay. Cause: {1}'
+                self.log.warning(msg.format(fullname, str(e)))
+                continue
+            dictimages = dict((image.name, image) for image in images
+                              if image.status == 'active')
+            sources[fullname] = (None, regionobj, dictimages)
+        return sources
+
+    @staticmethod
+    def __ami_dependencies(images):
+        """Return the names of the images referred as kernel or ramdisk by
+        other image of the list.
+
+        :param images: a list of master images
+        :return: a set with the names of the kernel and ramdisk images
+        """
+        names = set(image.name for image in images)
+        dependencies = set()
+        for image in images:
+            for prop in ('kernel_id', 'ramdisk_id'):
+                aux_name = image.user_properties.get(prop, None)
+                if aux_name in names:
+                    dependencies.add(aux_name)
+        return dependencies
+
+    def __upload_image(self, master_image, images_dict, regionobj, data=None,
+                       source=None):
         new_image = copy.deepcopy(master_image)
         # update kernel_id & ramdisk_id if necessary.
         glancesync_ami.update_kernelramdisk_id(
@@ -443,13 +1268,78 @@ class GlanceSync(object):
             for p in diff:
                 del new_image.user_properties[p]
 
-        # upload
-        uuid = regionobj.target['facade'].upload_image(
-            regionobj, new_image)
-
-        # update images_dict with the new image (needed for pending_ami images)
+        # upload, ask the region to download the image or register the
+        # location of the master image in the shared store
+        target = regionobj.target
+        facade = target['facade']
+        transfer_mode = target.get('transfer_mode', 'push')
+        uuid = None
+        if transfer_mode == 'copy_from':
+            url = target['copy_from_url'].format(id=master_image.id,
+                                                 name=master_image.name)
+            uuid = facade.copy_image(regionobj, new_image, url,
+                                     target['copy_from_timeout'])
+        elif transfer_mode == 'location':
+            url = self.__master_location(master_image, target)
+            if url:
+                try:
+                    uuid = facade.register_location(regionobj, new_image, url)
+                except Exception:
+                    msg = '{0}: Uploading {1} instead of registering its '\
+                        'location'
+                    self.log.warning(msg.format(regionobj.fullname,
+                                                master_image.name))
+            else:
+                msg = '{0}: The location of {1} is unknown; uploading it'
+                self.log.info(msg.format(regionobj.fullname,
+                                         master_image.name))
+        if uuid is None:
+            # the content is verified by the facade while it is uploaded: a
+            # corrupt file in images_dir is not uploaded to other regions.
+            if source is None and master_image.id in self.__corrupt_images:
+                msg = '{0}: Upload of {1} skipped: its file is corrupt'
+                msg = msg.format(regionobj.fullname, master_image.name)
+                self.log.error(msg)
+                raise Exception(msg)
+            staged = None
+            if data is None and self.image_source.remote:
+                # the facade can not read the file from images_dir
+                data = staged = self.image_source.open(master_image)
+            try:
+                uuid = facade.upload_image(regionobj, new_image, data)
+            except GlanceFacadeChecksumException:
+                if source is None:
+                    self.__corrupt_images.add(master_image.id)
+                raise
+            finally:
+                if staged is not None:
+                    staged.close()
+
+        # update images_dict with the new image (needed for pending_ami images
+        # and to use the region as relay of other regions)
         images_dict[new_image.name] = GlanceSyncImage(
-            new_image.name, uuid, regionobj.fullname)
+            new_image.name, uuid, regionobj.fullname,
+            checksum=master_image.checksum, size=master_image.size,
+            status='active')
+
+    @staticmethod
+    def __master_location(master_image, target):
+        """return the location of the master image in the store shared with
+        the target: the location_url of the target, if it is set, or the
+        location reported by the master glance server (only available with
+        the API v2 when the server shows the locations).
+
+        :param master_image: the master image
+        :param target: the target of the region
+        :return: the URL, or None if it is unknown
+        """
+        if target.get('location_url'):
+            return target['location_url'].format(id=master_image.id,
+                                                 name=master_image.name)
+        raw = master_image.raw or dict()
+        if raw.get('locations'):
+            return raw['locations'][0]['url']
+        return raw.get('direct_url', None)
 
     def __update_meta(self, master_image, images_dict, regionobj):
         image = images_dict[master_image.name]
@@ -470,6 +1360,120 @@ class GlanceSync(object):
         image.is_public = master_image.is_public
         regionobj.target['facade'].update_metadata(regionobj, image)
 
+    def __get_imagelist(self, regionobj, filters=None):
+        """return the image list of the region, using the cache if it is
+        configured.
+
+        :param regionobj: the GlanceSyncRegion object
+        :param filters: the hints for the facade (owner, status, names)
+        :return: a list of GlanceSyncImage objects
+        """
+        if self.cache:
+            return self.cache.get_imagelist(regionobj, filters)
+        else:
+            return regionobj.target['facade'].get_imagelist(regionobj,
+                                                            filters)
+
+    def __tenant_id(self, target):
+        """return the tenant id of the target, obtained from the facade the
+        first time. The targets may be shared by several threads (see
+        app.mod_auth.engine), so it is not saved again.
+
+        :param target: the target
+        :return: the tenant id
+        """
+        if 'tenant_id' not in target:
+            target['tenant_id'] = target['facade'].get_tenant_id()
+        return target['tenant_id']
+
+    def __filter_master(self, regionobj, master_dict=None):
+        """return the master images to synchronise to the region. The images
+        of the master region are filtered only once by target.
+
+        :param regionobj: the GlanceSyncRegion object
+        :param master_dict: the master images to consider, indexed by name.
+          By default, all the master images.
+        :return: a new dictionary of master images indexed by name
+        """
+        with self.__images_to_sync_lock:
+            images = self.__images_to_sync.get(regionobj.target_name, None)
+            if images is None:
+                images = regionobj.images_to_sync_dict(
+                    self.master_region_dict, self.__master_index)
+                self.__images_to_sync[regionobj.target_name] = images
+        if master_dict is None or master_dict is self.master_region_dict:
+            return dict(images)
+        # whether an image is synchronisable only depends on the image, so
+        # the filter of a subset is the subset of the filter.
+        return dict((name, image) for (name, image) in images.items()
+                    if master_dict.get(name, None) is image)
+
+    def __names_to_list(self, master_dict=None):
+        """return the names of the images of a region that are relevant to
+        synchronise it: the names of the master images and, for the master
+        images with the '_obsolete' suffix, the name without the suffix."""
+        if master_dict is None:
+            master_dict = self.master_region_dict
+        names = set(master_dict.keys())
+        names.update(name[:-9] for name in master_dict
+                     if name.endswith('_obsolete'))
+        return names
+
+    def __master_images_relevant(self, regionobj):
+        """return the master images that may change the synchronisation of
+        the region: the images to synchronise and the obsolete images.
+
+        :param regionobj: the GlanceSyncRegion object
+        :return: a dictionary of master images indexed by name
+        """
+        images = self.__filter_master(regionobj)
+        for (name, image) in self.master_region_dict.items():
+            if name.endswith('_obsolete'):
+                images[name] = image
+        return images
+
+    def __mark_converged(self, regionobj):
+        """save that the region is synchronised with the master images
+        evaluated by __plan, so the next run can skip it if nothing changes.
+
+        :param regionobj: the GlanceSyncRegion object
+        :return: Nothing
+        """
+        fingerprint = self.__master_fingerprints.pop(regionobj.fullname,
+                                                     None)
+        if self.state is None or fingerprint is None:
+            return
+        facade = regionobj.target['facade']
+        region_fingerprint = facade.get_imagelist_fingerprint(regionobj)
+        if region_fingerprint is not None:
+            self.state.set_converged(regionobj.fullname, fingerprint,
+                                     region_fingerprint)
+
+    def __save_status(self, regionobj, master_image, dictimages):
+        """save in the status store that an image has been synchronised to
+        the region (uploaded or updated).
+
+        :param regionobj: the GlanceSyncRegion object
+        :param master_image: the master image synchronised
+        :param dictimages: a dictionary with the region images, by name.
+        :return: Nothing
+        """
+        if self.status_store is None:
+            return
+        region_image = dictimages.get(master_image.name, None)
+        if region_image is not None:
+            uuid = region_image.id
+        else:
+            uuid = None
+        self.status_store.set_image(regionobj.fullname, master_image.name,
+                                    'ok', uuid)
+
+    def __invalidate_cache(self, regionobj):
+        """remove the cached image list of a region that is going to be
+        modified"""
+        if self.cache:
+            self.cache.invalidate(regionobj)
+
     def _master_images_to_dict(self, images):
         """Convert the list of images to a dictionary. Remove images with a
         duplicate name (e.g. if name appears three times, remove the three
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+import os
+import time
+import json
+import hashlib
+import tempfile
+import cPickle
+
+from app.settings.settings import logger_cli
+
+"""This internal module contains a cache on disk of the image lists of the
+regions.
+
+Users should use the GlanceSync class provided in glancesync instead of this
+module."""
+
+
+class ImageListCache(object):
+    """Cache on disk of the image list of each region, indexed by target,
+    region and the filters used to obtain it (e.g. the export and the
+    synchronisation plan of the same region use different filters, each one
+    has its own entry).
+
+    A cached list is used only if it is younger than ttl seconds and the
+    fingerprint returned by the facade (a cheap query that detects new,
+    updated and deleted images) has not changed since the list was first
+    reused. The fingerprint is only queried when there is a fresh list, so
+    a miss costs just the listing; as a consequence, a change made by other
+    tools between the listing and its first reuse is not detected until the
+    list expires. The lists are not cached if the facade does not support
+    the fingerprint (glance API v2).
+    """
+
+    def __init__(self, cache_dir, ttl=300):
+        """Create the cache object. The directory is created if it does not
+        exist.
+
+        :param cache_dir: the directory where the lists are saved
+        :param ttl: the maximum age of the cached lists, in seconds
+        """
+        self.log = logger_cli
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get_imagelist(self, regionobj, filters=None):
+        """return the image list of the region, from the cache if it is fresh
+        or from the glance server otherwise.
+
+        :param regionobj: The GlanceSyncRegion object of the region to list
+        :param filters: the hints passed to the facade. Each combination of
+          filters is cached in its own entry.
+        :return: a list of GlanceSyncImage objects
+        """
+        facade = regionobj.target['facade']
+        if not facade.has_imagelist_fingerprint:
+            return facade.get_imagelist(regionobj, filters)
+
+        path = self._path(regionobj, filters)
+        entry = self._load(path)
+        if entry is not None and time.time() - entry['time'] < self.ttl:
+            fingerprint = facade.get_imagelist_fingerprint(regionobj)
+            if entry['fingerprint'] is None and fingerprint is not None:
+                # first reuse of the list: the fingerprint is recorded
+                entry['fingerprint'] = fingerprint
+                self._save(path, entry)
+                return entry['images']
+            elif fingerprint is not None and \
+                    entry['fingerprint'] == fingerprint:
+                return entry['images']
+
+        entry = {'time': time.time(), 'fingerprint': None,
+                 'images': facade.get_imagelist(regionobj, filters)}
+        self._save(path, entry)
+        return entry['images']
+
+    def invalidate(self, regionobj):
+        """remove the cached lists of the region, with any filters
+
+        :param regionobj: The GlanceSyncRegion object of the region
+        :return: Nothing
+        """
+        prefix = self._prefix(regionobj)
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix):
+                try:
+                    os.unlink(os.path.join(self.cache_dir, name))
+                except OSError:
+                    # removed by other process
+                    pass
+
+    def _prefix(self, regionobj):
+        """Return the prefix of the names of the files of the region. It
+        includes a hash of the keystone url and the tenant, to not mix
+        regions of different configurations."""
+        target = regionobj.target
+        key = '{0}|{1}'.format(target.get('keystone_url', ''),
+                               target.get('tenant', ''))
+        name = 'imagelist_{0}_{1}_{2}_'.format(
+            target['target_name'], regionobj.region,
+            hashlib.md5(key).hexdigest()[:8])
+        return name.replace(os.sep, '_')
+
+    def _path(self, regionobj, filters=None):
+        """Return the path of the file of the region and the filters. The
+        name ends with a hash of the filters, normalised (the order of the
+        names is not relevant), or 'all' if there are not filters."""
+        if filters:
+            normalised = dict()
+            for (key, value) in filters.items():
+                if isinstance(value, (list, tuple, set, frozenset)):
+                    value = sorted(value)
+                normalised[key] = value
+            suffix = hashlib.md5(
+                json.dumps(normalised, sort_keys=True)).hexdigest()[:8]
+        else:
+            suffix = 'all'
+        return os.path.join(self.cache_dir, self._prefix(regionobj) + suffix)
+
+    def _load(self, path):
+        """Return the entry saved in path, or None if it does not exist or
+        can not be read"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return cPickle.load(f)
+        except Exception, e:
+            msg = 'Ignoring the cached image list {0}. Cause: {1}'
+            self.log.warning(msg.format(path, str(e)))
+            return None
+
+    def _save(self, path, entry):
+        """Write the entry to path. A temporal file is renamed, so readers
+        never see a partial file."""
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                cPickle.dump(entry, f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, path)
+        except Exception, e:
+            msg = 'Cannot save the cached image list {0}. Cause: {1}'
+            self.log.warning(msg.format(path, str(e)))
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+import re
+
+"""This module contains the declarative alternative to metadata_condition:
+a filter language compiled once into a function, that can also be evaluated
+with an inverted index of the properties of the master images.
+
+The language has these expressions:
+*has <property>: the image has the user property.
+*<property> == <value>, <property> != <value>: the user property has (or
+ has not, or the image has not the property) the value. The values are
+ compared as unicode strings (the UTF-8 strings are decoded).
+*<property> =~ <regex>: the value of the user property matches the regular
+ expression (re.search).
+*public: the image is public.
+*name == <value>, name != <value>, name =~ <regex>: the same comparisons
+ with the name of the image.
+*and, or, not and parentheses, with the usual precedence.
+
+Values and regular expressions can be quoted with ' or "; the quotes are
+required if they contain spaces, parentheses or the characters =, ! and ~.
+Example: public and has nid and type == baseimage
+
+Users should use the GlanceSync class provided in glancesync instead of this
+module."""
+
+_token_re = re.compile(r"""\s*(?:(\(|\)|==|!=|=~)|'([^']*)'|"([^"]*)"|"""
+                       r"""([^\s()=!~'"]+))""")
+
+_keywords = ('and', 'or', 'not', 'has', 'public')
+
+
+def _text(value):
+    """Convert a value to the unicode string used in the comparisons. The
+    values of the properties may be unicode (API v2), UTF-8 strings (API v1
+    and the configuration) or other types, like numbers."""
+    if isinstance(value, unicode):
+        return value
+    elif isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+    else:
+        return unicode(value)
+
+
+class MetadataFilter(object):
+    """A condition over the metadata of an image, compiled from the filter
+    language.
+
+    The condition is translated to a python expression, compiled once into a
+    function. With an index, it is evaluated with set operations; this is
+    worth when the index is shared by several filters, because the first
+    lookup of each property scans all the images.
+    """
+
+    def __init__(self, source):
+        """Compile the condition.
+
+        :param source: the condition, in the filter language
+        :raise ValueError: if the condition is not valid
+        """
+        self.source = source
+        self._regexes = list()
+        self._tokens = _tokenize(source)
+        (expression, self._select) = self._parse_or()
+        if self._tokens:
+            raise ValueError('Unexpected {0} in the filter {1}'.format(
+                self._tokens[0][1], source))
+        del self._tokens
+        self._match = self._compile(expression)
+
+    def __str__(self):
+        return self.source
+
+    def match(self, image):
+        """Evaluate the condition with an image.
+
+        :param image: a GlanceSyncImage object
+        :return: True if the image satisfies the condition
+        """
+        return self._match(image)
+
+    def select(self, index):
+        """Evaluate the condition with all the images of an index.
+
+        :param index: a PropertyIndex object
+        :return: a set with the names of the images that satisfy the condition
+        """
+        return self._select(index)
+
+    def _compile(self, expression):
+        """Return a function that evaluates the python expression generated
+        by the parser with an image"""
+        return eval('lambda image: bool(' + expression + ')',
+                    {'_regexes': self._regexes, '_text': _text})
+
+    def _next(self):
+        """Return and consume the next token, or raise ValueError if there
+        are not more tokens."""
+        if not self._tokens:
+            raise ValueError('Unexpected end of the filter ' + self.source)
+        return self._tokens.pop(0)
+
+    def _accept(self, word):
+        """Consume the next token if it is the keyword or operator word"""
+        if self._tokens and self._tokens[0] == ('symbol', word):
+            self._tokens.pop(0)
+            return True
+        return False
+
+    # Each _parse method returns a tuple with the python expression and the
+    # function that evaluates it with a PropertyIndex.
+
+    def _parse_or(self):
+        operands = [self._parse_and()]
+        while self._accept('or'):
+            operands.append(self._parse_and())
+        if len(operands) == 1:
+            return operands[0]
+        selects = list(operand[1] for operand in operands)
+        return ('(' + ' or '.join(operand[0] for operand in operands) + ')',
+                lambda index: set().union(*(select(index)
+                                            for select in selects)))
+
+    def _parse_and(self):
+        operands = [self._parse_not()]
+        while self._accept('and'):
+            operands.append(self._parse_not())
+        if len(operands) == 1:
+            return operands[0]
+        selects = list(operand[1] for operand in operands)
+
+        def select_and(index):
+            result = selects[0](index)
+            for select in selects[1:]:
+                if not result:
+                    break
+                result = result.intersection(select(index))
+            return result
+        return ('(' + ' and '.join(operand[0] for operand in operands) + ')',
+                select_and)
+
+    def _parse_not(self):
+        if self._accept('not'):
+            (expression, select) = self._parse_not()
+            return ('(not ' + expression + ')',
+                    lambda index: index.names.difference(select(index)))
+        return self._parse_atom()
+
+    def _parse_atom(self):
+        (kind, value) = self._next()
+        if kind == 'symbol' and value == '(':
+            result = self._parse_or()
+            if not self._accept(')'):
+                raise ValueError('Missing ) in the filter ' + self.source)
+            return result
+        elif kind == 'symbol' and value == 'public':
+            return ('image.is_public', lambda index: index.public)
+        elif kind == 'symbol' and value == 'has':
+            prop = self._word()
+            return ('{0!r} in image.user_properties'.format(prop),
+                    lambda index: index.with_property(prop))
+        elif kind == 'word':
+            return self._parse_comparison(value)
+        raise ValueError('Unexpected {0} in the filter {1}'.format(
+            value, self.source))
+
+    def _parse_comparison(self, field):
+        (kind, operator) = self._next()
+        if kind != 'symbol' or operator not in ('==', '!=', '=~'):
+            raise ValueError('Expected ==, != or =~ after {0} in the filter '
+                             '{1}'.format(field, self.source))
+        value = _text(self._word())
+        if field == 'name':
+            present = 'True'
+            get = '_text(image.name)'
+        else:
+            present = '{0!r} in image.user_properties'.format(field)
+            get = '_text(image.user_properties[{0!r}])'.format(field)
+
+        if operator == '=~':
+            try:
+                regex = re.compile(value, re.UNICODE)
+            except re.error, e:
+                raise ValueError('Invalid regular expression {0} in the '
+                                 'filter {1}: {2}'.format(value, self.source,
+                                                          str(e)))
+            self._regexes.append(regex)
+            expression = '({0} and _regexes[{1}].search({2}) is not None)'
+            return (expression.format(present, len(self._regexes) - 1, get),
+                    lambda index: index.matching(field, regex.search))
+
+        expression = '({0} and {1} == {2!r})'.format(present, get, value)
+        if operator == '==':
+            return (expression, lambda index: index.with_value(field, value))
+        else:
+            return ('(not ' + expression + ')',
+                    lambda index: index.names.difference(
+                        index.with_value(field, value)))
+
+    def _word(self):
+        """Consume a value: a word (excepting the keywords) or a quoted
+        string"""
+        (kind, value) = self._next()
+        if kind != 'word':
+            raise ValueError('Unexpected {0} in the filter {1}'.format(
+                value, self.source))
+        return value
+
+
+def _tokenize(source):
+    """Split the condition in a list of tuples (kind, value). kind is
+    'symbol' for the operators, parentheses and keywords and 'word' for the
+    names and values (quoted or not)."""
+    tokens = list()
+    pos = 0
+    source = source.rstrip()
+    while pos < len(source):
+        m = _token_re.match(source, pos)
+        if not m:
+            raise ValueError('Invalid character {0} in the filter {1}'.format(
+                source[pos:].lstrip()[:1], source))
+        (symbol, quoted1, quoted2, word) = m.groups()
+        if symbol:
+            tokens.append(('symbol', symbol))
+        elif quoted1 is not None:
+            tokens.append(('word', quoted1))
+        elif quoted2 is not None:
+            tokens.append(('word', quoted2))
+        elif word in _keywords:
+            tokens.append(('symbol', word))
+        else:
+            tokens.append(('word', word))
+        pos = m.end()
+    return tokens
+
+
+class PropertyIndex(object):
+    """Inverted index of the user properties of a set of images, to evaluate
+    a MetadataFilter with set operations instead of testing each image.
+
+    Only the properties used by the filters are indexed, the first time they
+    are needed."""
+
+    def __init__(self, images):
+        """Build the index.
+
+        :param images: a dictionary of GlanceSyncImage objects, indexed by
+          name
+        """
+        self.images = images
+        self.names = set(images.keys())
+        self._public = None
+        # values of each property: property -> _text(value) -> set of names
+        self._values = dict()
+        self._with_property = dict()
+
+    @property
+    def public(self):
+        """The names of the public images"""
+        if self._public is None:
+            self._public = set(name for (name, image) in self.images.items()
+                               if image.is_public)
+        return self._public
+
+    def _by_value(self, field):
+        """Return the dictionary value -> names of the field of a comparison:
+        the name of the image (if field is 'name') or a user property"""
+        if field not in self._values:
+            by_value = dict()
+            if field == 'name':
+                for name in self.images:
+                    by_value[_text(name)] = set([name])
+            else:
+                for (name, image) in self.images.items():
+                    if field in image.user_properties:
+                        value = _text(image.user_properties[field])
+                        by_value.setdefault(value, set()).add(name)
+            self._values[field] = by_value
+        return self._values[field]
+
+    def with_property(self, prop):
+        """Return the names of the images with the user property"""
+        if prop not in self._with_property:
+            self._with_property[prop] = set(
+                name for (name, image) in self.images.items()
+                if prop in image.user_properties)
+        return self._with_property[prop]
+
+    def with_value(self, prop, value):
+        """Return the names of the images whose property (or name, if prop is
+        'name') has the value, compared as unicode string"""
+        return self._by_value(prop).get(_text(value), set())
+
+    def matching(self, prop, test):
+        """Return the names of the images whose property (or name) value
+        satisfies the function test. It is called once for each different
+        value."""
+        result = set()
+        for (value, names) in self._by_value(prop).items():
+            if test(value):
+                result.update(names)
+        return result
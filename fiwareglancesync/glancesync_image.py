@@ -23,20 +23,152 @@
 # contact with opensource@tid.es
 #
 
-import copy
 import json
 
+# Fields of the object obtained from the glance server that are kept in raw:
+# the ones used to create the image in other region and to verify or
+# register its content.
+_raw_fields = ('disk_format', 'container_format', 'protected', 'min_ram',
+               'min_disk', 'os_hash_algo', 'os_hash_value', 'locations',
+               'direct_url')
+
+# Values repeated in many images (region, owner, status), shared by all of
+# them. Unlike intern(), it also supports unicode strings.
+_shared_values = dict()
+
+
+def _share(value):
+    """Return the shared copy of value"""
+    if value is None:
+        return None
+    return _shared_values.setdefault(value, value)
+
+
+# Properties whose values usually are different in each region
+_ami_properties = ('kernel_id', 'ramdisk_id')
+
+# The properties of each metadata_set to compare, sorted, without the
+# _ami_properties. Indexed by frozenset(metadata_set).
+_compared_properties = dict()
+
+
+def _metadata_key(metadata_set):
+    """Return the key of metadata_set in the caches of digests: a frozenset,
+    or None if it is empty (i.e. all the properties are compared)"""
+    if type(metadata_set) is frozenset:
+        return metadata_set or None
+    elif not metadata_set:
+        return None
+    else:
+        return frozenset(metadata_set)
+
+
+def _properties_digest(properties, key):
+    """Return a digest of the properties compared by
+    GlanceSyncImage.compare_with_masterregion: the ones in metadata_set (or
+    all if it is empty), excepting the value of kernel_id and ramdisk_id, of
+    which only the presence is relevant.
+
+    The digest is a tuple (hash, values): the hashes of different properties
+    are usually different, so the comparison of two digests is resolved by
+    the first element, excepting when they are equal.
+
+    :param properties: the user_properties of an image
+    :param key: the value returned by _metadata_key(metadata_set)
+    :return: a tuple
+    """
+    if key is not None:
+        names = _compared_properties.get(key, None)
+        if names is None:
+            names = tuple(sorted(prop for prop in key
+                                 if prop not in _ami_properties))
+            _compared_properties[key] = names
+        values = (tuple(map(properties.get, names)),
+                  'kernel_id' in properties, 'ramdisk_id' in properties)
+    else:
+        values = tuple((prop, value) if prop not in _ami_properties
+                       else (prop,)
+                       for (prop, value) in sorted(properties.items()))
+    try:
+        return (hash(values), values)
+    except TypeError:
+        # a value is not hashable (e.g. a list)
+        return (None, values)
+
+
+class _Properties(dict):
+    """The dictionary of user properties of an image. It caches the digests
+    returned by _properties_digest, indexed by the key of metadata_set; the
+    cache is cleared when the dictionary is modified."""
+
+    __slots__ = ('_digests',)
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._digests = None
+
+    def __reduce__(self):
+        """The cache is not pickled nor copied"""
+        return (_Properties, (dict(self),))
+
+    def digest(self, key):
+        """Return the digest of the properties, see _properties_digest"""
+        digests = self._digests
+        if digests is None:
+            digests = self._digests = dict()
+        else:
+            value = digests.get(key, None)
+            if value is not None:
+                return value
+        value = digests[key] = _properties_digest(self, key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._digests = None
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._digests = None
+        dict.__delitem__(self, key)
+
+    def clear(self):
+        self._digests = None
+        dict.clear(self)
+
+    def pop(self, *args):
+        self._digests = None
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._digests = None
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self._digests = None
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        self._digests = None
+        dict.update(self, *args, **kwargs)
+
 
 class GlanceSyncImage(object):
     """This class represent an image within a regional image server.
 
     Its representation is independent of the obtained from the glance server
 
-    The raw field is an opaque object for internal use only. It is the original
-    object obtained from the server and may vary depending of version or the
-    method used to get the object.
+    The raw field is an opaque object for internal use only. It is a
+    dictionary with the fields of the original object obtained from the server
+    needed to upload or register the image (see _raw_fields); they may vary
+    depending of version or the method used to get the object.
+
+    The class uses __slots__, because there are an object for each image of
+    each region.
     """
 
+    __slots__ = ('name', 'id', 'region', 'owner', 'is_public', 'checksum',
+                 'size', 'status', 'user_properties', 'raw')
+
     def __init__(self, name, id, region, owner=None, is_public=True,
                  checksum=None, size=0, status=None, user_properties=None,
                  raw=None):
@@ -46,17 +178,37 @@ class GlanceSyncImage(object):
         user_properties dictionary is cloned."""
         self.name = name
         self.id = id
-        self.region = region
+        self.region = _share(region)
         self.is_public = is_public
         self.checksum = checksum
-        self.raw = raw
+        if raw is not None:
+            self.raw = dict((key, raw[key]) for key in _raw_fields
+                            if key in raw)
+        else:
+            self.raw = None
         self.size = int(size)
-        self.status = status
-        self.owner = owner
+        self.status = _share(status)
+        self.owner = _share(owner)
         if user_properties is not None:
-            self.user_properties = copy.copy(user_properties)
+            self.user_properties = _Properties(user_properties)
         else:
-            self.user_properties = dict()
+            self.user_properties = _Properties()
+
+    def __getstate__(self):
+        """Return the state to pickle the object: a dictionary, like the
+        objects without __slots__ (and the old pickles)"""
+        return dict((key, getattr(self, key)) for key in self.__slots__)
+
+    def __setstate__(self, state):
+        """Restore the state returned by __getstate__"""
+        for key in self.__slots__:
+            value = state.get(key, None)
+            if key in ('region', 'owner', 'status'):
+                value = _share(value)
+            elif key == 'user_properties' and value is not None and \
+                    not isinstance(value, _Properties):
+                value = _Properties(value)
+            setattr(self, key, value)
 
     @staticmethod
     def from_field_list(fieldlist):
@@ -82,6 +234,29 @@ class GlanceSyncImage(object):
         return GlanceSyncImage(name, id, region, owner, public, checksum,
                                size, status, user_properties)
 
+    def to_dict(self):
+        """It returns a dictionary with all the fields of the image, including
+        raw. The dictionary may be serialised as JSON if raw is serialisable.
+        """
+        return {'region': self.region, 'name': self.name, 'id': self.id,
+                'status': self.status, 'size': self.size,
+                'checksum': self.checksum, 'owner': self.owner,
+                'is_public': self.is_public,
+                'user_properties': self.user_properties, 'raw': self.raw}
+
+    @staticmethod
+    def from_dict(values):
+        """Build an object using the dictionary returned by to_dict.
+
+        :param values: a dictionary returned by to_dict
+        :return: a new GlanceSyncImage object
+        """
+        return GlanceSyncImage(
+            values['name'], values['id'], values['region'], values['owner'],
+            values['is_public'], values['checksum'], values['size'],
+            values['status'], values['user_properties'],
+            values.get('raw', None))
+
     def __str__(self):
         """It Returns the string representation of the class"""
 
@@ -158,6 +333,28 @@ class GlanceSyncImage(object):
                 sub.append('')
         return ','.join(sub)
 
+    def fingerprint(self, user_properties):
+        """Return the fingerprint of the state of the image compared by
+        compare_with_masterregion: the checksum, is_public and a digest of
+        the user properties. The digest is cached until the properties are
+        modified (if user_properties has been replaced by a plain dictionary,
+        it is calculated each time).
+
+        :param user_properties: a list with the user properties to compare.
+          If empty or None, all metadata is considered. A frozenset avoids
+          converting it in each invocation.
+        :return: a tuple; two images have the same fingerprint only if
+          compare_with_masterregion considers them synchronised.
+        """
+        key = _metadata_key(user_properties)
+        properties = self.user_properties
+        if type(properties) is _Properties:
+            digest = properties.digest(key)
+        else:
+            # user_properties has been replaced by a plain dictionary
+            digest = _properties_digest(properties, key)
+        return (self.checksum, self.is_public, digest)
+
     def compare_with_masterregion(self, master_region_images, user_properties):
         """
         It compares this image with its homonym on master region and
@@ -176,7 +373,8 @@ class GlanceSyncImage(object):
          images, indexed by name.
         :param user_properties: a list with the user properties to compare;
            other properties are considered local. If empty or None, all
-           metadata is compared.
+           metadata is compared. Pass a frozenset to avoid converting it in
+           each invocation (it is the key of the cached fingerprints).
         :return: It returns an empty string when the image is synchronized.
         In other way:
         +: this image is not on the master glance server
@@ -206,13 +404,32 @@ class GlanceSyncImage(object):
             else:
                 return '_'
 
+        # Fast path: the digests of the properties of both images are cached
+        # (see fingerprint). They are not calculated here: for a single
+        # comparison the property walk is cheaper.
+        digests_local = getattr(self.user_properties, '_digests', None)
+        if digests_local:
+            digests_master = getattr(image_master.user_properties, '_digests',
+                                     None)
+            key = _metadata_key(user_properties)
+            if digests_master and key in digests_local and \
+                    key in digests_master:
+                if digests_master[key] == digests_local[key]:
+                    return ''
+                else:
+                    return '#'
+
+        # the methods are looked up once: user_properties is a subclass of
+        # dict, whose attribute lookup is slower.
+        get_master = image_master.user_properties.get
+        get_local = self.user_properties.get
         if user_properties and len(user_properties) > 0:
             for prop in user_properties:
                 # This is a special case: values usually are different
                 if prop == 'kernel_id' or prop == 'ramdisk_id':
                     continue
-                val_m = image_master.user_properties.get(prop, None)
-                val_l = self.user_properties.get(prop, None)
+                val_m = get_master(prop, None)
+                val_l = get_local(prop, None)
 
                 if val_m != val_l:
                     return '#'
@@ -232,8 +449,8 @@ class GlanceSyncImage(object):
                 # This is a special case: values usually are different
                 if prop == 'kernel_id' or prop == 'ramdisk_id':
                     continue
-                val_m = image_master.user_properties.get(prop, None)
-                val_l = self.user_properties.get(prop, None)
+                val_m = get_master(prop, None)
+                val_l = get_local(prop, None)
 
                 if val_m != val_l:
                     return '#'
@@ -241,11 +458,13 @@ class GlanceSyncImage(object):
         return ''
 
     def is_synchronisable(
-            self, metadata_set, forcesync, metadata_condition=None):
+            self, metadata_set, forcesync, metadata_condition=None,
+            metadata_filter=None):
         """Determines if the image is synchronisable according to this
         algorithm:
            if image.name ends with '_obsolete' it is not synchronisable
            if image id is in forcesync, it is synchronisable
+           if metadata_filter is provided, evaluate it and return the result
            if metadata_condition is provided, evaluate it and return the result
            if image is not public, it is not synchronisable
            if metadata_set is empty, it is synchronisable
@@ -253,6 +472,8 @@ class GlanceSyncImage(object):
         :param metadata_set: list of user properties to consider
         :param forcesync: a list with UUID of images that are always sync.
         :param metadata_condition: expression to evaluate if the image is sync.
+        :param metadata_filter: MetadataFilter object to evaluate if the image
+          is sync.
         :return:
         """
         synchronisable = False
@@ -261,6 +482,8 @@ class GlanceSyncImage(object):
             synchronisable = False
         elif self.id in forcesync:
             synchronisable = True
+        elif metadata_filter:
+            synchronisable = metadata_filter.match(self)
         elif metadata_condition:
             image = self
             globals_dict = dict()
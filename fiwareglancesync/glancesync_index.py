@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+
+import os
+import hashlib
+import sqlite3
+import threading
+from multiprocessing.pool import ThreadPool
+
+from app.settings.settings import logger_cli
+
+"""This internal module contains an index of the files of images_dir, with
+their MD5 digest, to check the content of the master images without reading
+them again.
+
+Users should use the GlanceSync class provided in glancesync instead of this
+module."""
+
+# Number of threads used to compute the digests of the files
+_hash_workers = 4
+
+# Size of the chunks read to compute the digests (bytes)
+_chunk_size = 1024 * 1024
+
+# Seconds to wait for the lock of the database, held by other process
+_lock_timeout = 30
+
+
+class ImagesDirIndex(object):
+    """Index of the files of images_dir (named as the UUID of the master
+    images), with the size, inode, mtime and MD5 of each file.
+
+    The index is saved in a SQLite database and it is updated incrementally:
+    only the files whose size, inode or mtime have changed since they were
+    indexed are read again. The lookups use a copy in memory of the index.
+    """
+
+    def __init__(self, images_dir, db_path, workers=_hash_workers):
+        """Create the index object, loading the saved index if it exists.
+
+        :param images_dir: the directory with the image files
+        :param db_path: the path of the SQLite database
+        :param workers: the number of threads used to compute the digests
+        """
+        self.log = logger_cli
+        self.images_dir = images_dir
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        try:
+            conn = sqlite3.connect(db_path, timeout=_lock_timeout)
+            try:
+                with conn:
+                    conn.execute(
+                        'CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY '
+                        'KEY, size INTEGER, inode INTEGER, mtime REAL, '
+                        'md5 TEXT)')
+                self._files = dict(
+                    (str(row[0]), {'size': row[1], 'inode': row[2],
+                                   'mtime': row[3], 'md5': str(row[4])})
+                    for row in conn.execute('SELECT * FROM files'))
+            finally:
+                conn.close()
+        except sqlite3.Error, e:
+            msg = 'Ignoring the index of images_dir {0}. Cause: {1}'
+            self.log.warning(msg.format(db_path, str(e)))
+            self._files = dict()
+
+    def refresh(self, names=None):
+        """Update the index with the current content of images_dir.
+
+        :param names: the names of the files to update. By default, all the
+          files of images_dir (and the entries of the files that no longer
+          exist are removed).
+        :return: the number of files whose digest was computed
+        """
+        with self._lock:
+            if names is None:
+                names = os.listdir(self.images_dir)
+                removed = set(self._files.keys()) - set(names)
+            else:
+                removed = set()
+            changed = dict()
+            for name in names:
+                try:
+                    st = os.stat(os.path.join(self.images_dir, name))
+                except OSError:
+                    removed.add(name)
+                    continue
+                entry = self._files.get(name, None)
+                if entry is None or entry['size'] != st.st_size or\
+                        entry['inode'] != st.st_ino or\
+                        entry['mtime'] != st.st_mtime:
+                    changed[name] = {'size': st.st_size, 'inode': st.st_ino,
+                                     'mtime': st.st_mtime, 'md5': None}
+
+            if changed:
+                pool = ThreadPool(min(self.workers, len(changed)))
+                try:
+                    digests = pool.map(self._md5, changed.keys(), 1)
+                finally:
+                    pool.close()
+                    pool.join()
+                for (name, digest) in zip(changed.keys(), digests):
+                    if digest is None:
+                        del changed[name]
+                        removed.add(name)
+                    else:
+                        changed[name]['md5'] = digest
+
+            removed = set(name for name in removed if name in self._files)
+            if changed or removed:
+                self._save(changed, removed)
+            for name in removed:
+                del self._files[name]
+            self._files.update(changed)
+            return len(changed)
+
+    def get(self, name):
+        """Return the entry of a file, or None if it is not indexed.
+
+        :param name: the name of the file (the UUID of the image)
+        :return: a dictionary with size, inode, mtime and md5
+        """
+        return self._files.get(name, None)
+
+    def check(self, image):
+        """Check that the file of a master image is in the index and it
+        matches the size and checksum of the image. The file is not read:
+        call refresh before.
+
+        :param image: the master GlanceSyncImage object
+        :return: None if the file is fine, or a string with the problem.
+        """
+        entry = self._files.get(image.id, None)
+        if entry is None:
+            return 'the file does not exist'
+        if image.size and int(image.size) != entry['size']:
+            msg = 'the size of the file is {0}, expected {1}'
+            return msg.format(entry['size'], image.size)
+        if image.checksum and image.checksum != entry['md5']:
+            msg = 'the MD5 of the file is {0}, expected {1}'
+            return msg.format(entry['md5'], image.checksum)
+        return None
+
+    def _md5(self, name):
+        """Return the MD5 of a file, or None if it can not be read"""
+        digest = hashlib.md5()
+        try:
+            with open(os.path.join(self.images_dir, name), 'rb') as f:
+                while True:
+                    chunk = f.read(_chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+        except IOError, e:
+            msg = 'Cannot index the image file {0}. Cause: {1}'
+            self.log.warning(msg.format(name, str(e)))
+            return None
+        return digest.hexdigest()
+
+    def _save(self, changed, removed):
+        """Write the changed entries and delete the removed ones. The errors
+        are only logged: the entries are still updated in memory and the
+        files are read again by the next process."""
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=_lock_timeout)
+            try:
+                with conn:
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                        list((name, e['size'], e['inode'], e['mtime'],
+                              e['md5']) for (name, e) in changed.items()))
+                    conn.executemany('DELETE FROM files WHERE name = ?',
+                                     list((name,) for name in removed))
+            finally:
+                conn.close()
+        except sqlite3.Error, e:
+            msg = 'Cannot save the index of images_dir {0}. Cause: {1}'
+            self.log.warning(msg.format(self.db_path, str(e)))
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+import json
+
+from glancesync_image import GlanceSyncImage
+
+"""This module contains the SyncPlan class, the set of operations needed to
+synchronise a region. Plans are obtained with GlanceSync.plan_region and
+executed with GlanceSync.execute_plan.
+"""
+
+# Version of the format of the serialised plans
+_plan_version = 1
+
+# Status of the operations that upload an image
+upload_status = ('pending_upload', 'pending_replace', 'pending_rename')
+
+# Order of execution of each kind of operation. The obsolete images are
+# updated first, then the metadata; pending_ami images are updated at the end,
+# when their kernel and ramdisk are already uploaded. error_file is the status
+# of the uploads whose file in images_dir is missing or corrupt; pending_adopt
+# the status of the uploads replaced by renaming an image of the region with
+# the same checksum.
+_phases = {'obsolete': 0, 'pending_metadata': 1, 'pending_upload': 2,
+           'pending_replace': 2, 'pending_rename': 2, 'error_checksum': 2,
+           'error_ami': 2, 'error_file': 2, 'pending_ami': 3,
+           'pending_adopt': 3}
+
+
+class SyncPlan(object):
+    """The operations needed to synchronise a region, with all the image data
+    required to execute them without listing again the glance servers.
+
+    Each operation is a tuple (status, master_image), as returned by
+    GlanceSyncRegion.image_list_to_sync, excepting the images that are
+    already synchronised. The operations are kept in execution order; the
+    uploads are sorted by size.
+    """
+
+    def __init__(self, region, tuples, region_images, obsolete=None):
+        """Create a new plan.
+
+        :param region: the full name of the region (target:region)
+        :param tuples: the list of tuples (status, master_image) returned by
+          image_list_to_sync
+        :param region_images: a dictionary with the images of the region that
+          are synchronisable, indexed by name.
+        :param obsolete: a list with the images of the region to mark as
+          obsolete (already updated with the new metadata)
+        """
+        self.region = region
+        tuples = list(t for t in tuples if t[0] in _phases)
+        tuples.sort(key=lambda t: _phases[t[0]])
+        self.tuples = tuples
+        self.region_images = region_images
+        if obsolete is None:
+            self.obsolete = list()
+        else:
+            self.obsolete = obsolete
+
+    def total_bytes(self):
+        """Return the number of bytes to upload to the region"""
+        return sum(int(t[1].size) for t in self.tuples
+                   if t[0] in upload_status)
+
+    def is_synchronised(self):
+        """Return true if there is nothing to upload or update"""
+        return not self.obsolete and not any(
+            t[0] in ('pending_metadata', 'pending_adopt') or
+            t[0] in upload_status for t in self.tuples)
+
+    def dependencies(self, image):
+        """Return the names of the images that must be uploaded before
+        uploading or updating the image, i.e. its kernel and ramdisk when
+        they are uploaded in this plan too.
+
+        :param image: a master image included in the plan
+        :return: a list with the names of the images
+        """
+        uploads = set(t[1].name for t in self.tuples if t[0] in upload_status)
+        depends = list()
+        for prop in ('kernel_id', 'ramdisk_id'):
+            name = image.user_properties.get(prop, None)
+            if name in uploads and name != image.name:
+                depends.append(name)
+        return depends
+
+    def operations(self):
+        """Return the operations of the plan, in execution order. Each
+        operation is a dictionary with the status, the name of the image,
+        the bytes to upload and the names of the images it depends on.
+
+        :return: a list of dictionaries
+        """
+        operations = list()
+        for image in self.obsolete:
+            operations.append({'status': 'obsolete', 'image': image.name,
+                               'size': 0, 'depends_on': []})
+        for (status, image) in self.tuples:
+            if status in upload_status:
+                size = int(image.size)
+            else:
+                size = 0
+            if status in upload_status or status == 'pending_ami':
+                depends = self.dependencies(image)
+            else:
+                depends = []
+            operations.append({'status': status, 'image': image.name,
+                               'size': size, 'depends_on': depends})
+        return operations
+
+    def to_dict(self):
+        """Return the plan as a dictionary that can be serialised as JSON"""
+        master_images = dict()
+        for (status, image) in self.tuples:
+            master_images[image.name] = image.to_dict()
+        return {
+            'region': self.region,
+            'total_bytes': self.total_bytes(),
+            'operations': self.operations(),
+            'master_images': master_images.values(),
+            'region_images': list(image.to_dict()
+                                  for image in self.region_images.values()),
+            'obsolete_images': list(image.to_dict()
+                                    for image in self.obsolete)}
+
+    @staticmethod
+    def from_dict(values):
+        """Build a plan using the dictionary returned by to_dict.
+
+        :param values: a dictionary returned by to_dict
+        :return: a new SyncPlan object
+        """
+        master_images = dict()
+        for image_dict in values['master_images']:
+            image = GlanceSyncImage.from_dict(image_dict)
+            master_images[image.name] = image
+        tuples = list((op['status'], master_images[op['image']])
+                      for op in values['operations']
+                      if op['status'] != 'obsolete')
+        region_images = dict()
+        for image_dict in values['region_images']:
+            image = GlanceSyncImage.from_dict(image_dict)
+            region_images[image.name] = image
+        obsolete = list(GlanceSyncImage.from_dict(image_dict)
+                        for image_dict in values['obsolete_images'])
+        return SyncPlan(values['region'], tuples, region_images, obsolete)
+
+
+def dump_plans(plans, stream):
+    """Write a list of plans as JSON.
+
+    :param plans: a list of SyncPlan objects
+    :param stream: Stream object (e.g. a file) where the data is written
+    :return: Nothing
+    """
+    values = {'version': _plan_version,
+              'total_bytes': sum(plan.total_bytes() for plan in plans),
+              'plans': list(plan.to_dict() for plan in plans)}
+    json.dump(values, stream, indent=2, sort_keys=True)
+
+
+def load_plans(stream):
+    """Read a list of plans written with dump_plans.
+
+    :param stream: Stream object (e.g. a file) where the data is read
+    :return: a list of SyncPlan objects
+    """
+    values = _encode(json.load(stream))
+    if values.get('version', None) != _plan_version:
+        msg = 'Unsupported version of the plan file: {0}'
+        raise Exception(msg.format(values.get('version', None)))
+    return list(SyncPlan.from_dict(plan) for plan in values['plans'])
+
+
+def _encode(value):
+    """Convert recursively the unicode strings returned by json to UTF-8
+    strings, like the values obtained from the glance servers.
+
+    :param value: a value returned by json.load
+    :return: the same value with str objects instead of unicode objects
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    elif isinstance(value, list):
+        return list(_encode(v) for v in value)
+    elif isinstance(value, dict):
+        return dict((_encode(k), _encode(v)) for (k, v) in value.items())
+    else:
+        return value
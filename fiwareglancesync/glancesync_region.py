@@ -55,6 +55,7 @@ class GlanceSyncRegion(object):
         parts = fullname.split(':')
         if len(parts) == 2:
             self.region = parts[1]
+            self.target_name = parts[0]
             self.target = targets[parts[0]]
             if parts[0] == 'master':
                 # normalization, omit master: preffix
@@ -62,22 +63,41 @@ class GlanceSyncRegion(object):
             else:
                 self.fullname = fullname
         else:
+            self.target_name = 'master'
             self.target = targets['master']
             self.fullname = self.region = fullname
 
-    def images_to_sync_dict(self, images_master_region):
+    def images_to_sync_dict(self, images_master_region, index=None):
         """
         Returns a dictionary of images to be synchronised to this region,
         that is, take the master region dictionary and filter it according the
         target criteria.
         :param images_master_region: a dict with the images on master region
+        :param index: optional PropertyIndex of images_master_region. If the
+          target has a metadata_filter, it is evaluated with the index.
         :return: a dictionary of images indexed by name
         """
         t = self.target
+        metadata_filter = t.get('metadata_filter', None)
+        if metadata_filter and index is not None:
+            # the same rules than GlanceSyncImage.is_synchronisable
+            filtered_master_dict = dict(
+                (name, images_master_region[name])
+                for name in metadata_filter.select(index)
+                if not name.endswith('_obsolete'))
+            if t['forcesyncs']:
+                filtered_master_dict.update(
+                    (image.name, image)
+                    for image in images_master_region.values()
+                    if image.id in t['forcesyncs'] and
+                    not image.name.endswith('_obsolete'))
+            return filtered_master_dict
+
         filtered_master_dict = dict(
             (image.name, image) for image in images_master_region.values()
             if image.is_synchronisable(t['metadata_set'], t['forcesyncs'],
-                                       t.get('metadata_condition', None)))
+                                       t.get('metadata_condition', None),
+                                       metadata_filter))
         return filtered_master_dict
 
     def local_images_filtered(self, filtered_master_dict, images_region):
@@ -129,7 +149,8 @@ class GlanceSyncRegion(object):
             filtered_images_region[image.name] = image
         return filtered_images_region
 
-    def image_list_to_sync(self, images_master_region, images_region):
+    def image_list_to_sync(self, images_master_region, images_region,
+                           filtered_master_dict=None):
         """
         Returns a list of images to be synchronised to this region with its
         synchronisation status. The list is a tuple of two values:
@@ -153,13 +174,17 @@ class GlanceSyncRegion(object):
 
         :param images_master_region: a dict with the images on master region
         :param images_region: a list with the images on the region
+        :param filtered_master_dict: the result of images_to_sync_dict, if it
+          is already known.
         :return: a list of tuples (state, image).
         """
 
         # First, filter the master images: discard images that don't have to
         # be synchronised to this target.
         t = self.target
-        filtered_master_dict = self.images_to_sync_dict(images_master_region)
+        if filtered_master_dict is None:
+            filtered_master_dict = self.images_to_sync_dict(
+                images_master_region)
 
         # Now, filter the region images: the only interesting images are the
         # ones whose name is the same that a master image to be synchronised.
@@ -172,11 +197,23 @@ class GlanceSyncRegion(object):
         images_master = filtered_master_dict.values()
         images_pending_upload = set()
         images_master.sort(key=lambda image: int(image.size))
+        # a frozenset is the key of the fingerprints cached in the images
+        metadata_set = frozenset(self.target['metadata_set'] or ())
         for image in images_master:
             if image.name in filtered_images_region:
                 image_region = filtered_images_region[image.name]
-                s = image_region.compare_with_masterregion(
-                    filtered_master_dict, self.target['metadata_set'])
+                # Usually the images are synchronised: it is enough to compare
+                # their fingerprints, that are cached in the images (the
+                # master ones are computed once for all the regions of the
+                # target). Otherwise, compare_with_masterregion determines the
+                # difference.
+                if image_region.status == 'active' and \
+                        image_region.fingerprint(metadata_set) == \
+                        image.fingerprint(metadata_set):
+                    s = ''
+                else:
+                    s = image_region.compare_with_masterregion(
+                        filtered_master_dict, metadata_set)
                 if s == '':
                     # All apparently is OK, but check kernel_id and ramdisk_id
                     master_image = images_master_region[image_region.name]
@@ -242,6 +279,43 @@ class GlanceSyncRegion(object):
                 images_pending_upload.add(image.name)
         return images_list
 
+    def images_to_adopt(self, images_master_region, images_region, tuples):
+        """
+        Returns the images of the region that already have the content of a
+        master image pending to upload, but with other name (e.g. an image
+        renamed after uploading it). They are found using an index of the
+        region images by checksum. Only the active images owned by the tenant
+        whose name is not used by any master image are considered, and each
+        one is adopted at most once.
+
+        :param images_master_region: a dict with the images on master region
+        :param images_region: a list with the images on the region
+        :param tuples: the list of tuples (state, image) returned by
+          image_list_to_sync
+        :return: a dictionary with the region images to adopt, indexed by the
+          name of the master image.
+        """
+        names = set(images_master_region.keys())
+        names.update(name[:-9] for name in images_master_region
+                     if name.endswith('_obsolete'))
+        tenant_id = self.target['tenant_id'].zfill(32)
+        by_checksum = dict()
+        for image in sorted(images_region, key=lambda image: image.name):
+            if image.name in names or image.status != 'active' or\
+                    not image.checksum or not image.owner or\
+                    image.owner.zfill(32) != tenant_id:
+                continue
+            by_checksum.setdefault(image.checksum, list()).append(image)
+
+        adopted = dict()
+        for (status, image) in tuples:
+            if status != 'pending_upload' or not image.checksum:
+                continue
+            candidates = by_checksum.get(image.checksum, None)
+            if candidates:
+                adopted[image.name] = candidates.pop(0)
+        return adopted
+
     def _sync_obsolete_props(self, image_master, image, obsolete_syncprops):
         """Update the properties specified in obsolete_syncprops in image
         with the values of image_master. Also is_public is updated.
@@ -309,7 +383,8 @@ class GlanceSyncRegion(object):
                 t = self.target
                 img = images_master_region[image.name[0:-9]]
                 if img.is_synchronisable(t['metadata_set'], t['forcesyncs'],
-                                         t.get('metadata_condition', None)):
+                                         t.get('metadata_condition', None),
+                                         t.get('metadata_filter', None)):
                     m = 'Ignore obsolete master image {0} because {1} exists '\
                         'and it is synchronisable.'
                     self.log.warning(m.format(image.name, img.name))
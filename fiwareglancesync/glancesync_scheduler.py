@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+import threading
+import time
+
+from app.settings.settings import logger_cli
+
+"""This internal module contains the scheduler used to upload the images of
+several regions at the same time, sharing a bandwidth budget.
+
+Users should use the GlanceSync class provided in glancesync instead of this
+module."""
+
+
+class TokenBucket(object):
+    """Limit the rate of the bytes transferred by several threads.
+
+    Each thread invokes consume before sending a chunk of data. When the
+    budget is exceeded, consume sleeps the time needed to send the chunk
+    at the configured rate.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.time,
+                 sleep=time.sleep):
+        """Create a token bucket.
+
+        :param rate: the maximum rate, in bytes by second. Zero means no
+          limit.
+        :param capacity: the maximum burst, in bytes. By default, a second of
+          transfer.
+        :param clock: function returning the current time in seconds
+        :param sleep: function to sleep the specified seconds
+        """
+        self.rate = float(rate)
+        if capacity is None:
+            capacity = self.rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        """Take amount bytes of the budget, sleeping if it is exhausted.
+
+        :param amount: the number of bytes to transfer
+        :return: Nothing
+        """
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self._last) * self.rate)
+            self._last = now
+            # the tokens may be negative: it is a debt that the next consumers
+            # must wait for too.
+            self.tokens -= amount
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            self._sleep(wait)
+
+
+class UploadJob(object):
+    """An upload pending to be scheduled"""
+
+    def __init__(self, region, name, size, function, depends_on=None,
+                 after=None):
+        """Create a new job.
+
+        :param region: the region where the image is uploaded
+        :param name: the name of the image
+        :param size: the size of the image, in bytes
+        :param function: the function that does the upload. It receives the
+          TokenBucket to use as parameter.
+        :param depends_on: the names of the images of the same region that
+          must be uploaded before this one.
+        :param after: a list of (region, name) of jobs of other regions that
+          must be finished (successfully or not) before starting this one.
+          Unlike depends_on, jobs not added to the scheduler are ignored.
+        """
+        self.region = region
+        self.name = name
+        self.size = int(size)
+        self.function = function
+        if depends_on is None:
+            self.depends_on = list()
+        else:
+            self.depends_on = depends_on
+        if after is None:
+            self.after = list()
+        else:
+            self.after = after
+
+
+class UploadScheduler(object):
+    """Run the pending uploads of several regions, with a global bandwidth
+    budget, a global limit of simultaneous uploads and a limit by region.
+
+    The next upload is chosen among the ones that can be started according
+    to a policy:
+    *smallest: the smallest image first.
+    *priority: the regions in preferable_order first, then the smallest image.
+    *completion: the region with less bytes pending first (i.e. the region
+     whose estimated time to complete is shorter), then the smallest image.
+
+    An upload is not started until the images it depends on are uploaded
+    and the uploads of other regions it must go after are finished (e.g. the
+    upload to the region used as source of the image).
+    When an upload fails, the pending uploads of the region are discarded.
+    """
+
+    def __init__(self, bandwidth_mb=0, max_uploads=1, policy='smallest',
+                 preferable_order=None):
+        """Create the scheduler.
+
+        :param bandwidth_mb: the budget for all the uploads, in MB/s. Zero
+          means no limit.
+        :param max_uploads: the maximum number of simultaneous uploads.
+        :param policy: smallest, priority or completion.
+        :param preferable_order: the order of the regions with the policy
+          priority.
+        """
+        self.log = logger_cli
+        self.bucket = TokenBucket(bandwidth_mb * 1024 * 1024)
+        self.max_uploads = max(1, max_uploads)
+        self.policy = policy
+        if preferable_order is None:
+            self.preferable_order = list()
+        else:
+            self.preferable_order = preferable_order
+        self.region_workers = dict()
+        self.jobs = list()
+
+    def add_region(self, region, workers=1):
+        """Set the maximum number of simultaneous uploads to a region.
+
+        :param region: the region name
+        :param workers: the maximum number of simultaneous uploads
+        :return: Nothing
+        """
+        self.region_workers[region] = max(1, workers)
+
+    def add(self, region, name, size, function, depends_on=None,
+            after=None):
+        """Add a pending upload. See UploadJob for the parameters."""
+        self.jobs.append(UploadJob(region, name, size, function, depends_on,
+                                   after))
+
+    def run(self):
+        """Run all the pending uploads and wait until they are finished.
+
+        :return: a list with the regions where some upload failed.
+        """
+        pending = self.jobs
+        self.jobs = list()
+        running = dict()
+        finished = set()
+        failed = list()
+        cond = threading.Condition()
+
+        def run_job(job):
+            try:
+                job.function(self.bucket)
+                error = False
+            except Exception, e:
+                msg = '{0}: Upload of {1} failed. Cause: {2}'
+                self.log.error(msg.format(job.region, job.name, str(e)))
+                error = True
+            with cond:
+                running[job.region].remove(job)
+                if error:
+                    if job.region not in failed:
+                        failed.append(job.region)
+                else:
+                    finished.add((job.region, job.name))
+                cond.notify()
+
+        with cond:
+            while True:
+                pending = list(job for job in pending
+                               if job.region not in failed)
+                in_flight = sum(len(jobs) for jobs in running.values())
+                active = set((job.region, job.name) for job in
+                             pending + sum(running.values(), list()))
+                eligible = list(
+                    job for job in pending
+                    if len(running.get(job.region, [])) <
+                    self.region_workers.get(job.region, 1) and
+                    all((job.region, name) in finished
+                        for name in job.depends_on) and
+                    not any(key in active for key in job.after))
+                if eligible and in_flight < self.max_uploads:
+                    job = self._select(eligible, pending, running)
+                    pending.remove(job)
+                    running.setdefault(job.region, list()).append(job)
+                    thread = threading.Thread(target=run_job, args=(job,))
+                    thread.daemon = True
+                    thread.start()
+                elif in_flight == 0:
+                    break
+                else:
+                    cond.wait()
+
+        # Uploads that never could be started (a dependency was not added)
+        for job in pending:
+            msg = '{0}: Upload of {1} failed. Cause: missing dependencies'
+            self.log.error(msg.format(job.region, job.name))
+            if job.region not in failed:
+                failed.append(job.region)
+        return failed
+
+    def _select(self, eligible, pending, running):
+        """Choose the next upload according to the policy. In a tie, the
+        first upload added is chosen.
+
+        :param eligible: the list of jobs that can be started
+        :param pending: the list of all the jobs not started
+        :param running: a dictionary with the list of running jobs by region
+        :return: the job to start
+        """
+        if self.policy == 'priority':
+            order = self.preferable_order
+
+            def key(job):
+                if job.region in order:
+                    return (order.index(job.region), job.size)
+                else:
+                    return (len(order), job.size)
+        elif self.policy == 'completion':
+            remaining = dict()
+            for job in pending + sum(running.values(), list()):
+                remaining[job.region] = remaining.get(job.region, 0) + job.size
+
+            def key(job):
+                return (remaining[job.region], job.size)
+        else:
+            def key(job):
+                return job.size
+        return min(eligible, key=key)
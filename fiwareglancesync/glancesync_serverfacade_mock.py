@@ -26,11 +26,15 @@
 import csv
 import glob
 import shelve
+import StringIO
 import copy
+import hashlib
 import os
 import argparse
 import tempfile
 import sys
+import threading
+import urllib2
 
 from glancesync_image import GlanceSyncImage
 
@@ -53,6 +57,10 @@ class ServersFacade(object):
     # when use_persistence is true, image information is preserved in disk.
     use_persistence = False
     dir_persist = './.glancesync_persist'
+    # uploads may be done concurrently (see upload_workers)
+    lock = threading.Lock()
+    # get_imagelist_fingerprint detects the changes of the image list
+    has_imagelist_fingerprint = True
 
     def __init__(self, target):
         self.target = target
@@ -78,15 +86,33 @@ class ServersFacade(object):
                 regions_list.append(parts[1])
         return regions_list
 
-    def get_imagelist(self, regionobj):
+    def get_imagelist(self, regionobj, filters=None):
         """return a image list from the glance of the specified region
 
         :param regionobj: The GlanceSyncRegion object of the region to list
+        :param filters: optional dictionary with hints (owner, status, names).
+          They are applied only when the target uses the version 2 of the
+          glance API, emulating the server-side filtering of ServersFacadeV2.
         :return: a list of GlanceSyncImage objects
         """
+        images = ServersFacade.images[regionobj.fullname].values()
+        if filters and regionobj.target.get('glance_api_version', 1) == 2:
+            images = list(image for image in images
+                          if _match_filters(image, filters))
         # clone the object: otherwise modifying the returned object
         # modify the object in the images.
-        return copy.deepcopy(ServersFacade.images[regionobj.fullname].values())
+        return copy.deepcopy(images)
+
+    def get_imagelist_fingerprint(self, regionobj):
+        """return a value that changes when the images of the region change.
+        The real facade uses a cheap query instead of the full list.
+
+        :param regionobj: The GlanceSyncRegion object of the region
+        :return: a string
+        """
+        images = ServersFacade.images.get(regionobj.fullname, dict())
+        content = ''.join(sorted(str(image) for image in images.values()))
+        return hashlib.md5(content).hexdigest()
 
     def update_metadata(self, regionobj, image):
         """ update the metadata of the image in the specified region
@@ -106,33 +132,82 @@ class ServersFacade(object):
             images[image.id] = updatedimage
             images.sync()
 
-    def upload_image(self, regionobj, image):
+    def upload_image(self, regionobj, image, data=None):
         """Upload the image to the glance server on the specified region.
 
         :param regionobj: GlanceSyncRegion object; the region where the image
           will be upload.
         :param image: GlanceSyncImage object; the image to be uploaded.
+        :param data: optional file-like object with the content of the image.
+          It is read until the end, but the content is discarded.
         :return: The UUID of the new image.
         """
-        count = 1
-        if regionobj.fullname not in ServersFacade.images:
-            ServersFacade.images[regionobj.fullname] = dict()
-        imageid = '1$' + image.name
-        while imageid in ServersFacade.images[regionobj.fullname]:
-            count += 1
-            imageid = str(count) + '$' + image.name
-        owner = regionobj.target['tenant'] + 'id'
-        new_image = GlanceSyncImage(
-            image.name, imageid, regionobj.fullname, owner, image.is_public,
-            image.checksum, image.size, image.status,
-            dict(image.user_properties))
-
-        ServersFacade.images[regionobj.fullname][imageid] = new_image
-        if ServersFacade.use_persistence:
-            ServersFacade.images[regionobj.fullname].sync()
+        if data is not None:
+            while data.read(65536):
+                pass
+        with ServersFacade.lock:
+            count = 1
+            if regionobj.fullname not in ServersFacade.images:
+                ServersFacade.images[regionobj.fullname] = dict()
+            imageid = '1$' + image.name
+            while imageid in ServersFacade.images[regionobj.fullname]:
+                count += 1
+                imageid = str(count) + '$' + image.name
+            owner = regionobj.target['tenant'] + 'id'
+            new_image = GlanceSyncImage(
+                image.name, imageid, regionobj.fullname, owner,
+                image.is_public, image.checksum, image.size, image.status,
+                dict(image.user_properties))
+
+            ServersFacade.images[regionobj.fullname][imageid] = new_image
+            if ServersFacade.use_persistence:
+                ServersFacade.images[regionobj.fullname].sync()
 
         return imageid
 
+    def copy_image(self, regionobj, image, url, timeout=3600):
+        """Create the image in the specified region, downloading its content
+        from url as the glance server does.
+
+        :param regionobj: GlanceSyncRegion object; the region where the image
+          will be created.
+        :param image: GlanceSyncImage object; the image to be created.
+        :param url: the URL where the image is downloaded from.
+        :param timeout: the maximum seconds to wait for the download.
+        :return: The UUID of the new image.
+        """
+        response = urllib2.urlopen(url, timeout=timeout)
+        try:
+            return self.upload_image(regionobj, image, response)
+        finally:
+            response.close()
+
+    def register_location(self, regionobj, image, url):
+        """Create the image in the specified region, using the content in a
+        shared store. No data is read.
+
+        :param regionobj: GlanceSyncRegion object; the region where the image
+          will be created.
+        :param image: GlanceSyncImage object; the image to be created.
+        :param url: the location of the image in the store.
+        :return: The UUID of the new image.
+        """
+        return self.upload_image(regionobj, image)
+
+    def download_image(self, regionobj, id):
+        """Return the content of an image of the region. The mock images have
+        no content: the checksum is returned instead.
+
+        :param regionobj: GlanceSyncRegion object; the region of the image.
+        :param id: the UUID of the image.
+        :return: a file-like object with the content of the image.
+        """
+        images = ServersFacade.images.get(regionobj.fullname, dict())
+        if id not in images:
+            raise Exception(regionobj.fullname + ': image ' + id +
+                            ' not found')
+        return StringIO.StringIO(images[id].checksum or '')
+
     def delete_image(self, regionobj, id, confirm=True):
         """delete a image on the specified region.
 
@@ -258,6 +333,19 @@ class ServersFacade(object):
             if ServersFacade.use_persistence:
                 ServersFacade.images[region_name].sync()
 
+
+def _match_filters(image, filters):
+    """Return true if the image satisfies the filters, with the semantic of the
+    glance API v2 (e.g. an image without owner does not match any owner)"""
+    if 'owner' in filters and image.owner != filters['owner']:
+        return False
+    if 'status' in filters and image.status != filters['status']:
+        return False
+    if 'names' in filters and image.name not in filters['names']:
+        return False
+    return True
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description='Start a clean persistent session'
@@ -24,10 +24,17 @@
 #
 
 from app.settings.settings import logger_cli
+import atexit
+import hashlib
+import os
+import threading
+import time
 from utils.osclients import OpenStackClients
-from multiprocessing import Pool, TimeoutError
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 
 from glancesync_image import GlanceSyncImage
+from glancesync_streams import IterableReader, ChecksumReader, ChecksumError
 
 """This module contains all the code that interacts directly with the glance
 implementation. It isolates the main code from the glance interaction.
@@ -42,8 +49,91 @@ Formerly, it used to interact using a CLI wrapper.
 # Default timeout to get image list (seconds)
 _default_timeout = 30
 
+# Seconds between the queries of the status of an image copied with copy_image
+_copy_poll_interval = 5
+
+# With the API v1, the listings with changes-since include the deleted images
+_changes_since_epoch = '1970-01-01T00:00:00'
+
+# Number of threads of the pool shared by all the facades to get image lists.
+# It must be enough for the plans evaluated at the same time (8, see
+# glancesync._max_concurrent_plans), each one with a fingerprint and a listing.
+_list_workers = 16
+
+# Socket timeout of the glance clients used to get image lists, relative to
+# list_images_timeout: a request blocked in a hung server fails and releases
+# its thread of the pool, although the caller has already given up.
+_list_socket_timeout_factor = 2
+
+# Page size and maximum number of names by request used with the API v2
+_v2_page_size = 200
+_v2_names_by_request = 50
+
+# Attributes of the images in the API v2 that are not user properties.
+# kernel_id and ramdisk_id are part of the schema too, but they are managed as
+# user properties, as in the API v1.
+_v2_schema_fields = frozenset([
+    'id', 'name', 'status', 'visibility', 'protected', 'checksum', 'owner',
+    'size', 'virtual_size', 'min_ram', 'min_disk', 'disk_format',
+    'container_format', 'created_at', 'updated_at', 'tags', 'file', 'self',
+    'schema', 'direct_url', 'locations', 'os_hash_algo', 'os_hash_value',
+    'os_hidden'])
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Return the pool of threads used to implement the timeout of
+    get_imagelist. The pool is created only once by process (the threads of
+    the parent are not available after a fork).
+
+    :return: a ThreadPool object
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPool(_list_workers)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _call_with_timeout(function, args, timeout):
+    """Run a function in the shared pool of threads and return its result.
+    The timeout starts when the function starts running: the time waiting
+    for a free thread of the pool is not counted.
+
+    :param function: the function to run
+    :param args: a tuple with the arguments of the function
+    :param timeout: the maximum seconds the function may run
+    :return: the value returned by the function. TimeoutError is raised if
+      it is not finished in time.
+    """
+    started = threading.Event()
+
+    def job(*args):
+        started.set()
+        return function(*args)
+
+    result = _get_pool().apply_async(job, args)
+    while not result.ready() and not started.wait(1):
+        pass
+    return result.get(timeout=timeout)
+
+
+@atexit.register
+def _close_pool():
+    """Stop the threads of the pool before the interpreter shutdown. Threads
+    blocked in a request are not waited for."""
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.terminate()
+
 
 class ServersFacade(object):
+    # get_imagelist_fingerprint detects the changes of the image list
+    has_imagelist_fingerprint = True
+
     def __init__(self, target):
         """Create a new Facade for the specified target (a target is shared
         between regions using the same credential)"""
@@ -62,10 +152,24 @@ class ServersFacade(object):
         self.images_dir = '/var/lib/glance/images'
         self.logger = logger_cli
 
-    def _get_glanceclient(self, region):
-        """helper method, to get a glanceclient for the region"""
-        self.osclients.set_region(region)
-        return self.osclients.get_glanceclient()
+    def _get_glanceclient(self, region, timeout=None):
+        """helper method, to get a glanceclient for the region. The region is
+        passed explicitly because the facade may be used by several threads.
+
+        :param region: the region of the client
+        :param timeout: if not None, the socket timeout of the client.
+        """
+        if timeout is None:
+            return self.osclients.get_glanceclient(region)
+        return self.osclients.get_glanceclient(region, timeout=timeout)
+
+    def _get_list_glanceclient(self, regionobj):
+        """helper method, to get the glanceclient used to list the images of
+        the region, with a socket timeout derived from list_images_timeout
+        """
+        timeout = regionobj.target.get('list_images_timeout', _default_timeout)
+        return self._get_glanceclient(
+            regionobj.region, timeout * _list_socket_timeout_factor)
 
     def get_regions(self):
         """It returns the list of regions on the specified target.
@@ -73,24 +177,26 @@ class ServersFacade(object):
         """
         return self.osclients.get_regions('image')
 
-    def get_imagelist(self, regionobj):
+    def get_imagelist(self, regionobj, filters=None):
         """return a image list from the glance of the specified region
 
         :param regionobj: The GlanceSyncRegion object of the region to list
+        :param filters: optional dictionary with hints to avoid listing
+          images that the caller is going to discard. See ServersFacadeV2;
+          this implementation (glance API v1) ignores them.
         :return: a list of GlanceSyncImage objects
         """
-        client = self._get_glanceclient(regionobj.region)
+        client = self._get_list_glanceclient(regionobj)
         try:
             target = regionobj.target
-            # We need a Pool to implement a timeout. Unfortunately
-            # setting client.images.client.timeout does nothing.
+            # We need a pool of threads to implement a timeout: the socket
+            # timeout of the client does not limit the whole listing.
+            # The pool is shared, to avoid creating threads in each call.
             if 'list_images_timeout' in target:
                 timeout = target['list_images_timeout']
             else:
                 timeout = _default_timeout
-            pool = Pool(1)
-            result = pool.apply_async(_getrawimagelist, (client,))
-            images = result.get(timeout=timeout)
+            images = _call_with_timeout(_getrawimagelist, (client,), timeout)
             image_list = list()
             for image in images:
                 i = GlanceSyncImage(
@@ -116,6 +222,38 @@ class ServersFacade(object):
 
         return image_list
 
+    def get_imagelist_fingerprint(self, regionobj):
+        """return a value that changes when an image of the region is created,
+        updated or deleted. It is much cheaper than get_imagelist, because
+        only the last updated image is requested; the deleted images are
+        included in the query (changes-since), so a deletion makes the
+        deleted image the last updated one.
+
+        :param regionobj: The GlanceSyncRegion object of the region
+        :return: a tuple with the id and the updated_at of the last updated
+          image, or an empty tuple if there are no images. None means that the
+          facade does not support the fingerprint (see ServersFacadeV2).
+        """
+        client = self._get_list_glanceclient(regionobj)
+        timeout = regionobj.target.get('list_images_timeout', _default_timeout)
+        try:
+            return _call_with_timeout(self._fingerprint, (client,), timeout)
+        except TimeoutError:
+            msg = regionobj.fullname + \
+                ': Timeout while retrieving the last updated image.'
+            self.logger.error(msg)
+            raise GlanceFacadeException(msg)
+        except Exception, e:
+            msg = regionobj.fullname + \
+                ': Error retrieving the last updated image. Cause: ' + str(e)
+            self.logger.error(msg)
+            raise GlanceFacadeException(msg)
+
+    def _fingerprint(self, client):
+        """helper method, invoked in the pool of threads, that returns the
+        fingerprint of the image list (see get_imagelist_fingerprint)"""
+        return _getlastupdated(client)
+
     def update_metadata(self, regionobj, image):
         """ update the metadata of the image in the specified region
         See GlanceSync.update_metadata_image for more details.
@@ -142,37 +280,199 @@ class ServersFacade(object):
             self.logger.error(msg)
             raise GlanceFacadeException(msg)
 
-    def upload_image(self, regionobj, image):
+    def upload_image(self, regionobj, image, data=None):
         """Upload the image to the glance server on the specified region.
 
         :param regionobj: GlanceSyncRegion object; the region where the image
           will be upload.
         :param image: GlanceSyncImage object; the image to be uploaded.
+        :param data: optional file-like object with the content of the image.
+          By default, the file named as the image UUID in images_dir is read.
         :return: The UUID of the new image.
+
+        When the checksum of the image is known, the content is verified
+        while it is uploaded (see ChecksumReader): the upload is aborted and
+        GlanceFacadeChecksumException is raised if it does not match.
         """
         client = self._get_glanceclient(regionobj.region)
+        if data is not None:
+            # the size can not be obtained from a stream
+            return self._upload_verified(client, regionobj, image, data)
         try:
-            with open(self.images_dir + '/' + image.id, 'r') as file_obj:
-                try:
-                    new_image = client.images.create(
-                        container_format=image.raw['container_format'],
-                        disk_format=image.raw['disk_format'],
-                        name=image.name, is_public=image.is_public,
-                        protected=image.raw['protected'],
-                        min_ram=image.raw['min_ram'],
-                        min_disk=image.raw['min_disk'],
-                        properties=image.user_properties, data=file_obj)
-                    return new_image.id
-                except Exception, e:
-                    msg = regionobj.fullname + ': Upload of ' + image.name +\
-                        ' Failed. Cause: ' + str(e)
-                    self.logger.error(msg)
-                    raise GlanceFacadeException(msg)
+            file_obj = open(self.images_dir + '/' + image.id, 'r')
         except IOError, e:
             msg = regionobj.fullname + ': Cannot open the image ' +\
                 image.name + ' to upload. Cause: ' + str(e)
             self.logger.error(msg)
             raise GlanceFacadeException(msg)
+        with file_obj:
+            if image.checksum:
+                return self._upload_verified(client, regionobj, image,
+                                             file_obj)
+            return self._create_image(client, regionobj, image, file_obj)
+
+    def _upload_verified(self, client, regionobj, image, data):
+        """helper method, to create the image with the content of data,
+        checking the checksum of the content while it is read"""
+        if not image.checksum:
+            return self._create_image(client, regionobj, image, data,
+                                      size=image.size)
+        reader = ChecksumReader(data, image.checksum, image.size,
+                                _expected_hashes(image))
+        try:
+            id = self._create_image(client, regionobj, image, reader,
+                                    size=image.size)
+        except GlanceFacadeException:
+            if reader.error is None:
+                raise
+            id = None
+        if reader.error is not None:
+            # the client may not propagate the error of the reader
+            if id is not None:
+                try:
+                    self._delete_image(client, id)
+                except Exception:
+                    pass
+            msg = regionobj.fullname + ': Content of ' + image.name +\
+                ' is corrupt. Cause: ' + str(reader.error)
+            self.logger.error(msg)
+            raise GlanceFacadeChecksumException(msg)
+        if reader.digests is not None:
+            msg = '{0}: Checksum of {1} verified ({2})'
+            self.logger.info(msg.format(
+                regionobj.fullname, image.name, ', '.join(
+                    k + ' ' + v for (k, v) in sorted(reader.digests.items()))))
+        return id
+
+    def _create_image(self, client, regionobj, image, data, **kwargs):
+        """helper method, to create the image with the content of data"""
+        try:
+            new_image = client.images.create(
+                container_format=image.raw['container_format'],
+                disk_format=image.raw['disk_format'],
+                name=image.name, is_public=image.is_public,
+                protected=image.raw['protected'],
+                min_ram=image.raw['min_ram'],
+                min_disk=image.raw['min_disk'],
+                properties=image.user_properties, data=data, **kwargs)
+            return new_image.id
+        except Exception, e:
+            msg = regionobj.fullname + ': Upload of ' + image.name +\
+                ' Failed. Cause: ' + str(e)
+            self.logger.error(msg)
+            raise GlanceFacadeException(msg)
+
+    def copy_image(self, regionobj, image, url, timeout=3600):
+        """Create the image in the glance server of the region, asking the
+        server to download its content from url, and wait until the image is
+        active. The content is not transferred by this host.
+
+        :param regionobj: GlanceSyncRegion object; the region where the image
+          will be created.
+        :param image: GlanceSyncImage object; the image to be created.
+        :param url: the URL where the glance server downloads the image from.
+        :param timeout: the maximum seconds to wait for the image to be active
+        :return: The UUID of the new image.
+        """
+        client = self._get_glanceclient(regionobj.region)
+        try:
+            id = self._create_image_from_url(client, image, url)
+        except Exception, e:
+            msg = regionobj.fullname + ': Copy of ' + image.name +\
+                ' Failed. Cause: ' + str(e)
+            self.logger.error(msg)
+            raise GlanceFacadeException(msg)
+
+        deadline = time.time() + timeout
+        while True:
+            try:
+                status = client.images.get(id).status
+            except Exception, e:
+                cause = str(e)
+                break
+            if status == 'active':
+                return id
+            elif status in ('killed', 'deleted'):
+                cause = 'the image is ' + status
+                break
+            elif time.time() >= deadline:
+                cause = 'timeout; the image is ' + status
+                break
+            time.sleep(_copy_poll_interval)
+
+        msg = regionobj.fullname + ': Copy of ' + image.name +\
+            ' Failed. Cause: ' + cause
+        self.logger.error(msg)
+        try:
+            self._delete_image(client, id)
+        except Exception:
+            # The image may be already deleted.
+            pass
+        raise GlanceFacadeException(msg)
+
+    def register_location(self, regionobj, image, url):
+        """Create the image in the glance server of the region, using as
+        content the data already available in a store shared with the master
+        region. No data is transferred.
+
+        :param regionobj: GlanceSyncRegion object; the region where the image
+          will be created.
+        :param image: GlanceSyncImage object; the image to be created.
+        :param url: the location of the image in the store (e.g.
+          rbd://<fsid>/images/<id>/snap)
+        :return: The UUID of the new image.
+        """
+        client = self._get_glanceclient(regionobj.region)
+        try:
+            return self._create_image_with_location(client, image, url)
+        except Exception, e:
+            msg = regionobj.fullname + ': Registration of the location of ' +\
+                image.name + ' Failed. Cause: ' + str(e)
+            self.logger.error(msg)
+            raise GlanceFacadeException(msg)
+
+    def download_image(self, regionobj, id):
+        """Return the content of an image of the region, to use the region
+        as source of other regions.
+
+        :param regionobj: GlanceSyncRegion object; the region of the image.
+        :param id: the UUID of the image.
+        :return: a file-like object with the content of the image. The
+          caller must close it.
+        """
+        client = self._get_glanceclient(regionobj.region)
+        try:
+            return IterableReader(client.images.data(id))
+        except Exception, e:
+            msg = regionobj.fullname + ': Download of the image ' + id +\
+                ' Failed. Cause: ' + str(e)
+            self.logger.error(msg)
+            raise GlanceFacadeException(msg)
+
+    def _create_image_with_location(self, client, image, url):
+        """helper method, to create the image with an external location"""
+        new_image = client.images.create(
+            container_format=image.raw['container_format'],
+            disk_format=image.raw['disk_format'],
+            name=image.name, is_public=image.is_public,
+            protected=image.raw['protected'],
+            min_ram=image.raw['min_ram'],
+            min_disk=image.raw['min_disk'],
+            properties=image.user_properties, location=url)
+        return new_image.id
+
+    def _create_image_from_url(self, client, image, url):
+        """helper method, to create the image with the content available in
+        the URL (copy_from)"""
+        new_image = client.images.create(
+            container_format=image.raw['container_format'],
+            disk_format=image.raw['disk_format'],
+            name=image.name, is_public=image.is_public,
+            protected=image.raw['protected'],
+            min_ram=image.raw['min_ram'],
+            min_disk=image.raw['min_disk'],
+            properties=image.user_properties, copy_from=url)
+        return new_image.id
 
     def delete_image(self, regionobj, id, confirm=True):
         """delete a image on the specified region.
@@ -194,7 +494,7 @@ class ServersFacade(object):
                 return False
 
         try:
-            client.images.get(id).delete()
+            self._delete_image(client, id)
         except Exception, e:
             msg = regionobj.fullname + ': Deletion of image ' + id \
                 + ' Failed. Cause: ' + str(e)
@@ -203,6 +503,10 @@ class ServersFacade(object):
 
         return True
 
+    def _delete_image(self, client, id):
+        """helper method, to delete the image"""
+        client.images.get(id).delete()
+
     def get_tenant_id(self):
         """It returns the tenant id corresponding to the target. It is
         necessary to use the tenant_id instead of the tenant_name because the
@@ -213,10 +517,171 @@ class ServersFacade(object):
         return self.osclients.get_tenant_id()
 
 
+class ServersFacadeV2(ServersFacade):
+    """Facade using the version 2 of the glance API.
+
+    The listing pushes down to the server the filters passed by the caller:
+    *owner: only the images of this tenant. Be aware that the images without
+     owner are not returned.
+    *status: only the images with this status.
+    *names: only the images with these names (a set). They are requested
+     in batches, using the 'in:' operator; if the server does not support it,
+     all the images are listed.
+    The images are converted to GlanceSyncImage objects while the pages are
+    received.
+
+    In the version 2 of the API, the user properties are attributes of the
+    image (i.e. any attribute that is not in the image schema) and the
+    visibility replaces is_public.
+    """
+    # see get_imagelist_fingerprint
+    has_imagelist_fingerprint = False
+
+    def _get_glanceclient(self, region, timeout=None):
+        """helper method, to get a glanceclient (v2) for the region"""
+        if timeout is None:
+            return self.osclients.get_glanceclient(region, version='2')
+        return self.osclients.get_glanceclient(region, version='2',
+                                               timeout=timeout)
+
+    def get_imagelist_fingerprint(self, regionobj):
+        """The API v2 never returns the deleted images, so there is not a
+        query cheaper than the listing that detects the deletions. Therefore
+        this facade does not support the fingerprint: the state_file and the
+        cached lists are not used with the regions of this target.
+
+        :param regionobj: The GlanceSyncRegion object of the region
+        :return: None
+        """
+        return None
+
+    def get_imagelist(self, regionobj, filters=None):
+        """return a image list from the glance of the specified region
+
+        :param regionobj: The GlanceSyncRegion object of the region to list
+        :param filters: optional dictionary with the keys owner, status and
+          names (see the class documentation).
+        :return: a list of GlanceSyncImage objects
+        """
+        client = self._get_list_glanceclient(regionobj)
+        filters = dict(filters or dict())
+        names = filters.pop('names', None)
+        try:
+            timeout = regionobj.target.get('list_images_timeout',
+                                           _default_timeout)
+            return _call_with_timeout(
+                _getimagelist_v2,
+                (client, regionobj.fullname, filters, names), timeout)
+        except TimeoutError:
+            msg = regionobj.fullname + \
+                ': Timeout while retrieving image list.'
+            self.logger.error(msg)
+            raise GlanceFacadeException(msg)
+        except Exception, e:
+            cause = str(e)
+            if not cause:
+                cause = repr(e)
+            msg = regionobj.fullname + \
+                ': Error retrieving image list. Cause: ' + cause
+            self.logger.error(msg)
+            raise GlanceFacadeException(msg)
+
+    def update_metadata(self, regionobj, image):
+        """ update the metadata of the image in the specified region
+        See GlanceSync.update_metadata_image for more details.
+
+        :param regionobj: region where it is the image to update
+        :param image: the image with the metadata to update
+        :return: this function doesn't return anything.
+        """
+        client = self._get_glanceclient(regionobj.region)
+        try:
+            glance_obj = client.images.get(image.id)
+            old_properties = set(key for key in glance_obj.keys()
+                                 if key not in _v2_schema_fields)
+            remove_props = list(old_properties - set(image.user_properties))
+            client.images.update(
+                image.id, remove_props=remove_props, name=image.name,
+                visibility=_visibility(image.is_public),
+                protected=image.raw['protected'],
+                **_v2_properties(image.user_properties))
+        except Exception, e:
+            msg = regionobj.fullname + ': Update of ' + image.name +\
+                ' failed. Cause: ' + str(e)
+            self.logger.error(msg)
+            raise GlanceFacadeException(msg)
+
+    def _create_image(self, client, regionobj, image, data, size=None):
+        """helper method, to create the image and upload the content of
+        data. The image is deleted if the upload fails, instead of leaving it
+        queued."""
+        try:
+            new_image = client.images.create(
+                container_format=image.raw['container_format'],
+                disk_format=image.raw['disk_format'],
+                name=image.name, visibility=_visibility(image.is_public),
+                protected=image.raw['protected'],
+                min_ram=int(image.raw['min_ram']),
+                min_disk=int(image.raw['min_disk']),
+                **_v2_properties(image.user_properties))
+            try:
+                client.images.upload(new_image['id'], data, image_size=size)
+            except Exception:
+                try:
+                    client.images.delete(new_image['id'])
+                except Exception:
+                    pass
+                raise
+            return new_image['id']
+        except Exception, e:
+            msg = regionobj.fullname + ': Upload of ' + image.name +\
+                ' Failed. Cause: ' + str(e)
+            self.logger.error(msg)
+            raise GlanceFacadeException(msg)
+
+    def _create_image_from_url(self, client, image, url):
+        """helper method, to create the image and import its content from the
+        URL (web-download import method)"""
+        new_image = client.images.create(
+            container_format=image.raw['container_format'],
+            disk_format=image.raw['disk_format'],
+            name=image.name, visibility=_visibility(image.is_public),
+            protected=image.raw['protected'],
+            min_ram=int(image.raw['min_ram']),
+            min_disk=int(image.raw['min_disk']),
+            **_v2_properties(image.user_properties))
+        client.images.image_import(new_image['id'], method='web-download',
+                                   uri=url)
+        return new_image['id']
+
+    def _create_image_with_location(self, client, image, url):
+        """helper method, to create the image and add the location. The image
+        is deleted if the location can not be added (e.g. the server does not
+        show the locations)."""
+        new_image = client.images.create(
+            container_format=image.raw['container_format'],
+            disk_format=image.raw['disk_format'],
+            name=image.name, visibility=_visibility(image.is_public),
+            protected=image.raw['protected'],
+            min_ram=int(image.raw['min_ram']),
+            min_disk=int(image.raw['min_disk']),
+            **_v2_properties(image.user_properties))
+        try:
+            client.images.add_location(new_image['id'], url, dict())
+        except Exception:
+            client.images.delete(new_image['id'])
+            raise
+        return new_image['id']
+
+    def _delete_image(self, client, id):
+        """helper method, to delete the image"""
+        client.images.delete(id)
+
+
 def _getrawimagelist(glance_client):
     """Helper function that returns objects as dictionary.
-    We need this function because we use Pool to implement a timeout and
-    the original results is not pickable.
+    We need this function because we use a pool of threads to implement a
+    timeout; the images must be completely read inside the thread.
 
     :param glance_client: the glance client
     :return: a list of images (every image is a dictionary)
@@ -225,7 +690,112 @@ def _getrawimagelist(glance_client):
     return list(image.to_dict() for image in images)
 
 
+def _getlastupdated(glance_client):
+    """Helper function that returns the id and the updated_at of the last
+    updated image, or an empty tuple if there are no images.
+
+    :param glance_client: the glance client
+    :return: a tuple (id, updated_at) or ()
+    """
+    images = glance_client.images.list(
+        sort_key='updated_at', sort_dir='desc', limit=1, page_size=1,
+        filters={'changes-since': _changes_since_epoch})
+    for image in images:
+        return image.id, image.updated_at
+    return ()
+
+
+def _getimagelist_v2(glance_client, region, filters, names=None):
+    """Helper function that returns the list of images of a region, using the
+    version 2 of the API. It is invoked in a pool of threads to implement a
+    timeout.
+
+    :param glance_client: the glance client (v2)
+    :param region: the full name of the region
+    :param filters: a dictionary with the filters to pass to the server
+    :param names: if not None, only the images with these names are listed.
+    :return: a list of GlanceSyncImage objects
+    """
+    if names is None:
+        batches = [None]
+    else:
+        names = sorted(names)
+        batches = list(names[i:i + _v2_names_by_request]
+                       for i in range(0, len(names), _v2_names_by_request))
+
+    images = dict()
+    for batch in batches:
+        query = dict(filters)
+        if batch is not None:
+            query['name'] = 'in:' + ','.join(
+                '"' + name.replace('"', '\\"') + '"' for name in batch)
+        try:
+            for raw in glance_client.images.list(filters=query,
+                                                 page_size=_v2_page_size):
+                images[raw['id']] = _v2_to_glancesyncimage(raw, region)
+        except Exception:
+            if batch is None or images:
+                raise
+            # The 'in:' operator is not supported by old servers.
+            return _getimagelist_v2(glance_client, region, filters)
+    return images.values()
+
+
+def _v2_to_glancesyncimage(raw, region):
+    """Convert an image returned by the API v2 to a GlanceSyncImage. The
+    attributes not included in the image schema are the user properties."""
+    raw = dict(raw)
+    user_properties = dict((key, value) for (key, value) in raw.items()
+                           if key not in _v2_schema_fields)
+    return GlanceSyncImage(
+        raw['name'], raw['id'], region, raw.get('owner', None),
+        raw.get('visibility', None) == 'public', raw.get('checksum', None),
+        raw.get('size', None) or 0, raw['status'], user_properties, raw)
+
+
+def _expected_hashes(image):
+    """Return the digests to check besides the MD5 checksum: the multihash
+    of the image (os_hash_algo and os_hash_value, e.g. SHA-256 or SHA-512),
+    if the glance server reports it and hashlib supports the algorithm.
+
+    :param image: a GlanceSyncImage object
+    :return: a dictionary with the hexadecimal digest indexed by algorithm
+    """
+    raw = image.raw or dict()
+    algorithm = raw.get('os_hash_algo', None)
+    value = raw.get('os_hash_value', None)
+    if not algorithm or not value:
+        return dict()
+    try:
+        hashlib.new(algorithm)
+    except ValueError:
+        return dict()
+    return {str(algorithm): str(value)}
+
+
+def _visibility(is_public):
+    """Convert is_public to the visibility attribute of the API v2"""
+    if is_public:
+        return 'public'
+    else:
+        return 'private'
+
+
+def _v2_properties(user_properties):
+    """The API v2 requires string values for the additional properties. The
+    strings (including the unicode values returned by the API v2) are kept
+    unchanged; str() would fail with the non-ASCII characters."""
+    return dict((key, value if isinstance(value, basestring) else str(value))
+                for (key, value) in user_properties.items())
+
+
 class GlanceFacadeException(Exception):
     """exception type to use with relaunched exceptions"""
     def __init__(self, message):
         Exception.__init__(self, message)
+
+
+class GlanceFacadeChecksumException(GlanceFacadeException):
+    """exception raised when the content of an image does not match its
+    checksum"""
+    pass
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from app.settings.settings import logger_cli
+from glancesync_streams import ChecksumReader
+
+"""This internal module contains the sources of the content of the master
+images: the local images_dir of the master glance server or a staging cache
+filled downloading the images from the master glance server.
+
+Users should use the GlanceSync class provided in glancesync instead of this
+module."""
+
+# Prefix of the temporal files used while an image is downloaded
+_tmp_prefix = '.staging_'
+
+# Age (seconds since the last write) after which a temporal file is
+# considered a partial download abandoned by a process that has finished
+_stale_tmp_age = 3600
+
+# Size of the chunks copied and read (bytes)
+_chunk_size = 65536
+
+
+class LocalImageSource(object):
+    """The content of the master images is read from images_dir, i.e.
+    GlanceSync runs in the master glance node (or images_dir is shared)"""
+
+    # the facades can read the files themselves
+    remote = False
+
+    def __init__(self, images_dir):
+        """
+        :param images_dir: the directory with a file for each master image,
+          named as its UUID
+        """
+        self.images_dir = images_dir
+
+    def open(self, image):
+        """Return a file-like object with the content of a master image.
+
+        :param image: the master GlanceSyncImage object
+        :return: a file-like object, that the caller must close.
+        """
+        return open(os.path.join(self.images_dir, image.id), 'rb')
+
+
+class RemoteImageSource(object):
+    """The content of the master images is downloaded on demand from the
+    master glance server to a staging directory, so GlanceSync can run in
+    any host.
+
+    The staging directory is a cache with a maximum size in bytes: the least
+    recently used images are removed to make room for new ones, but never the
+    images being read (pinned). An image requested by several threads at
+    the same time is downloaded only once. The images already staged by a
+    previous run are reused.
+
+    The bookkeeping is kept in memory: other processes using the same
+    directory (e.g. the children of --parallel) may remove a staged image.
+    When a staged file has disappeared, the image is downloaded again. For
+    the same reason, only the temporal files not written for a while are
+    removed at start: the others may be downloads in progress.
+
+    The content downloaded is verified against the checksum of the master
+    image before it is renamed into place, so a corrupted download is never
+    staged.
+    """
+
+    remote = True
+
+    def __init__(self, regionobj, staging_dir, capacity_mb):
+        """Create the source. The staging directory is created if it does
+        not exist.
+
+        :param regionobj: the GlanceSyncRegion object of the master region
+        :param staging_dir: the directory where the images are saved
+        :param capacity_mb: the maximum size of the staged images, in MB.
+          It is exceeded only when all the staged images are pinned.
+        """
+        self.log = logger_cli
+        self.regionobj = regionobj
+        self.staging_dir = staging_dir
+        self.capacity = capacity_mb * 1024 * 1024
+        self._cond = threading.Condition()
+        # size of the staged images by UUID, the least recently used first
+        self._entries = OrderedDict()
+        self._pinned = dict()
+        self._downloading = set()
+        if not os.path.exists(staging_dir):
+            os.makedirs(staging_dir)
+        self._load()
+
+    def open(self, image):
+        """Return a file-like object with the content of a master image,
+        downloading it if it is not staged. The image is pinned until the
+        object is closed.
+
+        :param image: the master GlanceSyncImage object
+        :return: a file-like object, that the caller must close.
+        """
+        try:
+            return self._open(image)
+        except _StagedFileMissing:
+            msg = 'The staged image {0} has been removed; downloading it '\
+                'again'
+            self.log.warning(msg.format(image.name))
+            return self._open(image)
+
+    def _open(self, image):
+        """Implementation of open. _StagedFileMissing is raised if the image
+        was staged but its file can not be opened; its entry is removed."""
+        with self._cond:
+            while image.id in self._downloading:
+                self._cond.wait()
+            if image.id in self._entries:
+                self._pin(image.id)
+                staged = True
+            else:
+                self._downloading.add(image.id)
+                staged = False
+        if not staged:
+            size = None
+            try:
+                size = self._download(image)
+            finally:
+                with self._cond:
+                    self._downloading.discard(image.id)
+                    if size is not None:
+                        self._entries[image.id] = size
+                        self._pin(image.id)
+                        self._evict()
+                    self._cond.notify_all()
+        try:
+            file_obj = open(self._path(image.id), 'rb')
+        except IOError, e:
+            with self._cond:
+                self._entries.pop(image.id, None)
+            self._release(image.id)
+            if staged:
+                raise _StagedFileMissing(str(e))
+            raise
+        return _StagedFile(file_obj, self, image.id)
+
+    def staged_bytes(self):
+        """Return the number of bytes of the staged images"""
+        with self._cond:
+            return sum(self._entries.values())
+
+    def _path(self, id):
+        return os.path.join(self.staging_dir, id)
+
+    def _pin(self, id):
+        """Mark the image as in use and the most recently used one. The
+        lock must be held."""
+        self._entries[id] = self._entries.pop(id)
+        self._pinned[id] = self._pinned.get(id, 0) + 1
+
+    def _release(self, id):
+        """Unpin the image, invoked when a reader is closed"""
+        with self._cond:
+            self._pinned[id] -= 1
+            if not self._pinned[id]:
+                del self._pinned[id]
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used images not pinned while the
+        capacity is exceeded. The lock must be held."""
+        total = sum(self._entries.values())
+        for id in list(self._entries.keys()):
+            if total <= self.capacity:
+                break
+            if id in self._pinned:
+                continue
+            total -= self._entries.pop(id)
+            try:
+                os.unlink(self._path(id))
+            except OSError, e:
+                msg = 'Cannot remove the staged image {0}. Cause: {1}'
+                self.log.warning(msg.format(id, str(e)))
+
+    def _download(self, image):
+        """Download the image to the staging directory. The content is
+        written to a temporal file that is renamed at the end, after checking
+        it against the checksum of the image (if known).
+
+        :param image: the master GlanceSyncImage object
+        :return: the size of the file
+        """
+        msg = 'Downloading the master image {0} ({1} MB) to the staging area'
+        self.log.info(msg.format(image.name,
+                                 int(image.size or 0) / 1024 / 1024))
+        facade = self.regionobj.target['facade']
+        (fd, tmp_path) = tempfile.mkstemp(prefix=_tmp_prefix,
+                                          dir=self.staging_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                data = facade.download_image(self.regionobj, image.id)
+                if image.checksum:
+                    data = ChecksumReader(data, image.checksum, image.size)
+                try:
+                    shutil.copyfileobj(data, f, _chunk_size)
+                finally:
+                    data.close()
+            os.rename(tmp_path, self._path(image.id))
+        except Exception, e:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            msg = 'Cannot download the image {0} to the staging area. '\
+                'Cause: {1}'.format(image.name, str(e))
+            self.log.error(msg)
+            raise IOError(msg)
+        return os.path.getsize(self._path(image.id))
+
+    def _load(self):
+        """Register the images staged by a previous run, the oldest first,
+        and remove the partial downloads abandoned (i.e. not written for
+        _stale_tmp_age seconds)"""
+        files = list()
+        now = time.time()
+        for name in os.listdir(self.staging_dir):
+            path = self._path(name)
+            if name.startswith(_tmp_prefix):
+                try:
+                    if now - os.path.getmtime(path) > _stale_tmp_age:
+                        os.unlink(path)
+                except OSError:
+                    # already renamed or removed by other process
+                    pass
+            elif os.path.isfile(path):
+                st = os.stat(path)
+                files.append((st.st_atime, name, st.st_size))
+        for (atime, name, size) in sorted(files):
+            self._entries[name] = size
+        self._evict()
+
+
+class _StagedFileMissing(IOError):
+    """The file of a staged image does not exist (e.g. it has been removed
+    by other process)"""
+
+
+class _StagedFile(object):
+    """File-like object returned by RemoteImageSource.open. The image is
+    unpinned when it is closed."""
+
+    def __init__(self, file_obj, source, id):
+        self.file_obj = file_obj
+        self.source = source
+        self.id = id
+        self.closed = False
+
+    def read(self, size=-1):
+        return self.file_obj.read(size)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(_chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.file_obj.close()
+            self.source._release(self.id)
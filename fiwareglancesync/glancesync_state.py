@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+import os
+import json
+import fcntl
+import types
+import marshal
+import hashlib
+import tempfile
+import time
+
+from app.settings.settings import logger_cli
+
+"""This internal module contains the state saved between runs to do
+incremental synchronisations.
+
+Users should use the GlanceSync class provided in glancesync instead of this
+module."""
+
+# Options of the targets that change the result of the synchronisation
+_target_options = ('metadata_set', 'metadata_condition', 'metadata_filter',
+                   'forcesyncs', 'replace', 'rename', 'dontupdate',
+                   'only_tenant_images', 'support_obsolete_images',
+                   'obsolete_syncprops')
+
+
+class SyncState(object):
+    """State of the last synchronisation, saved in a JSON file.
+
+    It contains a fingerprint of each master image (checksum, is_public and
+    user properties) and, for each region successfully synchronised, the
+    fingerprint of the master images to synchronise to it and the fingerprint
+    of the region returned by the facade (see get_imagelist_fingerprint).
+    While both fingerprints are the same, the region is still synchronised and
+    it is not necessary to list and compare its images.
+
+    A marker older than max_age seconds is ignored, so every region is
+    listed and compared from time to time even if the fingerprints do not
+    change. Several processes may share the file: each one only writes the
+    regions it has modified.
+    """
+
+    def __init__(self, path, max_age=None):
+        """Create the object, reading the file if it exists.
+
+        :param path: the path of the file where the state is saved
+        :param max_age: the maximum age of the markers of the regions, in
+          seconds. None or zero means no limit.
+        """
+        self.log = logger_cli
+        self.path = path
+        self.max_age = max_age
+        # regions modified by this object; None means removed
+        self._modified = dict()
+        values = self._load()
+        self.master = values.get('master', dict())
+        self.regions = values.get('regions', dict())
+
+    def update_master(self, master_images):
+        """Save the fingerprints of the master images and return the names
+        of the images that have changed since the previous run.
+
+        :param master_images: a dictionary of master images indexed by name
+        :return: a set with the names of the new or modified images, including
+          the removed ones.
+        """
+        fingerprints = dict((name, image_fingerprint(image))
+                            for (name, image) in master_images.items())
+        changed = set(name for name in fingerprints
+                      if self.master.get(name, None) != fingerprints[name])
+        changed.update(name for name in self.master
+                       if name not in fingerprints)
+        self.master = fingerprints
+        return changed
+
+    def is_converged(self, fullname, master_fingerprint, region_fingerprint):
+        """Return true if the region was synchronised with the same master
+        images and it has not changed since then.
+
+        :param fullname: the full name of the region
+        :param master_fingerprint: the value returned by master_fingerprint
+        :param region_fingerprint: the value returned by the facade
+        :return: true if it is not necessary to synchronise the region.
+        """
+        marker = self.regions.get(fullname, None)
+        if marker is None:
+            return False
+        if self.max_age and\
+                time.time() - marker.get('time', 0) >= self.max_age:
+            return False
+        return marker['master'] == master_fingerprint and\
+            marker['region'] == _normalise(region_fingerprint)
+
+    def set_converged(self, fullname, master_fingerprint, region_fingerprint):
+        """Register that the region has been synchronised and save the state.
+
+        :param fullname: the full name of the region
+        :param master_fingerprint: the value returned by master_fingerprint
+        :param region_fingerprint: the value returned by the facade after the
+          synchronisation.
+        :return: Nothing
+        """
+        marker = {'master': master_fingerprint,
+                  'region': _normalise(region_fingerprint),
+                  'time': time.time()}
+        self.regions[fullname] = marker
+        self._modified[fullname] = marker
+        self.save()
+
+    def forget_region(self, fullname):
+        """Remove the marker of the region, so it is evaluated the next time.
+
+        :param fullname: the full name of the region
+        :return: Nothing
+        """
+        if fullname in self.regions:
+            del self.regions[fullname]
+        self._modified[fullname] = None
+        self.save()
+
+    def save(self):
+        """Write the state. The file is locked while it is read again to
+        merge the regions written by other processes, and then it is
+        replaced by a temporal file, so readers never see a partial file.
+
+        :return: Nothing
+        """
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = None
+        try:
+            with open(self.path + '.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                regions = self._load().get('regions', dict())
+                for (fullname, marker) in self._modified.items():
+                    if marker is None:
+                        regions.pop(fullname, None)
+                    else:
+                        regions[fullname] = marker
+                self.regions = regions
+                (fd, tmp_path) = tempfile.mkstemp(dir=dirname)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({'master': self.master, 'regions': regions}, f,
+                              indent=1, sort_keys=True)
+                os.rename(tmp_path, self.path)
+        except Exception, e:
+            msg = 'Cannot save the synchronisation state {0}. Cause: {1}'
+            self.log.warning(msg.format(self.path, str(e)))
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _load(self):
+        """Return the content of the file, or an empty dictionary if it does
+        not exist or can not be read"""
+        if not os.path.exists(self.path):
+            return dict()
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except Exception, e:
+            msg = 'Ignoring the synchronisation state {0}. Cause: {1}'
+            self.log.warning(msg.format(self.path, str(e)))
+            return dict()
+
+
+def image_fingerprint(image, metadata_set=None):
+    """Return a fingerprint of the content and the metadata of a master image.
+
+    :param image: a GlanceSyncImage object
+    :param metadata_set: if not empty, only these user properties are
+      considered.
+    :return: a hexadecimal string
+    """
+    properties = image.user_properties
+    if metadata_set:
+        properties = dict((key, value) for (key, value) in properties.items()
+                          if key in metadata_set)
+    value = [image.checksum, image.is_public, sorted(properties.items())]
+    return hashlib.md5(json.dumps(value)).hexdigest()
+
+
+def master_fingerprint(master_images, target):
+    """Return a fingerprint of the master images to synchronise to a region
+    and the configuration of its target.
+
+    :param master_images: a dictionary with the master images relevant to the
+      region, indexed by name.
+    :param target: the target of the region
+    :return: a hexadecimal string
+    """
+    metadata_set = target.get('metadata_set', None)
+    images = sorted((name, image_fingerprint(image, metadata_set))
+                    for (name, image) in master_images.items())
+    options = list(_normalise(target.get(key, None))
+                   for key in _target_options)
+    return hashlib.md5(json.dumps([images, options])).hexdigest()
+
+
+def _normalise(value):
+    """Convert the value to a form that is the same after a JSON roundtrip
+    (e.g. sets and tuples are converted to lists)."""
+    if isinstance(value, (set, frozenset)):
+        return sorted(_normalise(v) for v in value)
+    elif isinstance(value, (list, tuple)):
+        return list(_normalise(v) for v in value)
+    elif isinstance(value, dict):
+        return dict((k, _normalise(v)) for (k, v) in value.items())
+    elif isinstance(value, types.CodeType):
+        # metadata_condition is a compiled expression
+        return hashlib.md5(marshal.dumps(value)).hexdigest()
+    elif hasattr(value, 'select'):
+        # metadata_filter is a compiled MetadataFilter
+        return str(value)
+    else:
+        return value
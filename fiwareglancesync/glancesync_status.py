@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+
+import time
+import sqlite3
+
+"""This internal module contains the store of the synchronisation status of
+the images of each region, shared by the CLI and the API.
+
+Users should use the GlanceSync class provided in glancesync instead of this
+module, excepting to query the status (see SyncStatusStore.get_region)."""
+
+# Seconds to wait for the lock of the database, held by other process
+_lock_timeout = 30
+
+
+class SyncStatusStore(object):
+    """Status of the synchronisation of each image of each region (the
+    status returned by GlanceSyncRegion.image_list_to_sync: ok,
+    pending_upload, error_checksum...), with the time it was verified.
+
+    The status is saved in a SQLite database, so it can be queried without
+    listing the glance servers. It is replaced each time a region is
+    compared with the master region (a plan, a synchronisation or a status
+    report) and updated image by image while the region is synchronised.
+    Several processes and threads may use the same database: each operation
+    uses its own connection.
+    """
+
+    def __init__(self, db_path):
+        """Create the store object. The database is created if it does not
+        exist.
+
+        :param db_path: the path of the SQLite database
+        """
+        self.db_path = db_path
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS status (region TEXT, '
+                    'name TEXT, status TEXT, id TEXT, size INTEGER, '
+                    'checked REAL, PRIMARY KEY (region, name))')
+        finally:
+            conn.close()
+
+    def update_region(self, fullname, tuples, region_images=None,
+                      complete=True, timestamp=None):
+        """Save the status of the images of a region.
+
+        :param fullname: the full name of the region (target:region)
+        :param tuples: the list of tuples (status, master_image) returned by
+          image_list_to_sync
+        :param region_images: a dictionary with the images of the region,
+          indexed by name, to save the UUID of the region images.
+        :param complete: true if the tuples include all the images to
+          synchronise to the region: the status of the other images is
+          removed.
+        :param timestamp: the time of the verification. By default, now.
+        :return: Nothing
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if region_images is None:
+            region_images = dict()
+        rows = list()
+        for (status, image) in tuples:
+            region_image = region_images.get(image.name, None)
+            if region_image is not None:
+                uuid = region_image.id
+            else:
+                uuid = None
+            rows.append((fullname, image.name, status, uuid, int(image.size),
+                         timestamp))
+        conn = self._connect()
+        try:
+            with conn:
+                if complete:
+                    conn.execute('DELETE FROM status WHERE region = ?',
+                                 (fullname,))
+                conn.executemany(
+                    'INSERT OR REPLACE INTO status VALUES (?, ?, ?, ?, ?, ?)',
+                    rows)
+        finally:
+            conn.close()
+
+    def set_image(self, fullname, name, status, uuid=None, timestamp=None):
+        """Update the status of an image of a region (e.g. after uploading
+        it). The image must be already in the store.
+
+        :param fullname: the full name of the region (target:region)
+        :param name: the name of the image
+        :param status: the new status
+        :param uuid: the UUID of the image in the region; None to keep the
+          saved one.
+        :param timestamp: the time of the change. By default, now.
+        :return: Nothing
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'UPDATE status SET status = ?, id = coalesce(?, id), '
+                    'checked = ? WHERE region = ? AND name = ?',
+                    (status, uuid, timestamp, fullname, name))
+        finally:
+            conn.close()
+
+    def touch_region(self, fullname, timestamp=None):
+        """Update the time of verification of all the images of a region,
+        whose status has been confirmed without comparing its images (e.g.
+        the region is unchanged since the last synchronisation).
+
+        :param fullname: the full name of the region (target:region)
+        :param timestamp: the time of the verification. By default, now.
+        :return: Nothing
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('UPDATE status SET checked = ? WHERE region = ?',
+                             (timestamp, fullname))
+        finally:
+            conn.close()
+
+    def forget_region(self, fullname):
+        """Remove the status of the images of a region (e.g. after deleting
+        an image by other means).
+
+        :param fullname: the full name of the region (target:region)
+        :return: Nothing
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM status WHERE region = ?',
+                             (fullname,))
+        finally:
+            conn.close()
+
+    def get_region(self, fullname, name=None):
+        """Return the saved status of the images of a region.
+
+        :param fullname: the full name of the region (target:region). The
+          prefix 'master:' may be omitted.
+        :param name: if not None, return only the status of this image
+        :return: a list of dictionaries with the keys region, name, status,
+          id (the UUID of the image in the region, or None), size and checked
+          (the time of the last verification, in seconds since the epoch),
+          sorted by image size and name. The list is empty if the region has
+          never been compared.
+        """
+        if fullname.startswith('master:'):
+            fullname = fullname[7:]
+        query = 'SELECT region, name, status, id, size, checked FROM status '\
+            'WHERE region = ?'
+        params = [fullname]
+        if name is not None:
+            query += ' AND name = ?'
+            params.append(name)
+        query += ' ORDER BY size, name'
+        conn = self._connect()
+        try:
+            return list(
+                {'region': row[0], 'name': row[1], 'status': row[2],
+                 'id': row[3], 'size': row[4], 'checked': row[5]}
+                for row in conn.execute(query, params))
+        finally:
+            conn.close()
+
+    def get_regions(self):
+        """Return the full names of the regions with some saved status.
+
+        :return: a sorted list of region names
+        """
+        conn = self._connect()
+        try:
+            return list(row[0] for row in conn.execute(
+                'SELECT DISTINCT region FROM status ORDER BY region'))
+        finally:
+            conn.close()
+
+    def _connect(self):
+        """Return a new connection to the database"""
+        conn = sqlite3.connect(self.db_path, timeout=_lock_timeout)
+        # the names of the images are returned as UTF-8 strings, like the
+        # values obtained from the glance servers.
+        conn.text_factory = str
+        return conn
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+import hashlib
+import threading
+import Queue
+
+"""This internal module contains file-like objects used to stream the content
+of the master images to the regional glance servers.
+
+Users should use the GlanceSync class provided in glancesync instead of this
+module."""
+
+# Size of the chunks read from the image files (bytes)
+_chunk_size = 65536
+
+
+class TeeReader(object):
+    """Read a file only once and stream its content to several consumers.
+
+    Each consumer uses one of the file-like objects in the branches list.
+    A thread reads the file and put the chunks in a bounded buffer of each
+    branch. When the buffer of a branch is full, the reading is blocked until
+    the consumer reads a chunk (back-pressure), therefore a slow consumer only
+    stalls the others when its buffer is exhausted.
+
+    A consumer that is not going to read more data (e.g. because its upload
+    failed) must close its branch; otherwise the other consumers are stalled.
+    """
+
+    def __init__(self, file_obj, consumers, buffer_size=1048576,
+                 chunk_size=_chunk_size):
+        """Create the branches. The reading does not start until calling
+        start.
+
+        :param file_obj: the file-like object to read. It is closed at the end.
+        :param consumers: the number of branches to create.
+        :param buffer_size: the size of the buffer of each branch, in bytes.
+        :param chunk_size: the size of each chunk, in bytes.
+        """
+        self.file_obj = file_obj
+        self.chunk_size = chunk_size
+        buffer_chunks = max(1, buffer_size / chunk_size)
+        self.branches = list(TeeBranch(buffer_chunks)
+                             for i in range(consumers))
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        """start the thread reading the file"""
+        self._thread.start()
+
+    def join(self):
+        """wait until the file is completely read (or the reading fails)"""
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                chunk = self.file_obj.read(self.chunk_size)
+                for branch in self.branches:
+                    branch.put(chunk)
+                if not chunk:
+                    break
+        except Exception, e:
+            for branch in self.branches:
+                branch.put(e)
+        finally:
+            self.file_obj.close()
+
+
+class TeeBranch(object):
+    """File-like object returned by TeeReader for each consumer"""
+
+    def __init__(self, buffer_chunks):
+        self._queue = Queue.Queue(buffer_chunks)
+        self._pending = ''
+        self._eof = False
+        self.closed = False
+
+    def put(self, chunk):
+        """Internal method, invoked by TeeReader to add a chunk (or an
+        exception). It blocks while the buffer is full, unless the branch is
+        closed; then the chunk is discarded."""
+        while not self.closed:
+            try:
+                self._queue.put(chunk, timeout=0.5)
+                return
+            except Queue.Full:
+                continue
+
+    def read(self, size=-1):
+        """Read up to size bytes. If size is negative, read until the end.
+
+        It raises the exception found by TeeReader reading the file, if any.
+        """
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        while not self._eof and (size < 0 or len(self._pending) < size):
+            chunk = self._queue.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if not chunk:
+                self._eof = True
+            self._pending += chunk
+        if size < 0:
+            size = len(self._pending)
+        data = self._pending[:size]
+        self._pending = self._pending[size:]
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(_chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        """close the branch; the pending chunks are discarded."""
+        self.closed = True
+        self._pending = ''
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Queue.Empty:
+            pass
+
+
+class ThrottledReader(object):
+    """File-like object that limits the rate of the reads of other file-like
+    object, using a TokenBucket shared with other readers."""
+
+    def __init__(self, file_obj, bucket):
+        """
+        :param file_obj: the file-like object to read. It is closed when this
+          object is closed.
+        :param bucket: a TokenBucket object.
+        """
+        self.file_obj = file_obj
+        self.bucket = bucket
+
+    def read(self, size=-1):
+        """Read up to size bytes, waiting if the rate is exceeded"""
+        data = self.file_obj.read(size)
+        self.bucket.consume(len(data))
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(_chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self.file_obj.close()
+
+
+class IterableReader(object):
+    """File-like object over an iterable of chunks, like the body returned
+    by glanceclient when an image is downloaded."""
+
+    def __init__(self, iterable):
+        """
+        :param iterable: an iterable of strings. If it has a close method,
+          it is invoked when this object is closed.
+        """
+        self._iterable = iterable
+        self._iterator = iter(iterable)
+        self._pending = ''
+        self._eof = False
+
+    def read(self, size=-1):
+        """Read up to size bytes. If size is negative, read until the end."""
+        while not self._eof and (size < 0 or len(self._pending) < size):
+            try:
+                self._pending += next(self._iterator)
+            except StopIteration:
+                self._eof = True
+        if size < 0:
+            size = len(self._pending)
+        data = self._pending[:size]
+        self._pending = self._pending[size:]
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(_chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self._pending = ''
+        self._eof = True
+        if hasattr(self._iterable, 'close'):
+            self._iterable.close()
+
+
+class ChecksumError(IOError):
+    """The content read by a ChecksumReader does not match the expected
+    size or digests"""
+    pass
+
+
+class ChecksumReader(object):
+    """File-like object that computes the digests of the content of other
+    file-like object while it is read, and checks them against the expected
+    values when the end is reached.
+
+    When the expected size is known, the check is done before returning the
+    last bytes, so a consumer streaming the content (e.g. an upload) is
+    aborted without sending the complete body. A ChecksumError is raised if
+    some digest or the size does not match.
+    """
+
+    def __init__(self, file_obj, checksum, size=None, hashes=None):
+        """
+        :param file_obj: the file-like object to read. It is closed when this
+          object is closed.
+        :param checksum: the expected MD5 of the content, in hexadecimal.
+        :param size: the expected size of the content in bytes, if known.
+        :param hashes: optional dictionary with other digests to check, as
+          hexadecimal values indexed by the name of the hashlib algorithm
+          (e.g. {'sha256': '...'}).
+        """
+        self.file_obj = file_obj
+        self.size = int(size or 0)
+        self.expected = {'md5': checksum}
+        if hashes:
+            self.expected.update(hashes)
+        self._digests = dict((algorithm, hashlib.new(algorithm))
+                             for algorithm in self.expected)
+        self.count = 0
+        # the hexadecimal digests, once the content is verified
+        self.digests = None
+        # the ChecksumError raised, if any
+        self.error = None
+
+    def read(self, size=-1):
+        """Read up to size bytes, raising ChecksumError if the content does
+        not match the expected values."""
+        data = self.file_obj.read(size)
+        self.count += len(data)
+        for digest in self._digests.values():
+            digest.update(data)
+        if self.digests is None and (
+                not data or (self.size and self.count >= self.size)):
+            self._verify()
+        elif data and self.size and self.count > self.size:
+            msg = 'size mismatch: read more than {0} bytes'
+            self.error = ChecksumError(msg.format(self.size))
+            raise self.error
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(_chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self.file_obj.close()
+
+    def _verify(self):
+        """Compare the size and the digests with the expected values"""
+        self.digests = dict((algorithm, digest.hexdigest())
+                            for (algorithm, digest) in self._digests.items())
+        if self.size and self.count != self.size:
+            msg = 'size mismatch: read {0} bytes, expected {1}'
+            self.error = ChecksumError(msg.format(self.count, self.size))
+            raise self.error
+        for (algorithm, value) in sorted(self.expected.items()):
+            if self.digests[algorithm] != value:
+                msg = '{0} mismatch: read {1}, expected {2}'
+                self.error = ChecksumError(msg.format(
+                    algorithm, self.digests[algorithm], value))
+                raise self.error
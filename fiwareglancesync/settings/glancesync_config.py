@@ -26,6 +26,7 @@ import ConfigParser
 import os
 import base64
 from fiwareglancesync.app.settings.settings import logger_cli
+from fiwareglancesync.glancesync_filter import MetadataFilter
 
 __version__ = '1.7.0'
 
@@ -59,6 +60,15 @@ ConfigParser.SafeConfigParser.getlist = _get_list
 
 default_configuration_file = '/etc/glancesync.conf'
 
+# Valid values of scheduler_policy
+scheduler_policies = ('smallest', 'priority', 'completion')
+
+# Valid values of transfer_mode
+transfer_modes = ('push', 'copy_from', 'location')
+
+# Valid values of image_source
+image_sources = ('local', 'remote')
+
 
 class GlanceSyncConfig(object):
     """Class to read glancesync configuration.
@@ -107,7 +117,11 @@ class GlanceSyncConfig(object):
 
         defaults = {'use_keystone_v3': 'False',
                     'support_obsolete_images': 'True',
-                    'only_tenant_images': 'True', 'list_images_timeout': '30'}
+                    'only_tenant_images': 'True', 'list_images_timeout': '30',
+                    'upload_workers': '1', 'glance_api_version': '1',
+                    'transfer_mode': 'push', 'copy_from_url': '',
+                    'copy_from_timeout': '3600', 'location_url': '',
+                    'adopt_images': 'False'}
 
         if not stream:
             if 'GLANCESYNC_CONFIG' in os.environ:
@@ -120,6 +134,20 @@ class GlanceSyncConfig(object):
         self.preferable_order = None
         self.max_children = 1
         self.images_dir = '/var/lib/glance/images'
+        self.fanout_buffer_mb = 4
+        self.bandwidth_mb = 0
+        self.max_uploads = 4
+        self.scheduler_policy = 'smallest'
+        self.cache_dir = None
+        self.cache_ttl = 300
+        self.state_file = None
+        self.state_max_age = 86400
+        self.images_index = None
+        self.status_db = None
+        self.image_source = 'local'
+        self.staging_dir = None
+        self.staging_mb = 10240
+        self.relays = dict()
 
         # Read configuration if it exists
         if configuration_path is not None or stream is not None:
@@ -156,6 +184,85 @@ class GlanceSyncConfig(object):
                                                             'max_children')
             if configparser.has_option('main', 'images_dir'):
                     self.images_dir = configparser.get('main', 'images_dir')
+            if configparser.has_option('main', 'fanout_buffer_mb'):
+                    self.fanout_buffer_mb = configparser.getint(
+                        'main', 'fanout_buffer_mb')
+            if configparser.has_option('main', 'bandwidth_mb'):
+                    self.bandwidth_mb = configparser.getfloat(
+                        'main', 'bandwidth_mb')
+            if configparser.has_option('main', 'max_uploads'):
+                    self.max_uploads = configparser.getint(
+                        'main', 'max_uploads')
+            if configparser.has_option('main', 'cache_dir'):
+                    self.cache_dir = configparser.get(
+                        'main', 'cache_dir').strip() or None
+            if configparser.has_option('main', 'cache_ttl'):
+                    self.cache_ttl = configparser.getint('main', 'cache_ttl')
+            if configparser.has_option('main', 'state_file'):
+                    self.state_file = configparser.get(
+                        'main', 'state_file').strip() or None
+            if configparser.has_option('main', 'state_max_age'):
+                    self.state_max_age = configparser.getint(
+                        'main', 'state_max_age')
+            if configparser.has_option('main', 'images_index'):
+                    self.images_index = configparser.get(
+                        'main', 'images_index').strip() or None
+            if configparser.has_option('main', 'status_db'):
+                    self.status_db = configparser.get(
+                        'main', 'status_db').strip() or None
+            if configparser.has_option('main', 'staging_dir'):
+                    self.staging_dir = configparser.get(
+                        'main', 'staging_dir').strip() or None
+            if configparser.has_option('main', 'staging_mb'):
+                    self.staging_mb = configparser.getint('main',
+                                                          'staging_mb')
+            if configparser.has_option('main', 'image_source'):
+                    self.image_source = configparser.get(
+                        'main', 'image_source').strip()
+                    if self.image_source not in image_sources:
+                        msg = 'image_source must be one of: ' +\
+                            ', '.join(image_sources)
+                        self.logger.error(msg)
+                        raise Exception(msg)
+                    if self.image_source == 'remote' and \
+                            not self.staging_dir:
+                        msg = 'staging_dir is required with image_source '\
+                            '= remote'
+                        self.logger.error(msg)
+                        raise Exception(msg)
+            if configparser.has_option('main', 'scheduler_policy'):
+                    self.scheduler_policy = configparser.get(
+                        'main', 'scheduler_policy').strip()
+                    if self.scheduler_policy not in scheduler_policies:
+                        msg = 'scheduler_policy must be one of: ' +\
+                            ', '.join(scheduler_policies)
+                        self.logger.error(msg)
+                        raise Exception(msg)
+
+            if configparser.has_option('main', 'relays'):
+                for pair in configparser.getlist('main', 'relays'):
+                    parts = list(x.strip() for x in pair.split('='))
+                    if len(parts) != 2 or not all(parts):
+                        msg = 'Invalid relay {0}: the format is '\
+                            'destination=source'.format(pair)
+                        self.logger.error(msg)
+                        raise Exception(msg)
+                    # normalization, omit master: preffix
+                    (dest, source) = list(
+                        x[len('master:'):] if x.startswith('master:') else x
+                        for x in parts)
+                    self.relays[dest] = source
+                for dest in self.relays:
+                    visited = set([dest])
+                    source = self.relays[dest]
+                    while source in self.relays and source not in visited:
+                        visited.add(source)
+                        source = self.relays[source]
+                    if source in visited:
+                        msg = 'relays contains a cycle with the region ' +\
+                            dest
+                        self.logger.error(msg)
+                        raise Exception(msg)
 
             for section in configparser.sections():
                 if section == 'main' or section == 'DEFAULTS':
@@ -201,6 +308,21 @@ class GlanceSyncConfig(object):
                     if len(cond.strip()):
                         target['metadata_condition'] = compile(
                             cond, 'metadata_condition', 'eval')
+                if configparser.has_option(section, 'metadata_filter'):
+                    cond = configparser.get(section, 'metadata_filter')
+                    if len(cond.strip()):
+                        if 'metadata_condition' in target:
+                            msg = 'metadata_condition and metadata_filter '\
+                                'are incompatible (target ' + section + ')'
+                            self.logger.error(msg)
+                            raise Exception(msg)
+                        try:
+                            target['metadata_filter'] = MetadataFilter(cond)
+                        except ValueError, e:
+                            msg = 'Invalid metadata_filter in target ' +\
+                                section + ': ' + str(e)
+                            self.logger.error(msg)
+                            raise Exception(msg)
 
                 target['metadata_set'] = configparser.getset(
                     section, 'metadata_set')
@@ -224,6 +346,38 @@ class GlanceSyncConfig(object):
                 target['use_keystone_v3'] = configparser.getboolean(
                     section, 'use_keystone_v3')
 
+                target['upload_workers'] = configparser.getint(
+                    section, 'upload_workers')
+
+                target['glance_api_version'] = configparser.getint(
+                    section, 'glance_api_version')
+                if target['glance_api_version'] not in (1, 2):
+                    msg = 'glance_api_version must be 1 or 2'
+                    self.logger.error(msg)
+                    raise Exception(msg)
+
+                target['transfer_mode'] = configparser.get(
+                    section, 'transfer_mode').strip()
+                if target['transfer_mode'] not in transfer_modes:
+                    msg = 'transfer_mode must be one of: ' +\
+                        ', '.join(transfer_modes)
+                    self.logger.error(msg)
+                    raise Exception(msg)
+                target['copy_from_url'] = configparser.get(
+                    section, 'copy_from_url').strip()
+                if target['transfer_mode'] == 'copy_from' and\
+                        not target['copy_from_url']:
+                    msg = 'copy_from_url is required with transfer_mode = '\
+                        'copy_from'
+                    self.logger.error(msg)
+                    raise Exception(msg)
+                target['copy_from_timeout'] = configparser.getint(
+                    section, 'copy_from_timeout')
+                target['location_url'] = configparser.get(
+                    section, 'location_url').strip()
+                target['adopt_images'] = configparser.getboolean(
+                    section, 'adopt_images')
+
         # Default configuration if it is not present
         if self.master_region is None:
             if 'OS_REGION_NAME' in os.environ:
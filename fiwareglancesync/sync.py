@@ -27,11 +27,13 @@ import sys
 import StringIO
 import os
 import os.path
+import csv
 import datetime
 import argparse
 import logging
 
 from fiwareglancesync.glancesync import GlanceSync
+from fiwareglancesync.glancesync_plan import dump_plans, load_plans
 
 
 class Sync(object):
@@ -95,8 +97,23 @@ class Sync(object):
         os.mkdir('sync_' + datestr)
         children = dict()
 
+        # update the index of images_dir before forking, so the children
+        # share it
+        self.glancesync.refresh_images_index()
+
         for region in self.regions:
             try:
+                # filter the master images before forking, so the child
+                # shares them. A region whose images cannot be filtered is
+                # skipped, the others are synchronised.
+                try:
+                    self.glancesync.images_to_sync(region)
+                except Exception, e:
+                    msg = 'Cannot filter the master images of region {0}. '\
+                        'Cause: {1}'.format(region, str(e))
+                    self.glancesync.log.error(msg)
+                    continue
+
                 if len(children) >= max_children:
                     self._wait_child(children)
 
@@ -150,6 +167,107 @@ class Sync(object):
                 # try next region
                 continue
 
+    def fanout_sync(self, dry_run=False):
+        """Run the synchronisation of all the regions at the same time, but
+        reading only once each image: its content is streamed simultaneously
+        to all the regions where it must be uploaded.
+
+        :param dry_run: if true, do not synchronise images actually
+        """
+        msg = '======Master is ' + self.glancesync.master_region
+        print(msg)
+        sys.stdout.flush()
+        failed = self.glancesync.sync_regions_fanout(self.regions,
+                                                     dry_run=dry_run)
+        self._print_result(failed)
+
+    def scheduled_sync(self, dry_run=False):
+        """Run the synchronisation of all the regions at the same time, with
+        a global scheduler that limits the bandwidth and the simultaneous
+        uploads (see bandwidth_mb, max_uploads and scheduler_policy in the
+        main section of the configuration)
+
+        :param dry_run: if true, do not synchronise images actually
+        """
+        msg = '======Master is ' + self.glancesync.master_region
+        print(msg)
+        sys.stdout.flush()
+        failed = self.glancesync.sync_regions_scheduled(self.regions,
+                                                        dry_run=dry_run)
+        self._print_result(failed)
+
+    def sync_images(self, names, dry_run=False):
+        """Synchronise only the specified images (and the kernel and ramdisk
+        images they refer) in all the regions at the same time.
+
+        :param names: a list with the names of the master images
+        :param dry_run: if true, do not synchronise images actually
+        """
+        msg = '======Master is ' + self.glancesync.master_region
+        print(msg)
+        sys.stdout.flush()
+        failed = self.glancesync.sync_images(names, self.regions,
+                                             dry_run=dry_run)
+        self._print_result(failed)
+
+    def _print_result(self, failed):
+        """print the result of the synchronisation of each region
+
+        :param failed: the list of regions that failed
+        """
+        for region in self.regions:
+            if region in failed:
+                msg = 'Region {0} has finished with errors'
+            else:
+                msg = 'Region {0} has finished'
+            print(msg.format(region))
+        sys.stdout.flush()
+
+    def write_plans(self, path):
+        """Compute the synchronisation plan of each region and write all of
+        them to a JSON file, without modifying any region. The plans can be
+        executed later with apply_plans.
+
+        :param path: the file where the plans are written
+        """
+        plans = list()
+        for region in self.regions:
+            try:
+                plan = self.glancesync.plan_region(region)
+            except Exception:
+                # Don't do anything. Message has been already printed
+                # try next region
+                continue
+            plans.append(plan)
+            msg = '{0}: {1} operations, MBs pending: {2}'
+            print(msg.format(region, len(plan.operations()),
+                             plan.total_bytes() / 1024 / 1024))
+        with open(path, 'w') as f:
+            dump_plans(plans, f)
+
+    def apply_plans(self, path, dry_run=False):
+        """Execute sequentially the plans of a JSON file created by
+        write_plans. The regions are not listed again.
+
+        :param path: the file where the plans are read
+        :param dry_run: if true, do not synchronise images actually
+        """
+        with open(path) as f:
+            plans = load_plans(f)
+        msg = '======Master is ' + self.glancesync.master_region
+        print(msg)
+
+        for plan in plans:
+            try:
+                msg = "======" + plan.region
+                print(msg)
+                sys.stdout.flush()
+                self.glancesync.execute_plan(plan, dry_run=dry_run)
+            except Exception:
+                # Don't do anything. Message has been already printed
+                # try next region
+                continue
+
     def _wait_child(self, children):
         """ Wait until one of the regions ends its synchronisation and then
         print the result
@@ -210,6 +328,43 @@ class Sync(object):
                 continue
 
 
+def show_stored_status(regions, override_d=None):
+    """Print the synchronisation status of the regions saved in status_db,
+    without listing the glance servers.
+
+    :param regions: the regions to show; 'target:' means all the regions of
+      the target in the database. By default, all the regions in the
+      database.
+    :param override_d: the options to override in the configuration
+    :return: False if status_db is not configured
+    """
+    GlanceSync.init_logs()
+    store = GlanceSync.get_status_store(options_dict=override_d)
+    if store is None:
+        return False
+    stored = store.get_regions()
+    if not regions:
+        regions = stored
+    else:
+        regions_expanded = list()
+        for region in regions:
+            if region == 'master:':
+                regions_expanded.extend(r for r in stored if ':' not in r)
+            elif region.endswith(':'):
+                regions_expanded.extend(r for r in stored
+                                        if r.startswith(region))
+            else:
+                regions_expanded.append(region)
+        regions = regions_expanded
+    writer = csv.writer(sys.stdout)
+    for region in regions:
+        for row in store.get_region(region):
+            checked = datetime.datetime.utcfromtimestamp(row['checked'])
+            writer.writerow([row['status'], row['region'], row['name'],
+                             checked.strftime('%Y-%m-%dT%H:%M:%SZ')])
+    return True
+
+
 if __name__ == '__main__':
     # Parse cmdline
     description = 'A tool to sync images from a master region to other '\
@@ -222,6 +377,19 @@ if __name__ == '__main__':
     parser.add_argument('--parallel', action='store_true',
                         help='sync several regions in parallel')
 
+    parser.add_argument(
+        '--fanout', action='store_true',
+        help='sync all the regions at the same time, reading each image once')
+
+    parser.add_argument(
+        '--scheduled', action='store_true',
+        help='sync all the regions at the same time, limiting the bandwidth')
+
+    parser.add_argument(
+        '--image', metavar='NAME', action='append',
+        help='sync only this image (and its kernel and ramdisk) in all the '
+             'regions at the same time. It may be repeated.')
+
     parser.add_argument(
         '--config', nargs='+', help='override configuration options. (e.g. ' +
         "main.master_region=Valladolid metadata_condition='image.name=name1')")
@@ -234,6 +402,11 @@ if __name__ == '__main__':
     group.add_argument('--show-status', action='store_true',
                        help='do not sync, but show the synchronisation status')
 
+    group.add_argument(
+        '--show-stored-status', action='store_true',
+        help='do not sync, but show the synchronisation status saved in '
+             'status_db, without contacting the glance servers')
+
     group.add_argument('--show-regions', action='store_true',
                        help='don not sync, only show the available regions')
 
@@ -241,6 +414,16 @@ if __name__ == '__main__':
         '--make-backup', action='store_true',
         help="do no sync, make a backup of the regions' metadata")
 
+    group.add_argument(
+        '--plan-out', metavar='FILE',
+        help='do not sync, but write the operations to sync the regions to a '
+             'JSON file')
+
+    parser.add_argument(
+        '--apply', metavar='FILE',
+        help='sync executing the operations of a file created with '
+             '--plan-out, instead of comparing the regions again')
+
     meta = parser.parse_args()
     options = dict()
 
@@ -252,13 +435,28 @@ if __name__ == '__main__':
                 sys.exit(-1)
             options[pair[0].strip()] = pair[1]
 
+    if meta.show_stored_status:
+        if not show_stored_status(meta.regions, options):
+            parser.error('status_db is not set in the configuration')
+        sys.exit(0)
+
     # Run cmd
     sync = Sync(meta.regions, options)
 
     if meta.show_status:
         sync.report_status()
+    elif meta.plan_out:
+        sync.write_plans(meta.plan_out)
+    elif meta.apply:
+        sync.apply_plans(meta.apply, meta.dry_run)
+    elif meta.image:
+        sync.sync_images(meta.image, meta.dry_run)
     elif meta.parallel:
         sync.parallel_sync()
+    elif meta.fanout:
+        sync.fanout_sync(meta.dry_run)
+    elif meta.scheduled:
+        sync.scheduled_sync(meta.dry_run)
     elif meta.show_regions:
         sync.show_regions()
     elif meta.make_backup:
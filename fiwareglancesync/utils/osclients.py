@@ -23,6 +23,7 @@
 # contact with opensource@tid.es
 #
 from os import environ as env
+import threading
 
 from keystoneclient.auth.identity import v2, v3
 from keystoneclient import session
@@ -90,6 +91,13 @@ class OpenStackClients(object):
         self._session_v3 = None
         self._saved_session_v2 = None
         self._saved_session_v3 = None
+        # the sessions are created lazily, maybe by several threads
+        self._session_lock = threading.Lock()
+
+        # clients cached by (service, region, keystone version, version). See
+        # get_glanceclient
+        self._clients = dict()
+        self._clients_lock = threading.Lock()
 
         if 'OS_USERNAME' in env:
             self.__username = env['OS_USERNAME']
@@ -218,6 +226,7 @@ class OpenStackClients(object):
         if self._session_v3:
             self._session_v3.invalidate()
             self._session_v3 = None
+        self._invalidate_clients()
 
     def set_region(self, region):
         """Set the region. By default this datum is filled in the constructor
@@ -237,8 +246,16 @@ class OpenStackClients(object):
         :param use_v3: True to use v3 version, False to use v2 version.
         :return: nothing
         """
+        if use_v3 != self.use_v3:
+            self._invalidate_clients()
         self.use_v3 = use_v3
 
+    def _invalidate_clients(self):
+        """Discard the cached clients (e.g. because the session has changed)
+        """
+        with self._clients_lock:
+            self._clients.clear()
+
     def get_session(self):
         """Return the session object. This method is called automatically at
         invoking get_novaclient, get_glanceclient, get_cinderclient,
@@ -272,6 +289,13 @@ class OpenStackClients(object):
         if self._session_v2:
             return self._session_v2
 
+        with self._session_lock:
+            if not self._session_v2:
+                self._session_v2 = self._create_session_v2()
+            return self._session_v2
+
+    def _create_session_v2(self):
+        """Return a new v2 session"""
         if not self.auth_url:
             m = 'auth_url parameter must be provided or OS_AUTH_URL be defined'
             raise Exception(m)
@@ -300,8 +324,7 @@ class OpenStackClients(object):
             password=self.__password,
             **other_params)
 
-        self._session_v2 = session.Session(auth=auth)
-        return self._session_v2
+        return session.Session(auth=auth)
 
     def get_session_v3(self):
         """Get a v3 session. See get_session for more details about sessions
@@ -311,6 +334,13 @@ class OpenStackClients(object):
         if self._session_v3:
             return self._session_v3
 
+        with self._session_lock:
+            if not self._session_v3:
+                self._session_v3 = self._create_session_v3()
+            return self._session_v3
+
+    def _create_session_v3(self):
+        """Return a new v3 session"""
         if not self.auth_url:
             m = 'auth_url parameter must be provided or OS_AUTH_URL be defined'
             raise Exception(m)
@@ -340,8 +370,7 @@ class OpenStackClients(object):
             project_domain_name='default', user_domain_name='default',
             **other_params)
 
-        self._session_v3 = session.Session(auth=auth)
-        return self._session_v3
+        return session.Session(auth=auth)
 
     def get_neutronclient(self):
         """Get a neutron client. A neutron client is different for each region
@@ -423,11 +452,17 @@ class OpenStackClients(object):
             session=self.get_session(), region_name=self.region,
             service_type='volume')
 
-    def get_glanceclient(self):
+    def get_glanceclient(self, region=None, version='1', timeout=None):
         """Get a glance client. A client is different for each region
         (although all clients share the same session and it is possible to have
          simultaneously clients to several regions).
 
+         The glance client does not use the session, but the token and its own
+         HTTP connections. Therefore the client of each region is cached
+         and reused, to keep alive its connections, while the token of the
+         session does not change. The cached clients are discarded when
+         calling set_credential.
+
          Before calling this method, the credential must be provided. The
          constructor obtain the credential for environment variables if present
          but also the method set_credential is available.
@@ -435,15 +470,33 @@ class OpenStackClients(object):
          Be aware that calling the method set_credential invalidate the old
          session if already existed and therefore can affect the old clients.
 
+        :param region: the region of the client. If omitted, the region set
+         with set_region. Passing the region is safer when the object is
+         shared by several threads.
+        :param version: the version of the glance API (1 or 2)
+        :param timeout: the socket timeout of the client, in seconds. By
+         default, the timeout of glanceclient. The clients with different
+         timeouts are cached separately.
         :return: a glance client valid for a region.
         """
         self._require_module('glance')
+        if region is None:
+            region = self.region
         session = self.get_session()
         token = session.get_token()
-        endpoint = session.get_endpoint(service_type='image',
-                                        region_name=self.region)
-        return self._modules_imported['glance'].Client(
-            version='1', endpoint=endpoint, token=token)
+        key = ('glance', region, self.use_v3, str(version), timeout)
+        with self._clients_lock:
+            if key in self._clients and self._clients[key][0] == token:
+                return self._clients[key][1]
+            endpoint = session.get_endpoint(service_type='image',
+                                            region_name=region)
+            kwargs = dict()
+            if timeout is not None:
+                kwargs['timeout'] = timeout
+            client = self._modules_imported['glance'].Client(
+                version=str(version), endpoint=endpoint, token=token, **kwargs)
+            self._clients[key] = (token, client)
+            return client
 
     def get_swiftclient(self):
         self._require_module('swift')
@@ -625,6 +678,7 @@ class OpenStackClients(object):
         self._saved_session_v3 = self._session_v3
         self._session_v2 = None
         self._session_v3 = None
+        self._invalidate_clients()
 
     def restore_session(self, swap=False):
         """Restore the session saved with preserve_session.
@@ -648,6 +702,7 @@ class OpenStackClients(object):
                 self._session_v3.invalidate()
             self._session_v2 = self._saved_session_v2
             self._session_v3 = self._saved_session_v3
+        self._invalidate_clients()
 
 
 # create an object. This allows using this methods easily with
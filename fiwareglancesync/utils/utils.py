@@ -53,6 +53,7 @@ class Image:
     status: Status of the synchronization of the images
        (see https://github.com/telefonicaid/fiware-glancesync#checking-status for more information).
     message = Error message of the synchronization or null if all was ok.
+    checked = Time of the last verification of the status (e.g. "2016-05-10T10:33:20Z") or null if it is unknown.
     glancestatus = GlanceSync synchronization status
     """
 
@@ -60,36 +61,42 @@ class Image:
     name = None     # Ex name = "base_ubuntu_14.04",
     status = None   # Ex status = "ok",
     message = None  # Ex message = "Unexpected error in the synchronization of the image",
+    checked = None  # Ex checked = "2016-05-10T10:33:20Z"
 
     # Constants associated to the glancesync status
     OK = 'ok'
     OK_STALLED_CHECKSUM = 'ok_stalled_checksum'
     ERROR_CHECKSUM = 'error_checksum'
     ERROR_AMI = 'error_ami'
+    ERROR_FILE = 'error_file'
     PENDING_METADATA = 'pending_metadata'
     PENDING_UPLOAD = 'pending_upload'
     PENDING_REPLACE = 'pending_replace'
     PENDING_RENAME = 'pending_rename'
     PENDING_AMI = 'pending_ami'
+    PENDING_ADOPT = 'pending_adopt'
 
     # GlanceSync synchronization status
     glancestatus = {'ok', 'ok_stalled_checksum',
-                    'error_checksum', 'error_ami',
-                    'pending_metadata', 'pending_upload', 'pending_replace', 'pending_rename', 'pending_ami'}
+                    'error_checksum', 'error_ami', 'error_file',
+                    'pending_metadata', 'pending_upload', 'pending_replace', 'pending_rename', 'pending_ami',
+                    'pending_adopt'}
 
-    def __init__(self, identifier, name, status, message):
+    def __init__(self, identifier, name, status, message, checked=None):
         """
         Default constructor of the class.
         :param identifier: Id of the image.
         :param name: Name of the image.
         :param status: Status of the synchronization process.
         :param message: Message about the proccess if something was wrong.
+        :param checked: Time of the last verification of the status.
         :return:
         """
         self.id = identifier
         self.name = name
         self.status = status
         self.message = message
+        self.checked = checked
 
     def check_status(self):
         if self.status not in self.glancestatus:
@@ -103,6 +110,7 @@ class Image:
         expectedvalue = [self.id, self.name, self.status, self.message]
 
         my_dict = fifo(expectedkey, expectedvalue)
+        my_dict['checked'] = self.checked
 
         return my_dict.dump()
 
@@ -118,10 +126,11 @@ class Images:
         self.number_of_images = 0
         self.images = []
 
-    def add(self, data):
+    def add(self, data, checked=None):
         """
         Add a new Image to the array.
         :param data: Data array to use in the constructor of the Image.
+        :param checked: Time of the last verification of the status.
         """
         if len(data) != 4:
             raise ValueError("Error, data should be a array with len equal to 4")
@@ -129,7 +138,8 @@ class Images:
             tmp = Image(identifier=data[0],
                         name=data[1],
                         status=data[2],
-                        message=data[3])
+                        message=data[3],
+                        checked=checked)
 
             self.images.append(tmp)
 
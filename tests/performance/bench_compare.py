@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+
+"""Benchmark of GlanceSyncImage.compare_with_masterregion: compare the
+former property by property comparison with the current one, done as
+GlanceSyncRegion.image_list_to_sync does: it compares the fingerprints of
+the images, computed the first time and then cached.
+
+All the images of the regions are synchronised (the usual case). The cold
+pass compares new objects (e.g. a cron run), including calculating the
+fingerprints; the warm pass compares the same objects again (e.g. the plan
+and then the status of a region).
+
+Usage: python -m tests.performance.bench_compare [images] [regions]
+    [properties]
+"""
+
+import copy
+import gc
+import sys
+import time
+
+from fiwareglancesync.glancesync_image import GlanceSyncImage
+
+
+def legacy_compare(image, master_region_images, user_properties):
+    """The former compare_with_masterregion, that was used with plain
+    dictionaries as user_properties"""
+    if image.name not in master_region_images:
+        return '+'
+    if image.status != 'active':
+        return '$'
+    image_master = master_region_images[image.name]
+    if image_master.checksum != image.checksum:
+        return '!'
+    if image_master.is_public != image.is_public:
+        if not image_master.is_public:
+            return '-'
+        else:
+            return '_'
+    if user_properties and len(user_properties) > 0:
+        for prop in user_properties:
+            if prop == 'kernel_id' or prop == 'ramdisk_id':
+                continue
+            val_m = image_master.user_properties.get(prop, None)
+            val_l = image.user_properties.get(prop, None)
+            if val_m != val_l:
+                return '#'
+        kernelid_in_region = 'kernel_id' in image.user_properties
+        kernelid_in_master = 'kernel_id' in image_master.user_properties
+        ramdiskid_in_region = 'ramdisk_id' in image.user_properties
+        ramdiskid_in_master = 'ramdisk_id' in image_master.user_properties
+        if kernelid_in_region != kernelid_in_master or \
+                ramdiskid_in_region != ramdiskid_in_master:
+            return '#'
+    else:
+        if len(image.user_properties) != len(image_master.user_properties):
+            return '#'
+        for prop in image.user_properties:
+            if prop == 'kernel_id' or prop == 'ramdisk_id':
+                continue
+            val_m = image_master.user_properties.get(prop, None)
+            val_l = image.user_properties.get(prop, None)
+            if val_m != val_l:
+                return '#'
+    return ''
+
+
+def current_compare(image, master_region_images, user_properties):
+    """The comparison of GlanceSyncRegion.image_list_to_sync"""
+    if image.status == 'active' and image.fingerprint(user_properties) == \
+            master_region_images[image.name].fingerprint(user_properties):
+        return ''
+    return image.compare_with_masterregion(master_region_images,
+                                           user_properties)
+
+
+def create_images(n_images, n_properties, plain):
+    """Return the master images, indexed by name. If plain, their
+    user_properties are dictionaries, as in the former GlanceSyncImage"""
+    images = dict()
+    for i in range(n_images):
+        properties = dict(('prop' + str(p), 'value' + str(i))
+                          for p in range(n_properties))
+        name = 'image' + str(i)
+        images[name] = GlanceSyncImage(
+            name, str(i), 'Master', 'tenantid', True, '{0:032x}'.format(i),
+            1024, 'active', properties)
+        if plain:
+            images[name].user_properties = properties
+    return images
+
+
+def measure(compare, n_images, n_regions, n_properties, plain=False,
+            repeat=5):
+    """Return the seconds of the cold and the warm pass (the best of
+    repeat)"""
+    metadata_set = frozenset('prop' + str(p) for p in range(n_properties))
+    result = [float('inf')] * 2
+    for i in range(repeat):
+        master = create_images(n_images, n_properties, plain)
+        regions = list(copy.deepcopy(master).values()
+                       for r in range(n_regions))
+        gc.disable()
+        try:
+            for run in range(2):
+                start = time.time()
+                for images in regions:
+                    for image in images:
+                        assert compare(image, master, metadata_set) == ''
+                result[run] = min(result[run], time.time() - start)
+        finally:
+            gc.enable()
+    return result
+
+
+def main(n_images=2000, n_regions=20, n_properties=8):
+    legacy = measure(legacy_compare, n_images, n_regions, n_properties,
+                     plain=True)
+    current = measure(current_compare, n_images, n_regions, n_properties)
+    msg = '{0} images in {1} regions, {2} properties in metadata_set'
+    print(msg.format(n_images, n_regions, n_properties))
+    print('                 cold      warm')
+    print('former:  {0:8.3f}s {1:8.3f}s'.format(*legacy))
+    print('current: {0:8.3f}s {1:8.3f}s'.format(*current))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+"""Benchmark of the filter of the master images to synchronise: compare
+calling GlanceSyncRegion.images_to_sync_dict for each region (the former
+implementation) with GlanceSync.images_to_sync, that filters the master
+images once by target, using either metadata_condition or metadata_filter.
+With several targets, metadata_filter is evaluated with an index of the
+properties of the master images shared by all of them.
+
+The catalog is synthetic, in the mock of the glance servers. The regions are
+distributed among the targets.
+
+Usage: python -m tests.performance.bench_filter [regions] [images] [targets]
+"""
+
+import gc
+import os
+import sys
+import time
+import StringIO
+
+from fiwareglancesync.glancesync import GlanceSync
+from fiwareglancesync.glancesync_image import GlanceSyncImage
+from fiwareglancesync.glancesync_region import GlanceSyncRegion
+from fiwareglancesync.glancesync_serverfacade_mock import ServersFacade
+
+main_section = """
+[main]
+master_region = Master
+"""
+
+target_section = """
+[{0}]
+credential = user,ZmFrZXBhc3N3b3JkLG9mY291cnNl,http://server:4730/v2.0,tenant
+metadata_set = type, nid
+{1}
+"""
+
+# the same condition, as python code and with the declarative filter
+condition = "metadata_condition = image.is_public and 'nid' in "\
+    "image.user_properties and image.user_properties.get('type') == "\
+    "'baseimage'"
+metadata_filter = 'metadata_filter = public and has nid and type == baseimage'
+
+
+def create_catalog(n_images):
+    """Return a dictionary of synthetic master images, indexed by UUID"""
+    images = dict()
+    for i in range(n_images):
+        if i % 2:
+            user_properties = {'type': 'baseimage', 'nid': str(i)}
+        else:
+            user_properties = {'type': 'ngimages', 'nid': str(i)}
+        image = GlanceSyncImage(
+            'image' + str(i), str(i), 'Master', 'tenantid', i % 3 != 0,
+            'checksum' + str(i), 1024 * i, 'active', user_properties)
+        images[image.id] = image
+    return images
+
+
+def create_glancesync(targets, option):
+    """Return a GlanceSync object with the targets master, target1...
+    configured with the option"""
+    config = main_section + ''.join(
+        target_section.format(name, option) for name in targets)
+    return GlanceSync(StringIO.StringIO(config))
+
+
+def measure(function, regions):
+    """Call the function with each region and return the time in ms. The
+    garbage collector is disabled to reduce the noise."""
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.time()
+        for region in regions:
+            function(region)
+        return (time.time() - start) * 1000.0
+    finally:
+        gc.enable()
+
+
+def main(n_regions=20, n_images=10000, n_targets=1):
+    os.environ['GLANCESYNC_USE_MOCK'] = 'True'
+    ServersFacade.images['Master'] = create_catalog(n_images)
+    targets = ['master'] + list('target' + str(i)
+                                for i in range(1, n_targets))
+    regions = list('{0}:Region{1}'.format(targets[i % n_targets], i)
+                   for i in range(n_regions))
+
+    glancesync = create_glancesync(targets, condition)
+    glancesync_filter = create_glancesync(targets, metadata_filter)
+
+    def filter_by_region(region):
+        GlanceSyncRegion(region, glancesync.targets).images_to_sync_dict(
+            glancesync.master_region_dict)
+    by_region = measure(filter_by_region, regions)
+    by_target = measure(glancesync.images_to_sync, regions)
+    with_filter = measure(glancesync_filter.images_to_sync, regions)
+
+    print('{0} regions, {1} targets, {2} master images'.format(
+        n_regions, n_targets, n_images))
+    print('metadata_condition, filter by region: {0:8.2f} ms'.format(
+        by_region))
+    print('metadata_condition, filter by target: {0:8.2f} ms'.format(
+        by_target))
+    print('metadata_filter, filter by target:    {0:8.2f} ms'.format(
+        with_filter))
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+"""Benchmark of the memory used by the image lists: compare the former
+GlanceSyncImage (an object with __dict__ that keeps the whole object
+returned by the glance server) with the current one (__slots__, only the
+needed fields of raw and the region, owner and status shared).
+
+The images are built as in ServersFacadeV2, from the JSON of a synthetic
+glance response. The memory is the size of all the objects reachable from
+the images, counting only once the shared objects.
+
+Usage: python -m tests.performance.bench_image_memory [images] [regions]
+"""
+
+import copy
+import json
+import sys
+
+from fiwareglancesync.glancesync_image import GlanceSyncImage
+from fiwareglancesync.glancesync_serversfacade import _v2_schema_fields
+
+_template = {
+    'status': 'active', 'name': None, 'tags': [],
+    'container_format': 'bare', 'created_at': '2016-05-10T10:32:51Z',
+    'disk_format': 'qcow2', 'updated_at': '2016-05-10T10:33:20Z',
+    'visibility': 'public', 'self': None, 'min_disk': 0, 'protected': False,
+    'id': None, 'file': None, 'checksum': None,
+    'owner': '00000000000000000000000000000001', 'size': None,
+    'min_ram': 0, 'schema': '/v2/schemas/image', 'virtual_size': None,
+    'direct_url': None, 'type': 'baseimage', 'nid': None,
+    'sdc_aware': 'true', 'nid_version': '1'}
+
+
+class LegacyImage(object):
+    """The former GlanceSyncImage, with only its constructor"""
+
+    def __init__(self, name, id, region, owner=None, is_public=True,
+                 checksum=None, size=0, status=None, user_properties=None,
+                 raw=None):
+        self.name = name
+        self.id = id
+        self.region = region
+        self.is_public = is_public
+        self.checksum = checksum
+        self.raw = raw
+        self.size = int(size)
+        self.status = status
+        self.owner = owner
+        if user_properties is not None:
+            self.user_properties = copy.copy(user_properties)
+        else:
+            self.user_properties = dict()
+
+
+def glance_response(region, n_images):
+    """Return the images of a region as decoded by the glance client"""
+    images = list()
+    for i in range(n_images):
+        image = dict(_template)
+        image_id = '{0:08d}-0000-0000-0000-{1:012d}'.format(region, i)
+        image.update({'name': 'image' + str(i), 'id': image_id,
+                      'self': '/v2/images/' + image_id,
+                      'file': '/v2/images/' + image_id + '/file',
+                      'checksum': '{0:032x}'.format(i),
+                      'size': 1073741824 + i, 'nid': str(i),
+                      'direct_url': 'rbd://images/' + image_id})
+        images.append(json.dumps(image))
+    return list(json.loads(image) for image in images)
+
+
+def create_images(image_class, region, raws):
+    """Build the images like _v2_to_glancesyncimage"""
+    result = list()
+    for raw in raws:
+        user_properties = dict((key, value) for (key, value) in raw.items()
+                               if key not in _v2_schema_fields)
+        result.append(image_class(
+            raw['name'], raw['id'], region, raw.get('owner', None),
+            raw.get('visibility', None) == 'public', raw.get('checksum'),
+            raw.get('size', None) or 0, raw['status'], user_properties, raw))
+    return result
+
+
+def deep_size(obj, seen):
+    """Return the size of obj and the objects reachable from it that are not
+    in seen"""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen)
+                    for (key, value) in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += deep_size(obj.__dict__, seen)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_size(getattr(obj, key), seen)
+                    for key in obj.__slots__)
+    return size
+
+
+def measure(image_class, n_images, n_regions):
+    """Return the memory of the images of all the regions, in MB"""
+    images = list()
+    for region in range(n_regions):
+        raws = glance_response(region, n_images // n_regions)
+        # the name of the region is a new string for each list, as when it
+        # is read from the configuration or the keystone catalog
+        images.extend(create_images(
+            image_class, ''.join('Region' + str(region)), raws))
+    return deep_size(images, set()) / 1024.0 / 1024.0
+
+
+def main(n_images=100000, n_regions=20):
+    legacy = measure(LegacyImage, n_images, n_regions)
+    current = measure(GlanceSyncImage, n_images, n_regions)
+    print('{0} images in {1} regions'.format(n_images, n_regions))
+    print('former GlanceSyncImage:  {0:8.1f} MB'.format(legacy))
+    print('current GlanceSyncImage: {0:8.1f} MB'.format(current))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
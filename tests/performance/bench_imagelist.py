@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+"""Benchmark of ServersFacade.get_imagelist: compare the former
+implementation (a new multiprocessing.Pool(1) by call, with the image list
+pickled through a pipe) with the current one (a thread pool shared by the
+process).
+
+The glance client is replaced by a fake returning a list of images, so the
+benchmark measures only the overhead of the timeout mechanism.
+
+Usage: python -m tests.performance.bench_imagelist [calls] [images]
+"""
+
+import sys
+import time
+from multiprocessing import Pool
+from mock import patch
+
+from fiwareglancesync import glancesync_serversfacade
+from fiwareglancesync.glancesync_serversfacade import ServersFacade
+from fiwareglancesync.glancesync_region import GlanceSyncRegion
+
+
+class FakeImage(object):
+    """Image as returned by the glance client"""
+    def __init__(self, i):
+        self.raw = {'name': 'image' + str(i), 'id': str(i),
+                    'owner': 'tenant', 'is_public': True,
+                    'checksum': 'checksum' + str(i), 'size': 1024 * i,
+                    'status': 'active',
+                    'properties': {'type': 'baseimage', 'nid': str(i)}}
+
+    def to_dict(self):
+        return self.raw
+
+
+class FakeImageManager(object):
+    def __init__(self, images):
+        self.images = images
+
+    def list(self):
+        return iter(self.images)
+
+
+class FakeGlanceClient(object):
+    """Glance client; it must be pickable to be used with the legacy pool"""
+    def __init__(self, images):
+        self.images = FakeImageManager(images)
+
+
+def legacy_call(function, args, timeout):
+    """Reproduce the previous behaviour: a pool of processes by call"""
+    return Pool(1).apply_async(function, args).get(timeout=timeout)
+
+
+def run(facade, region, calls):
+    start = time.time()
+    for i in range(calls):
+        facade.get_imagelist(region)
+    return (time.time() - start) * 1000.0 / calls
+
+
+def main(calls=50, n_images=200):
+    client = FakeGlanceClient([FakeImage(i) for i in range(n_images)])
+    target = {'target_name': 'master', 'tenant': 'tenant', 'user': 'user',
+              'password': 'password', 'keystone_url': 'http://keystone',
+              'user_properties_filter': set(), 'list_images_timeout': 30}
+    with patch('fiwareglancesync.glancesync_serversfacade.OpenStackClients'):
+        facade = ServersFacade(target)
+    facade.osclients.get_glanceclient.return_value = client
+    region = GlanceSyncRegion('master:Region', {'master': target})
+
+    with patch('fiwareglancesync.glancesync_serversfacade._call_with_timeout',
+               legacy_call):
+        legacy = run(facade, region, calls)
+    shared = run(facade, region, calls)
+    print('{0} calls, {1} images by list'.format(calls, n_images))
+    print('process pool by call: {0:8.2f} ms/call'.format(legacy))
+    print('shared thread pool:   {0:8.2f} ms/call'.format(shared))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
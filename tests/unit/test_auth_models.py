@@ -67,6 +67,16 @@ class TestImage(TestCase):
 
         self.assertEqual(temp.status, Image.ERROR_CHECKSUM, 'The status is not the same')
 
+    def test_check_status_ERROR_FILE(self):
+        """
+        Check that we create an image object with a correct status.
+        :return:
+        """
+        temp = Image(identifier='an id', name='fake name', status=Image.ERROR_FILE, message='fake message')
+
+        self.assertEqual(temp.status, Image.ERROR_FILE, 'The status is not the same')
+        self.assertTrue(temp.check_status())
+
     def test_check_status_PENDING_METADATA(self):
         """
         Check that we create an image object with a correct status.
@@ -103,6 +113,16 @@ class TestImage(TestCase):
 
         self.assertEqual(temp.status, Image.PENDING_UPLOAD, 'The status is not the same')
 
+    def test_check_status_PENDING_ADOPT(self):
+        """
+        Check that we create an image object with a correct status.
+        :return:
+        """
+        temp = Image(identifier='an id', name='fake name', status=Image.PENDING_ADOPT, message='fake message')
+
+        self.assertEqual(temp.status, Image.PENDING_ADOPT, 'The status is not the same')
+        self.assertTrue(temp.check_status())
+
     def test_check_status_NOK(self):
         """
         Check that we create an image object with a correct status.
@@ -158,6 +178,18 @@ class TestImages(TestCase):
         self.assertEqual(data['status'], expectedstatus, "The returned JSON is not the expected one")
         self.assertEqual(data['message'], expectedmessage, "The returned JSON is not the expected one")
 
+    def test_check_dump_checked(self):
+        x = Images()
+
+        expectedvalue = ['3cfeaf3f0103b9637bb3fcfe691fce1e', 'base_ubuntu_14.04', 'ok', None]
+        x.add(expectedvalue, checked='2016-05-10T10:33:20Z')
+        x.add(expectedvalue)
+
+        data = json.loads(x.dump())['images']
+
+        self.assertEqual(data[0]['checked'], '2016-05-10T10:33:20Z', "The returned JSON is not the expected one")
+        self.assertEqual(data[1]['checked'], None, "The returned JSON is not the expected one")
+
     def test_check_dump_more_than_one(self):
         x = Images()
 
@@ -68,6 +68,7 @@ class TestController(TestCase):
 
         app.app.config['SQLALCHEMY_DATABASE_URI'] = TEST_SQLALCHEMY_DATABASE_URI
         db.create_all()
+        controller.engine.stop()
 
     def tearDown(self):
         """
@@ -83,6 +84,9 @@ class TestController(TestCase):
         # Delete the SQLite file
         os.remove(db.session.bind.url.database)
 
+        # Discard the GlanceSync object built with the mock
+        controller.engine.stop()
+
     @patch('fiwareglancesync.app.mod_auth.controllers.GlanceSync', auto_spec=True)
     def test_run_in_thread(self, glancesync):
         """
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+from unittest import TestCase
+import time
+from mock import MagicMock
+
+from fiwareglancesync.app.mod_auth.engine import GlanceSyncEngine
+
+
+class TestGlanceSyncEngine(TestCase):
+
+    """
+    Class to test the GlanceSync object shared by the requests of the API.
+    """
+
+    def setUp(self):
+        """
+        Create an engine whose factory returns a new mock each time, without
+        background refresh.
+
+        :return: Nothing.
+        """
+        self.facade = MagicMock()
+        self.factory = MagicMock(side_effect=lambda: MagicMock(targets={'master': {'facade': self.facade}}))
+        self.engine = GlanceSyncEngine(self.factory, refresh=0)
+
+    def tearDown(self):
+        """
+        Stop the engine after each test.
+
+        :return: Nothing.
+        """
+        self.engine.stop()
+
+    def test_get_is_lazy(self):
+        """
+        Check that the GlanceSync object is not built until it is used and that the targets are authenticated.
+
+        :return: Nothing.
+        """
+        self.assertFalse(self.factory.called)
+
+        self.engine.get()
+
+        self.assertEquals(self.factory.call_count, 1)
+        self.assertEquals(self.facade.get_tenant_id.call_count, 1)
+
+    def test_tenant_id(self):
+        """
+        Check that the tenant id of the targets is obtained when the GlanceSync object is built, so the requests do not
+        modify the targets.
+
+        :return: Nothing.
+        """
+        self.facade.get_tenant_id.return_value = 'tenant1'
+
+        glancesync = self.engine.get()
+
+        self.assertEquals(glancesync.targets['master']['tenant_id'], 'tenant1')
+
+    def test_get_returns_same_object(self):
+        """
+        Check that all the requests share the same GlanceSync object.
+
+        :return: Nothing.
+        """
+        glancesync = self.engine.get()
+
+        self.assertIs(self.engine.get(), glancesync)
+        self.assertEquals(self.factory.call_count, 1)
+
+    def test_authentication_error(self):
+        """
+        Check that an error authenticating a target does not prevent building the GlanceSync object.
+
+        :return: Nothing.
+        """
+        self.facade.get_tenant_id.side_effect = Exception('Boom!')
+
+        self.assertIsNotNone(self.engine.get())
+
+    def test_refresh(self):
+        """
+        Check that refresh replaces the GlanceSync object.
+
+        :return: Nothing.
+        """
+        glancesync = self.engine.get()
+
+        self.assertTrue(self.engine.refresh())
+
+        self.assertIsNot(self.engine.get(), glancesync)
+        self.assertEquals(self.factory.call_count, 2)
+
+    def test_refresh_error(self):
+        """
+        Check that the previous GlanceSync object is kept when the refresh fails.
+
+        :return: Nothing.
+        """
+        glancesync = self.engine.get()
+        self.factory.side_effect = Exception('Boom!')
+
+        self.assertFalse(self.engine.refresh())
+
+        self.assertIs(self.engine.get(), glancesync)
+
+    def test_get_status_store(self):
+        """
+        Check that the status store is obtained only once, even when it is not configured.
+
+        :return: Nothing.
+        """
+        function = MagicMock(return_value=None)
+
+        self.assertIsNone(self.engine.get_status_store(function))
+        self.assertIsNone(self.engine.get_status_store(function))
+
+        self.assertEquals(function.call_count, 1)
+
+    def test_stop(self):
+        """
+        Check that stop discards the GlanceSync object, so the next request builds a new one.
+
+        :return: Nothing.
+        """
+        glancesync = self.engine.get()
+
+        self.engine.stop()
+
+        self.assertIsNot(self.engine.get(), glancesync)
+        self.assertEquals(self.factory.call_count, 2)
+
+    def test_background_refresh(self):
+        """
+        Check that the background thread refreshes the GlanceSync object until the engine is stopped.
+
+        :return: Nothing.
+        """
+        engine = GlanceSyncEngine(self.factory, refresh=0.01)
+        glancesync = engine.get()
+
+        for i in range(500):
+            if engine.get() is not glancesync:
+                break
+
+            time.sleep(0.01)
+
+        engine.stop()
+
+        self.assertIsNot(engine.get(), glancesync)
+        engine.stop()
@@ -25,15 +25,26 @@
 import unittest
 import StringIO
 import copy
+import csv
 import hashlib
 import os
 import glob
+import shutil
 import tempfile
+import time
 import logging
+import threading
+import BaseHTTPServer
+import SimpleHTTPServer
+from mock import patch
 
 from fiwareglancesync.glancesync_image import GlanceSyncImage
+from fiwareglancesync.glancesync_region import GlanceSyncRegion
 from fiwareglancesync.glancesync import GlanceSync
+from fiwareglancesync.glancesync_plan import dump_plans, load_plans
+from fiwareglancesync.glancesync_index import ImagesDirIndex
 from fiwareglancesync.glancesync_serverfacade_mock import ServersFacade
+from fiwareglancesync.glancesync_serversfacade import GlanceFacadeChecksumException
 from tests.unit.resources.config import RESOURCESPATH
 from tests.unit.test_getnid import get_path
 
@@ -85,7 +96,7 @@ def dup_images(images, region, prefix, tenant):
         new_image = copy.deepcopy(image)
         new_image.region = region
         new_image.id = prefix + str(count).zfill(2)
-        new_image.tenant = tenant
+        new_image.owner = tenant
         new_images.append(new_image)
         ServersFacade.add_image_to_mock(new_image)
         count += 1
@@ -343,8 +354,10 @@ class TestGlanceSync_Sync(unittest.TestCase):
     the update. Also there are directories .status_pre and .status_post
     with the results of export_sync_region_status before/after the
     synchronisation. In self.path_test optionally is also a configuration
-    file with name 'config'
+    file with name 'config'. The options in self.options_dict override the
+    configuration.
     """
+    options_dict = None
 
     def config(self):
         path = os.path.abspath(os.curdir)
@@ -362,7 +375,7 @@ class TestGlanceSync_Sync(unittest.TestCase):
         else:
             handler = StringIO.StringIO(config1)
         # self.config = GlanceSyncConfig(stream=handler)
-        self.glancesync = GlanceSync(handler)
+        self.glancesync = GlanceSync(handler, self.options_dict)
 
     def tearDown(self):
         ServersFacade.clear_mock()
@@ -384,11 +397,15 @@ class TestGlanceSync_Sync(unittest.TestCase):
             result = result.replace('\r\n', ';')
             self.assertEquals(expected, result)
 
-    def test_sync(self):
-        """test sync_region call and compare the expected results"""
+    def sync(self):
+        """synchronise all the regions"""
         for region in self.regions:
             self.glancesync.sync_region(region)
 
+    def test_sync(self):
+        """test sync_region call and compare the expected results"""
+        self.sync()
+
         result = copy.deepcopy(ServersFacade.images)
         ServersFacade.clear_mock()
         ServersFacade.add_images_from_csv_to_mock(self.path_test + '.result')
@@ -410,8 +427,7 @@ class TestGlanceSync_Sync(unittest.TestCase):
     def test_check_status_post(self):
         """run sync_region and then export_sync_region_status. Finally, check
          these last results"""
-        for region in self.regions:
-            self.glancesync.sync_region(region)
+        self.sync()
 
         path_status = self.path_test + '.status_post'
         for region in self.regions:
@@ -446,6 +462,69 @@ class TestGlanceSync_Mixed(TestGlanceSync_Sync):
         self.path_test = os.path.join(tmp, 'mixed')
         self.regions = ['Valladolid', 'master:Burgos', 'other:Madrid']
 
+    def test_filtered_once(self):
+        """the master images are filtered only once for each target"""
+        targets = list()
+        images_to_sync_dict = GlanceSyncRegion.images_to_sync_dict
+
+        def filter_images(regionobj, images_master_region, index=None):
+            targets.append(regionobj.target_name)
+            return images_to_sync_dict(regionobj, images_master_region,
+                                       index)
+
+        with patch.object(GlanceSyncRegion, 'images_to_sync_dict',
+                          filter_images):
+            self.sync()
+            for region in self.regions:
+                self.glancesync.export_sync_region_status(
+                    region, StringIO.StringIO())
+        self.assertEquals(sorted(targets), ['master', 'other'])
+
+    def test_compare_fingerprints(self):
+        """the sync and the status compare the fingerprints of the images,
+        and their properties only when the fingerprints are different"""
+        fingerprints = list()
+        compared = list()
+        fingerprint = GlanceSyncImage.fingerprint
+        compare_with_masterregion = GlanceSyncImage.compare_with_masterregion
+
+        def get_fingerprint(image, user_properties):
+            fingerprints.append(image.name)
+            return fingerprint(image, user_properties)
+
+        def compare(image, master_region_images, user_properties):
+            master = master_region_images[image.name]
+            self.assertTrue(image.status != 'active' or
+                            fingerprint(image, user_properties) !=
+                            fingerprint(master, user_properties))
+            compared.append(image.name)
+            return compare_with_masterregion(image, master_region_images,
+                                             user_properties)
+
+        with patch.object(GlanceSyncImage, 'fingerprint', get_fingerprint):
+            with patch.object(GlanceSyncImage, 'compare_with_masterregion',
+                              compare):
+                self.sync()
+                synced = len(fingerprints)
+                for region in self.regions:
+                    self.glancesync.export_sync_region_status(
+                        region, StringIO.StringIO())
+        self.assertTrue(synced > 0)
+        self.assertTrue(len(fingerprints) > synced)
+        self.assertTrue(len(fingerprints) > 2 * len(compared))
+
+
+class TestGlanceSync_MixedFilter(TestGlanceSync_Mixed):
+    """Test a environment where the destination region has some of the
+    images, selecting the images with metadata_filter instead of the default
+    condition and metadata_condition. As both targets use a filter, they are
+    evaluated with an index of the master images."""
+
+    options_dict = {'master.metadata_filter': 'public and (has nid or '
+                                              'has type)',
+                    'other.metadata_condition': '',
+                    'other.metadata_filter': 'public and type == baseimage'}
+
 
 class TestGlanceSync_Metadata(TestGlanceSync_Sync):
     """Test a environment where some images at the destination region has
@@ -498,6 +577,581 @@ class TestGlanceSync_AMI(TestGlanceSync_Sync):
         self.regions = ['master:Burgos']
 
 
+class TestGlanceSync_AMIUploadWorkers(TestGlanceSync_AMI):
+    """Test a environment with AMI images, uploading several images at the
+    same time. Kernel and ramdisk images must be uploaded first."""
+    options_dict = {'upload_workers': '4'}
+
+
+class TestGlanceSync_MixedUploadWorkers(TestGlanceSync_Mixed):
+    """Test a environment where the destination region has some of the
+    images, uploading several images at the same time"""
+    options_dict = {'upload_workers': '3'}
+
+
+class ImagesDirMixin(object):
+    """A file is created in images_dir for each master image."""
+
+    def setUp(self):
+        self.images_dir = tempfile.mkdtemp(prefix='imagesdir_tmp')
+        self.options_dict = dict(self.options_dict or dict())
+        self.options_dict['main.images_dir'] = self.images_dir
+        super(ImagesDirMixin, self).setUp()
+        for image in self.glancesync.master_region_dict.values():
+            with open(os.path.join(self.images_dir, image.id), 'w') as f:
+                f.write(image.checksum * 1000)
+
+    def tearDown(self):
+        super(ImagesDirMixin, self).tearDown()
+        for name in os.listdir(self.images_dir):
+            os.unlink(os.path.join(self.images_dir, name))
+        os.rmdir(self.images_dir)
+
+
+class FanoutMixin(ImagesDirMixin):
+    """Synchronise all the regions with sync_regions_fanout instead of
+    sync_region."""
+
+    def sync(self):
+        """synchronise all the regions at the same time"""
+        failed = self.glancesync.sync_regions_fanout(self.regions)
+        self.assertEquals(failed, list())
+
+
+class TestGlanceSync_EmptyFanout(FanoutMixin, TestGlanceSync_Empty):
+    """Test a environment where the destination regions have no images,
+    uploading each image to all the regions at the same time"""
+
+
+class TestGlanceSync_AMIFanout(FanoutMixin, TestGlanceSync_AMI):
+    """Test a environment with AMI images, uploading each image to all the
+    regions at the same time"""
+
+
+class ScheduledMixin(object):
+    """Synchronise all the regions with sync_regions_scheduled instead of
+    sync_region."""
+
+    def sync(self):
+        """synchronise all the regions at the same time"""
+        failed = self.glancesync.sync_regions_scheduled(self.regions)
+        self.assertEquals(failed, list())
+
+
+class TestGlanceSync_MixedScheduled(ScheduledMixin, TestGlanceSync_Mixed):
+    """Test a environment where the destination region has some of the
+    images, with the global scheduler"""
+    options_dict = {'main.max_uploads': '3', 'upload_workers': '2',
+                    'main.scheduler_policy': 'completion'}
+
+
+class TestGlanceSync_AMIScheduled(ScheduledMixin, ImagesDirMixin,
+                                  TestGlanceSync_AMI):
+    """Test a environment with AMI images, with the global scheduler and a
+    bandwidth limit (the images are read from images_dir)"""
+    options_dict = {'main.max_uploads': '4', 'upload_workers': '4',
+                    'main.bandwidth_mb': '100',
+                    'main.scheduler_policy': 'priority'}
+
+
+class TestGlanceSync_MixedRelays(ScheduledMixin, TestGlanceSync_Mixed):
+    """Test a environment where the destination region has some of the
+    images, with the global scheduler and Burgos as relay of the other
+    regions"""
+    options_dict = {'main.relays':
+                    'other:Madrid=master:Burgos, Valladolid=Burgos'}
+
+    def download(self, function):
+        """run function recording the regions where images are downloaded"""
+        sources = list()
+        download_image = ServersFacade.download_image
+
+        def download(facade, regionobj, id):
+            sources.append(regionobj.fullname)
+            return download_image(facade, regionobj, id)
+
+        with patch.object(ServersFacade, 'download_image', download):
+            function()
+        return sources
+
+    def test_relayed(self):
+        """the images uploaded to Burgos are downloaded from there"""
+        sources = self.download(self.sync)
+        self.assertTrue(sources)
+        self.assertEquals(set(sources), set(['Burgos']))
+
+    def test_relay_not_synchronised(self):
+        """a region already synchronised is used as relay, even if it is not
+        synchronised again"""
+        self.glancesync.sync_region('master:Burgos')
+        sources = self.download(
+            lambda: self.glancesync.sync_regions_scheduled(['other:Madrid']))
+        self.assertTrue(sources)
+        self.assertEquals(set(sources), set(['Burgos']))
+
+
+class SyncImagesMixin(object):
+    """Synchronise the regions using sync_images with the names of all the
+    master images"""
+
+    def sync(self):
+        """synchronise all the images in all the regions"""
+        names = self.glancesync.master_region_dict.keys()
+        failed = self.glancesync.sync_images(names, self.regions)
+        self.assertEquals(failed, [])
+
+
+class TestGlanceSync_MixedImages(SyncImagesMixin, TestGlanceSync_Mixed):
+    """Test a environment where the destination region has some of the
+    images, using sync_images"""
+
+
+class TestGlanceSync_AMIImages(SyncImagesMixin, TestGlanceSync_AMI):
+    """Test a environment with AMI images, using sync_images"""
+
+    def test_sync_one_image(self):
+        """only the image and its kernel and ramdisk are uploaded; unknown
+        names are ignored"""
+        before = set(image.name
+                     for image in ServersFacade.images['Burgos'].values())
+        failed = self.glancesync.sync_images(['image15', 'unknown'],
+                                             self.regions)
+        self.assertEquals(failed, [])
+        images = dict((image.name, image)
+                      for image in ServersFacade.images['Burgos'].values())
+        self.assertEquals(set(images) - before,
+                          set(['image13', 'image14', 'image15']))
+        self.assertEquals(images['image15'].user_properties['kernel_id'],
+                          images['image13'].id)
+        self.assertEquals(images['image06'].user_properties['kernel_id'],
+                          '004')
+
+
+class CopyFromMixin(ImagesDirMixin):
+    """The regions download the images (transfer_mode = copy_from) from a
+    local HTTP server that serves images_dir"""
+
+    def setUp(self):
+        self.requests = list()
+        test = self
+
+        class Handler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+            def translate_path(self, path):
+                test.requests.append(path)
+                return os.path.join(test.images_dir, path.lstrip('/'))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  kwargs={'poll_interval': 0.01})
+        thread.daemon = True
+        thread.start()
+        url = 'http://127.0.0.1:{0}/{{id}}'.format(self.server.server_port)
+        self.options_dict = dict(self.options_dict or dict())
+        self.options_dict['transfer_mode'] = 'copy_from'
+        self.options_dict['copy_from_url'] = url
+        super(CopyFromMixin, self).setUp()
+
+    def tearDown(self):
+        super(CopyFromMixin, self).tearDown()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_copy_from_missing(self):
+        """a region fails if the image can not be downloaded"""
+        for name in os.listdir(self.images_dir):
+            os.unlink(os.path.join(self.images_dir, name))
+        failed = self.glancesync.sync_regions_scheduled(self.regions)
+        self.assertTrue(failed)
+        self.assertTrue(self.requests)
+
+
+class TestGlanceSync_MixedCopyFrom(CopyFromMixin, TestGlanceSync_Mixed):
+    """Test a environment where the destination region has some of the
+    images, and the regions download the images"""
+
+
+class TestGlanceSync_AMICopyFrom(CopyFromMixin, TestGlanceSync_AMI):
+    """Test a environment with AMI images, where the regions download the
+    images"""
+    options_dict = {'upload_workers': '4'}
+
+
+class TestGlanceSync_MixedLocation(TestGlanceSync_Mixed):
+    """Test a environment where the destination region has some of the
+    images, registering the location of the images in a shared store"""
+    options_dict = {'transfer_mode': 'location',
+                    'location_url': 'rbd://fsid/images/{id}/snap'}
+
+    def test_registered(self):
+        """the images are registered instead of uploaded"""
+        with patch.object(ServersFacade, 'upload_image') as upload_image:
+            with patch.object(ServersFacade, 'register_location',
+                              return_value='new') as register_location:
+                self.glancesync.sync_region('master:Burgos')
+        self.assertTrue(register_location.called)
+        self.assertFalse(upload_image.called)
+        (regionobj, image, url) = register_location.call_args[0]
+        master_image = self.glancesync.master_region_dict[image.name]
+        self.assertEquals(url,
+                          'rbd://fsid/images/' + master_image.id + '/snap')
+
+    def test_fallback(self):
+        """the images are uploaded if the location can not be registered"""
+        with patch.object(ServersFacade, 'register_location',
+                          side_effect=Exception('no shared store')):
+            self.test_sync()
+
+    def test_unknown_location(self):
+        """the images are uploaded if the location is unknown"""
+        self.glancesync.targets['master']['location_url'] = ''
+        with patch.object(ServersFacade, 'register_location') as register:
+            self.glancesync.sync_region('master:Burgos')
+        self.assertFalse(register.called)
+
+
+class TestGlanceSync_EmptyCorrupt(TestGlanceSync_Empty):
+    """Test a environment where the destination region has no images and the
+    files of the master images are corrupt"""
+
+    def test_corrupt_uploaded_once(self):
+        """a corrupt file is not uploaded again to other regions"""
+        attempts = list()
+        upload_image = ServersFacade.upload_image
+
+        def upload(facade, regionobj, image, data=None):
+            attempts.append((regionobj.fullname, image.name))
+            if image.name == 'image02':
+                raise GlanceFacadeChecksumException('md5 mismatch')
+            return upload_image(facade, regionobj, image, data)
+
+        with patch.object(ServersFacade, 'upload_image', upload):
+            for region in self.regions:
+                try:
+                    self.glancesync.sync_region(region)
+                except Exception:
+                    pass
+        self.assertEquals(list(name for (region, name) in attempts
+                               if name == 'image02'), ['image02'])
+
+
+class TestGlanceSync_EmptyIndexed(ImagesDirMixin, TestGlanceSync_Empty):
+    """Test a environment where the destination region has no images, with
+    an index of images_dir. The files created by ImagesDirMixin have not the
+    size of the master images, so the check of the index is replaced to
+    accept them, excepting the file of image01."""
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp(prefix='index_tmp')
+        self.options_dict = {
+            'main.images_index': os.path.join(self.index_dir, 'index.db')}
+        super(TestGlanceSync_EmptyIndexed, self).setUp()
+        self.patcher = patch.object(ImagesDirIndex, 'check',
+                                    return_value=None)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        super(TestGlanceSync_EmptyIndexed, self).tearDown()
+        shutil.rmtree(self.index_dir)
+
+    def test_file_missing(self):
+        """an image whose file is not right is not uploaded, but the other
+        images are"""
+        ImagesDirIndex.check.side_effect = lambda image: \
+            'the file does not exist' if image.name == 'image01' else None
+        plan = self.glancesync.plan_region('master:Burgos')
+        statuses = dict((image.name, status)
+                        for (status, image) in plan.tuples)
+        self.assertEquals(statuses['image01'], 'error_file')
+        self.assertEquals(statuses['image02'], 'pending_upload')
+        self.glancesync.execute_plan(plan)
+        names = set(image.name for image in
+                    ServersFacade.images['Burgos'].values())
+        self.assertNotIn('image01', names)
+        self.assertIn('image02', names)
+
+    def test_refresh_images_index_once(self):
+        """the index refreshed before the plans (e.g. before forking the
+        processes of the regions) is not refreshed again by them"""
+        with patch.object(ImagesDirIndex, 'refresh',
+                          return_value=0) as refresh:
+            self.glancesync.refresh_images_index()
+            self.glancesync.plan_region('master:Burgos')
+        self.assertEquals(refresh.call_count, 1)
+
+
+class TestGlanceSync_EmptyAdopt(TestGlanceSync_Empty):
+    """Test a environment where the destination region has no images, but
+    one of them is already uploaded with other name"""
+
+    options_dict = {'adopt_images': 'True'}
+
+    def setUp(self):
+        super(TestGlanceSync_EmptyAdopt, self).setUp()
+        image = copy.deepcopy(ServersFacade.images['Valladolid']['002'])
+        image.id = '1$renamed02'
+        image.region = 'Burgos'
+        image.name = 'image02_renamed'
+        image.user_properties = dict()
+        ServersFacade.images['Burgos'][image.id] = image
+
+    def test_sync(self):
+        """the renamed image is adopted instead of uploading image02"""
+        uploaded = list()
+        upload_image = ServersFacade.upload_image
+
+        def upload(facade, regionobj, image, data=None):
+            uploaded.append(image.name)
+            return upload_image(facade, regionobj, image, data)
+
+        with patch.object(ServersFacade, 'upload_image', upload):
+            self.glancesync.sync_region('master:Burgos')
+        self.assertTrue(uploaded)
+        self.assertNotIn('image02', uploaded)
+        images = ServersFacade.images['Burgos']
+        self.assertEquals(len(images), 10)
+        adopted = images['1$renamed02']
+        self.assertEquals(adopted.name, 'image02')
+        self.assertEquals(adopted.user_properties, {'type': 'baseimage'})
+
+    def test_dry_run(self):
+        """in dry-run mode, the image is neither adopted nor uploaded"""
+        self.glancesync.sync_region('master:Burgos', dry_run=True)
+        images = ServersFacade.images['Burgos']
+        self.assertEquals(len(images), 1)
+        self.assertEquals(images['1$renamed02'].name, 'image02_renamed')
+
+    def test_check_status_post(self):
+        """after adopting the image, the region is synchronised"""
+        self.glancesync.sync_region('master:Burgos')
+        stream = StringIO.StringIO()
+        self.glancesync.export_sync_region_status('master:Burgos', stream)
+        self.assertNotIn('pending', stream.getvalue())
+
+
+class TestGlanceSync_MixedRemoteSource(TestGlanceSync_Mixed):
+    """Test a environment where the destination region has some of the
+    images, downloading the master images to a staging area instead of
+    reading images_dir"""
+
+    def setUp(self):
+        self.staging_dir = tempfile.mkdtemp(prefix='staging_tmp')
+        self.options_dict = {'main.image_source': 'remote',
+                             'main.staging_dir': self.staging_dir,
+                             'main.images_dir': '/__noexistingdir'}
+        # the content of the mock images does not match their checksum
+        self.patcher = patch(
+            'fiwareglancesync.glancesync_source.ChecksumReader',
+            lambda data, checksum, size: data)
+        self.patcher.start()
+        super(TestGlanceSync_MixedRemoteSource, self).setUp()
+
+    def tearDown(self):
+        super(TestGlanceSync_MixedRemoteSource, self).tearDown()
+        self.patcher.stop()
+        shutil.rmtree(self.staging_dir)
+
+    def test_downloaded_once(self):
+        """each image is downloaded once from the master region for all the
+        regions"""
+        downloads = list()
+        download_image = ServersFacade.download_image
+
+        def download(facade, regionobj, id):
+            downloads.append((regionobj.fullname, id))
+            return download_image(facade, regionobj, id)
+
+        with patch.object(ServersFacade, 'download_image', download):
+            self.sync()
+        self.assertTrue(downloads)
+        self.assertEquals(len(downloads), len(set(downloads)))
+        self.assertEquals(set(region for (region, id) in downloads),
+                          set(['Valladolid']))
+
+
+class TestGlanceSync_MixedCached(TestGlanceSync_Mixed):
+    """Test a environment where the destination region has some of the
+    images, using the cache of image lists"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(prefix='glancesync_cache_tmp')
+        self.options_dict = {'main.cache_dir': self.cache_dir}
+        super(TestGlanceSync_MixedCached, self).setUp()
+
+    def tearDown(self):
+        super(TestGlanceSync_MixedCached, self).tearDown()
+        for name in os.listdir(self.cache_dir):
+            os.unlink(os.path.join(self.cache_dir, name))
+        os.rmdir(self.cache_dir)
+
+    def test_status_cached(self):
+        """the second report of the status does not list the regions"""
+        for region in self.regions:
+            self.glancesync.export_sync_region_status(
+                region, StringIO.StringIO())
+        with patch.object(ServersFacade, 'get_imagelist') as get_imagelist:
+            for region in self.regions:
+                self.glancesync.export_sync_region_status(
+                    region, StringIO.StringIO())
+            self.assertFalse(get_imagelist.called)
+
+
+class TestGlanceSync_MixedIncremental(TestGlanceSync_Mixed):
+    """Test a environment where the destination region has some of the
+    images, saving the state to do incremental synchronisations"""
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp(prefix='glancesync_state_tmp')
+        self.options_dict = {
+            'main.state_file': os.path.join(self.state_dir, 'state')}
+        super(TestGlanceSync_MixedIncremental, self).setUp()
+
+    def tearDown(self):
+        super(TestGlanceSync_MixedIncremental, self).tearDown()
+        for name in os.listdir(self.state_dir):
+            os.unlink(os.path.join(self.state_dir, name))
+        os.rmdir(self.state_dir)
+
+    def rerun(self):
+        """synchronise again all the regions with a new GlanceSync object
+        and return the regions whose images were listed"""
+        glancesync = GlanceSync(StringIO.StringIO(config1), self.options_dict)
+        with patch.object(ServersFacade, 'get_imagelist',
+                          wraps=self.facade.get_imagelist) as get_imagelist:
+            for region in self.regions:
+                glancesync.sync_region(region)
+            return set(call[0][0].fullname
+                       for call in get_imagelist.call_args_list)
+
+    def test_unchanged(self):
+        """the second synchronisation does not list any region"""
+        self.sync()
+        self.assertEquals(self.rerun(), set())
+
+    def test_region_changed(self):
+        """only the modified region is listed again"""
+        self.sync()
+        image = ServersFacade.images['Burgos'].values()[0]
+        image.user_properties['type'] = 'modified'
+        self.assertEquals(self.rerun(), set(['Burgos']))
+        self.assertEquals(self.rerun(), set())
+
+    def test_master_changed(self):
+        """a change in a master image that is not synchronised to the target
+        other does not force the evaluation of its regions"""
+        self.sync()
+        ServersFacade.images['Valladolid']['001'].checksum = 'newchecksum'
+        self.assertEquals(self.rerun(), set(['Valladolid', 'Burgos']))
+
+    def test_without_fingerprint(self):
+        """the state is not used with a facade without fingerprint (glance
+        API v2)"""
+        with patch.object(ServersFacade, 'get_imagelist_fingerprint',
+                          return_value=None):
+            self.sync()
+            self.assertEquals(self.rerun(),
+                              set(['Valladolid', 'Burgos', 'other:Madrid']))
+
+    def test_dry_run(self):
+        """a dry run does not save the state"""
+        for region in self.regions:
+            self.glancesync.sync_region(region, dry_run=True)
+        self.assertEquals(self.rerun(),
+                          set(['Valladolid', 'Burgos', 'other:Madrid']))
+
+
+class StatusStoreMixin(object):
+    """Save the status of the images in status_db and check it against the
+    results of export_sync_region_status"""
+
+    def setUp(self):
+        self.status_dir = tempfile.mkdtemp(prefix='glancesync_status_tmp')
+        self.options_dict = {
+            'main.status_db': os.path.join(self.status_dir, 'status.db')}
+        super(StatusStoreMixin, self).setUp()
+
+    def tearDown(self):
+        super(StatusStoreMixin, self).tearDown()
+        shutil.rmtree(self.status_dir)
+
+    def stored_status(self):
+        """return the saved status as the set of rows of the expected csv
+        files"""
+        store = GlanceSync.get_status_store(StringIO.StringIO(config1),
+                                            self.options_dict)
+        return set((row['status'], row['region'], row['name'])
+                   for region in self.regions
+                   for row in store.get_region(region))
+
+    def expected_status(self, suffix):
+        """return the rows of the csv files with the expected status"""
+        path_status = self.path_test + suffix
+        rows = set()
+        for region in self.regions:
+            if region.startswith('master:'):
+                region = region[7:]
+            with open(os.path.join(path_status, region + '.csv')) as f:
+                rows.update(tuple(row) for row in csv.reader(f))
+        return rows
+
+    def test_stored_status_plan(self):
+        """the plans save the status before the synchronisation"""
+        for region in self.regions:
+            self.glancesync.sync_region(region, dry_run=True)
+        self.assertEquals(self.stored_status(),
+                          self.expected_status('.status_pre'))
+
+    def test_stored_status_sync(self):
+        """the status is updated while the images are synchronised, without
+        comparing the regions again"""
+        self.sync()
+        self.assertEquals(self.stored_status(),
+                          self.expected_status('.status_post'))
+        store = GlanceSync.get_status_store(StringIO.StringIO(config1),
+                                            self.options_dict)
+        now = time.time()
+        for row in store.get_region(self.regions[0]):
+            self.assertTrue(now - 60 < row['checked'] <= now)
+            if row['status'] == 'ok':
+                self.assertIsNotNone(row['id'])
+
+    def test_stored_status_report(self):
+        """export_sync_region_status saves the status too"""
+        for region in self.regions:
+            self.glancesync.export_sync_region_status(region,
+                                                      StringIO.StringIO())
+        self.assertEquals(self.stored_status(),
+                          self.expected_status('.status_pre'))
+
+
+class TestGlanceSync_MixedStatusStore(StatusStoreMixin, TestGlanceSync_Mixed):
+    pass
+
+
+class TestGlanceSync_AMIStatusStore(StatusStoreMixin, TestGlanceSync_AMI):
+    pass
+
+
+class TestGlanceSync_ChecksumStatusStore(StatusStoreMixin,
+                                         TestGlanceSync_Checksum):
+    pass
+
+
+class TestGlanceSync_FanoutMissingFile(TestGlanceSync_Empty):
+    """Test that a region is reported as failed if a image can not be read,
+    but the other regions are synchronised"""
+    options_dict = {'main.images_dir': '/__noexistingdir'}
+
+    def test_fanout_missing_file(self):
+        """all the regions that need a upload fail; Valladolid is the
+        master region and it is already synchronised"""
+        failed = self.glancesync.sync_regions_fanout(self.regions)
+        self.assertEquals(set(failed), set(['master:Burgos', 'other:Madrid']))
+
+
 class TestGlanceSync_Obsolete(TestGlanceSync_Sync):
     """Test obsolete images support"""
     def config(self):
@@ -507,6 +1161,38 @@ class TestGlanceSync_Obsolete(TestGlanceSync_Sync):
         self.regions = ['other:Burgos', 'target2:Madrid']
 
 
+class PlanMixin(object):
+    """Compute the plans of all the regions before executing any of them.
+    The plans are serialised as JSON and read again."""
+
+    def sync(self):
+        """synchronise all the regions executing the deserialised plans"""
+        plans = list(self.glancesync.plan_region(region)
+                     for region in self.regions)
+        stream = StringIO.StringIO()
+        dump_plans(plans, stream)
+        stream.seek(0)
+        for plan in load_plans(stream):
+            self.glancesync.execute_plan(plan)
+
+
+class TestGlanceSync_MixedPlan(PlanMixin, TestGlanceSync_Mixed):
+    """Test a environment where the destination region has some of the
+    images, executing plans"""
+
+
+class TestGlanceSync_AMIPlan(PlanMixin, TestGlanceSync_AMI):
+    """Test a environment with AMI images, executing plans"""
+
+
+class TestGlanceSync_ObsoletePlan(PlanMixin, TestGlanceSync_Obsolete):
+    """Test obsolete images support, executing plans"""
+
+
+class TestGlanceSync_ObsoleteImages(SyncImagesMixin, TestGlanceSync_Obsolete):
+    """Test obsolete images support, using sync_images"""
+
+
 class TestGlanceSync_MasterFiltered(TestGlanceSync_Sync):
     """Test that master images with duplicated name, status != active, and
     owner differnt than the tenant, are ignored"""
@@ -534,3 +1220,21 @@ class TestGlanceSync_MasterFiltered(TestGlanceSync_Sync):
         self.assertEquals(len(warnings), 1)
         msg1 = 'Duplicated images with name image01 will be ignored'
         self.assertTrue(warnings[0].startswith(msg1))
+
+
+class TestGlanceSync_MixedV2(TestGlanceSync_Mixed):
+    """Test a environment where the destination region has some of the
+    images, with the filters of the glance API v2 applied by the mock"""
+    options_dict = {'glance_api_version': '2'}
+
+
+class TestGlanceSync_ObsoleteV2(TestGlanceSync_Obsolete):
+    """Test obsolete images support, with the filters of the glance API v2
+    applied by the mock"""
+    options_dict = {'glance_api_version': '2'}
+
+
+class TestGlanceSync_MasterFilteredV2(TestGlanceSync_MasterFiltered):
+    """Test that master images are filtered, with the filters of the glance
+    API v2 applied by the mock"""
+    options_dict = {'glance_api_version': '2'}
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+#
+import unittest
+import os
+import shutil
+import tempfile
+from mock import patch, MagicMock
+
+from fiwareglancesync.glancesync_cache import ImageListCache
+from fiwareglancesync.glancesync_image import GlanceSyncImage
+from fiwareglancesync.glancesync_region import GlanceSyncRegion
+
+
+class TestImageListCache(unittest.TestCase):
+    """Test the cache of image lists with a mock facade"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(prefix='glancesync_cache_tmp')
+        self.images = [GlanceSyncImage('image1', '01', 'Madrid', 'tenant1',
+                                       True, 'ch1', 1000, 'active',
+                                       {'type': 'base'}, {'disk_format': 'qcow2'})]
+        self.facade = MagicMock()
+        self.facade.get_imagelist.side_effect = \
+            lambda region, filters=None: self.images
+        self.facade.get_imagelist_fingerprint.return_value = 'fingerprint1'
+        targets = {'master': {'target_name': 'master', 'facade': self.facade,
+                              'keystone_url': 'http://keystone',
+                              'tenant': 'tenant1'}}
+        self.region = GlanceSyncRegion('Madrid', targets)
+        self.cache = ImageListCache(os.path.join(self.cache_dir, 'sub'), 60)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_hit(self):
+        """the second call uses the cache; the images are not the same
+        objects, but equal"""
+        images = self.cache.get_imagelist(self.region)
+        images2 = self.cache.get_imagelist(self.region)
+        self.assertEquals(self.facade.get_imagelist.call_count, 1)
+        self.assertEquals(images2, self.images)
+        self.assertIsNot(images2[0], images[0])
+        self.assertEquals(images2[0].raw, {'disk_format': 'qcow2'})
+
+    def test_fingerprint_changed(self):
+        """the list is obtained again if the fingerprint changes after its
+        first reuse"""
+        self.cache.get_imagelist(self.region)
+        self.cache.get_imagelist(self.region)
+        self.facade.get_imagelist_fingerprint.return_value = 'fingerprint2'
+        self.cache.get_imagelist(self.region)
+        self.cache.get_imagelist(self.region)
+        self.assertEquals(self.facade.get_imagelist.call_count, 2)
+
+    def test_miss_without_fingerprint(self):
+        """the fingerprint is only queried when there is a fresh list"""
+        with patch('fiwareglancesync.glancesync_cache.time.time') as time:
+            time.return_value = 1000
+            self.cache.get_imagelist(self.region)
+            self.assertFalse(self.facade.get_imagelist_fingerprint.called)
+            time.return_value = 1061
+            self.cache.get_imagelist(self.region)
+            self.assertFalse(self.facade.get_imagelist_fingerprint.called)
+            self.cache.get_imagelist(self.region)
+            self.assertEquals(
+                self.facade.get_imagelist_fingerprint.call_count, 1)
+        self.assertEquals(self.facade.get_imagelist.call_count, 2)
+
+    def test_without_fingerprint(self):
+        """the lists are not cached if the facade does not support the
+        fingerprint (glance API v2)"""
+        self.facade.has_imagelist_fingerprint = False
+        self.cache.get_imagelist(self.region)
+        self.cache.get_imagelist(self.region)
+        self.assertEquals(self.facade.get_imagelist.call_count, 2)
+        self.assertEquals(os.listdir(self.cache.cache_dir), [])
+
+    def test_expired(self):
+        """the list is obtained again after ttl seconds"""
+        with patch('fiwareglancesync.glancesync_cache.time.time') as time:
+            time.return_value = 1000
+            self.cache.get_imagelist(self.region)
+            time.return_value = 1059
+            self.cache.get_imagelist(self.region)
+            self.assertEquals(self.facade.get_imagelist.call_count, 1)
+            time.return_value = 1061
+            self.cache.get_imagelist(self.region)
+            self.assertEquals(self.facade.get_imagelist.call_count, 2)
+
+    def test_invalidate(self):
+        """the list is obtained again after invalidating the region"""
+        self.cache.get_imagelist(self.region)
+        self.cache.invalidate(self.region)
+        self.cache.invalidate(self.region)
+        self.cache.get_imagelist(self.region)
+        self.assertEquals(self.facade.get_imagelist.call_count, 2)
+
+    def test_corrupted(self):
+        """a file that can not be read is ignored"""
+        self.cache.get_imagelist(self.region)
+        with open(self.cache._path(self.region), 'w') as f:
+            f.write('garbage')
+        self.assertEquals(self.cache.get_imagelist(self.region), self.images)
+        self.assertEquals(self.facade.get_imagelist.call_count, 2)
+
+    def test_other_tenant(self):
+        """the same region with other credential uses other entry"""
+        self.cache.get_imagelist(self.region)
+        targets = {'master': dict(self.region.target, tenant='tenant2')}
+        self.cache.get_imagelist(GlanceSyncRegion('Madrid', targets))
+        self.assertEquals(self.facade.get_imagelist.call_count, 2)
+
+    def test_other_filters(self):
+        """a list obtained with other filters is not used, and each list is
+        cached in its own entry"""
+        self.cache.get_imagelist(self.region, {'status': 'active'})
+        self.cache.get_imagelist(self.region, {'status': 'active'})
+        self.assertEquals(self.facade.get_imagelist.call_count, 1)
+        self.cache.get_imagelist(self.region)
+        self.assertEquals(self.facade.get_imagelist.call_count, 2)
+        self.facade.get_imagelist.assert_called_with(self.region, None)
+        self.cache.get_imagelist(self.region, {'status': 'active'})
+        self.cache.get_imagelist(self.region)
+        self.assertEquals(self.facade.get_imagelist.call_count, 2)
+
+    def test_filters_normalised(self):
+        """the order of the names in the filters is not relevant"""
+        self.cache.get_imagelist(self.region, {'names': ['b', 'a']})
+        self.cache.get_imagelist(self.region, {'names': ['a', 'b']})
+        self.assertEquals(self.facade.get_imagelist.call_count, 1)
+        self.cache.get_imagelist(self.region, {'names': ['a']})
+        self.assertEquals(self.facade.get_imagelist.call_count, 2)
+
+    def test_invalidate_filters(self):
+        """invalidating the region removes the lists with any filters"""
+        self.cache.get_imagelist(self.region, {'status': 'active'})
+        self.cache.get_imagelist(self.region)
+        self.cache.invalidate(self.region)
+        self.cache.get_imagelist(self.region, {'status': 'active'})
+        self.cache.get_imagelist(self.region)
+        self.assertEquals(self.facade.get_imagelist.call_count, 4)
@@ -111,6 +111,8 @@ only_tenant_images = False
 
 list_images_timeout = 20
 use_keystone_v3 = True
+upload_workers = 4
+glance_api_version = 2
 
 [experimental]
 credential = user2,\
@@ -208,6 +210,10 @@ class TestGlanceSyncStream(unittest.TestCase):
         self.assertEquals(master['list_images_timeout'], 20)
         self.assertTrue(master['use_keystone_v3'])
         self.assertFalse(experimental['use_keystone_v3'])
+        self.assertEquals(master['upload_workers'], 4)
+        self.assertEquals(experimental['upload_workers'], 1)
+        self.assertEquals(master['glance_api_version'], 2)
+        self.assertEquals(experimental['glance_api_version'], 1)
 
     def test_override(self):
         """check overriding options passing a dictionary to constructor"""
@@ -216,6 +222,105 @@ class TestGlanceSyncStream(unittest.TestCase):
         self.assertEquals(config.targets['master']['user'], 'otheruser')
         self.assertFalse(config.targets['experimental']['only_tenant_images'])
 
+    def test_scheduler_options(self):
+        """check the options of the global scheduler"""
+        config = GlanceSyncConfig(stream=self.stream)
+        self.assertEquals(config.bandwidth_mb, 0)
+        self.assertEquals(config.max_uploads, 4)
+        self.assertEquals(config.scheduler_policy, 'smallest')
+        self.stream.seek(0)
+        override = {'main.bandwidth_mb': '2.5', 'main.max_uploads': '8',
+                    'main.scheduler_policy': 'completion'}
+        config = GlanceSyncConfig(stream=self.stream, override_d=override)
+        self.assertEquals(config.bandwidth_mb, 2.5)
+        self.assertEquals(config.max_uploads, 8)
+        self.assertEquals(config.scheduler_policy, 'completion')
+        self.stream.seek(0)
+        override = {'main.scheduler_policy': 'biggest'}
+        with self.assertRaises(Exception):
+            GlanceSyncConfig(stream=self.stream, override_d=override)
+
+    def test_transfer_mode(self):
+        """check the transfer_mode option and that copy_from requires
+        copy_from_url"""
+        config = GlanceSyncConfig(stream=self.stream)
+        self.assertEquals(config.targets['master']['transfer_mode'], 'push')
+        self.stream.seek(0)
+        override = {'master.transfer_mode': 'copy_from',
+                    'master.copy_from_url': 'http://mirror/{id}'}
+        config = GlanceSyncConfig(stream=self.stream, override_d=override)
+        self.assertEquals(config.targets['master']['transfer_mode'],
+                          'copy_from')
+        self.assertEquals(config.targets['master']['copy_from_url'],
+                          'http://mirror/{id}')
+        self.assertEquals(config.targets['master']['copy_from_timeout'],
+                          3600)
+        self.assertEquals(config.targets['master']['location_url'], '')
+        self.assertFalse(config.targets['master']['adopt_images'])
+        for override in ({'master.transfer_mode': 'copy_from'},
+                         {'master.transfer_mode': 'rsync'}):
+            self.stream.seek(0)
+            with self.assertRaises(Exception):
+                GlanceSyncConfig(stream=self.stream, override_d=override)
+
+    def test_relays(self):
+        """check the relays option: the master: prefix is omitted and the
+        invalid pairs and the cycles are rejected"""
+        config = GlanceSyncConfig(stream=self.stream)
+        self.assertEquals(config.relays, dict())
+        self.stream.seek(0)
+        override = {'main.relays': 'other:Madrid=master:Burgos, Burgos= Lyon'}
+        config = GlanceSyncConfig(stream=self.stream, override_d=override)
+        self.assertEquals(config.relays, {'other:Madrid': 'Burgos',
+                                          'Burgos': 'Lyon'})
+        for relays in ('Burgos', 'Burgos=', 'Burgos=Lyon,Lyon=master:Burgos',
+                       'Burgos=Burgos'):
+            self.stream.seek(0)
+            with self.assertRaises(Exception):
+                GlanceSyncConfig(stream=self.stream,
+                                 override_d={'main.relays': relays})
+
+    def test_image_source(self):
+        """check the options of the source of the master images"""
+        config = GlanceSyncConfig(stream=self.stream)
+        self.assertEquals(config.image_source, 'local')
+        self.assertEquals(config.staging_mb, 10240)
+        self.stream.seek(0)
+        override = {'main.image_source': 'remote',
+                    'main.staging_dir': '/var/cache/glancesync',
+                    'main.staging_mb': '2048'}
+        config = GlanceSyncConfig(stream=self.stream, override_d=override)
+        self.assertEquals(config.image_source, 'remote')
+        self.assertEquals(config.staging_dir, '/var/cache/glancesync')
+        self.assertEquals(config.staging_mb, 2048)
+        for override in ({'main.image_source': 'remote'},
+                         {'main.image_source': 'nfs'}):
+            self.stream.seek(0)
+            with self.assertRaises(Exception):
+                GlanceSyncConfig(stream=self.stream, override_d=override)
+
+    def test_metadata_filter(self):
+        """check the declarative alternative to metadata_condition"""
+        override = {'experimental.metadata_filter':
+                    'has nid and type == baseimage'}
+        config = GlanceSyncConfig(stream=self.stream, override_d=override)
+        experimental = config.targets['experimental']
+        self.assertEquals(str(experimental['metadata_filter']),
+                          'has nid and type == baseimage')
+        self.assertNotIn('metadata_filter', config.targets['master'])
+        for override in ({'master.metadata_filter': 'has nid'},
+                         {'experimental.metadata_filter': 'has'}):
+            self.stream.seek(0)
+            with self.assertRaises(Exception):
+                GlanceSyncConfig(stream=self.stream, override_d=override)
+
+    def test_invalid_glance_api_version(self):
+        """check that only the versions 1 and 2 of the glance API are
+        accepted"""
+        override = {'master.glance_api_version': '3'}
+        with self.assertRaises(Exception):
+            GlanceSyncConfig(stream=self.stream, override_d=override)
+
 
 class TestGlanceSyncConfigFile(unittest.TestCase):
     """Class to test that is possible to provide the configuration using a
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+#
+import unittest
+
+from fiwareglancesync.glancesync_filter import MetadataFilter, PropertyIndex
+from fiwareglancesync.glancesync_image import GlanceSyncImage
+
+
+class TestMetadataFilter(unittest.TestCase):
+    """Test the compilation and evaluation of the filter language"""
+
+    def setUp(self):
+        self.images = dict()
+        for (name, public, props) in (
+                ('base1', True, {'type': 'baseimage', 'nid': 1}),
+                ('base2', False, {'type': 'baseimage'}),
+                ('ng3', True, {'type': 'ngimages', 'nid': 3}),
+                ('other4', True, {'sdc_aware': 'true'}),
+                ('name5', True, {'name': 'x'})):
+            self.images[name] = GlanceSyncImage(
+                name, name[-1], 'Valladolid', 'tenant1', public, 'checksum',
+                1000, 'active', props)
+        self.index = PropertyIndex(self.images)
+
+    def check(self, source, expected):
+        """Check both the evaluation of each image and with the index"""
+        metadata_filter = MetadataFilter(source)
+        matched = set(name for (name, image) in self.images.items()
+                      if metadata_filter.match(image))
+        self.assertEquals(matched, set(expected))
+        self.assertEquals(metadata_filter.select(self.index), set(expected))
+
+    def test_has(self):
+        self.check('has nid', ['base1', 'ng3'])
+        self.check('has name', ['name5'])
+        self.check('has unknown', [])
+
+    def test_equals(self):
+        self.check('type == baseimage', ['base1', 'base2'])
+        self.check('nid == 1', ['base1'])
+        self.check("type == 'ngimages'", ['ng3'])
+        self.check('name == base2', ['base2'])
+
+    def test_not_equals(self):
+        self.check('type != baseimage', ['ng3', 'other4', 'name5'])
+
+    def test_regex(self):
+        self.check('type =~ ^ng', ['ng3'])
+        self.check("name =~ '[0-9]$'", self.images.keys())
+        self.check('name =~ ^base', ['base1', 'base2'])
+
+    def test_non_ascii(self):
+        """the unicode values (API v2) and the UTF-8 strings (API v1 and the
+        configuration) with non-ASCII characters are compared"""
+        self.images['base1'].user_properties['owner'] = u'Telef\xf3nica'
+        self.images['base2'].user_properties['owner'] = 'Telef\xc3\xb3nica'
+        self.images['ng3'].user_properties['owner'] = u'\u6771\u4eac'
+        self.index = PropertyIndex(self.images)
+        self.check('owner == Telef\xc3\xb3nica', ['base1', 'base2'])
+        self.check(u'owner == Telef\xf3nica', ['base1', 'base2'])
+        self.check('owner != Telef\xc3\xb3nica',
+                   ['ng3', 'other4', 'name5'])
+        self.check('owner =~ ^Telef\xc3\xb3', ['base1', 'base2'])
+        self.check('owner =~ .', ['base1', 'base2', 'ng3'])
+
+    def test_public(self):
+        self.check('public', ['base1', 'ng3', 'other4', 'name5'])
+
+    def test_combinators(self):
+        self.check('public and has nid and type == baseimage', ['base1'])
+        self.check('has nid or has sdc_aware', ['base1', 'ng3', 'other4'])
+        self.check('not public', ['base2'])
+        self.check('not (has nid or public)', ['base2'])
+        # and has higher precedence than or
+        self.check('has sdc_aware or public and type == baseimage',
+                   ['base1', 'other4'])
+        self.check('(has sdc_aware or public) and type == baseimage',
+                   ['base1'])
+
+    def test_str(self):
+        self.assertEquals(str(MetadataFilter('has nid')), 'has nid')
+
+    def test_syntax_errors(self):
+        for source in ('', 'has', 'nid', 'nid ==', 'has nid and',
+                       '(has nid', 'has nid)', 'nid < 3', 'name =~ "("',
+                       'has nid nid', 'has (nid)'):
+            with self.assertRaises(ValueError):
+                MetadataFilter(source)
@@ -24,7 +24,11 @@
 #
 import unittest
 import copy
-from fiwareglancesync.glancesync_image import GlanceSyncImage
+import cPickle
+from mock import patch
+from fiwareglancesync.glancesync_image import GlanceSyncImage,\
+    _properties_digest
+from fiwareglancesync.glancesync_filter import MetadataFilter
 
 
 class TestGlanceSyncImageRegion(unittest.TestCase):
@@ -188,6 +192,22 @@ class TestGlanceSyncImageRegion(unittest.TestCase):
         self.assertFalse(self.image3.is_synchronisable(m, force, func))
         self.assertFalse(self.image4.is_synchronisable(m, force, func))
 
+    def test_is_synchronisable_filter(self):
+        """Test is_synchronisable method, with a metadata_filter, that takes
+        precedence over metadata_condition"""
+        m = set(['p3'])
+        force = set()
+        metadata_filter = MetadataFilter('p2 == v2bis or not public')
+        func = 'True'
+        self.assertFalse(self.image1.is_synchronisable(m, force, func,
+                                                       metadata_filter))
+        self.assertTrue(self.image2.is_synchronisable(m, force, func,
+                                                      metadata_filter))
+        self.assertFalse(self.image3.is_synchronisable(m, force, func,
+                                                       metadata_filter))
+        self.assertTrue(self.image4.is_synchronisable(m, force, func,
+                                                      metadata_filter))
+
     def test_is_synchronisable_obsolete(self):
         """if image name ends with '_obsolete' it is not synchronisable"""
         force_sync = list([self.image1.id])
@@ -195,6 +215,48 @@ class TestGlanceSyncImageRegion(unittest.TestCase):
         self.image1.name += '_obsolete'
         self.assertFalse(self.image1.is_synchronisable(set(), force_sync))
 
+    def test_raw_fields(self):
+        """only the fields of raw used to upload the image are kept"""
+        raw = {'disk_format': 'qcow2', 'container_format': 'bare',
+               'protected': False, 'min_ram': 0, 'min_disk': 0,
+               'name': self.name, 'properties': self.props,
+               'file': '/v2/images/0001/file'}
+        image = GlanceSyncImage(self.name, self.id1, self.region, raw=raw)
+        self.assertEquals(image.raw, {'disk_format': 'qcow2',
+                                      'container_format': 'bare',
+                                      'protected': False, 'min_ram': 0,
+                                      'min_disk': 0})
+        self.assertIsNone(self.image1.raw)
+
+    def test_shared_values(self):
+        """the region, owner and status are shared by the images"""
+        image = GlanceSyncImage('image5', '0005', ''.join(self.region),
+                                ''.join(self.owner), status=u'active')
+        self.assertIs(image.region, self.image1.region)
+        self.assertIs(image.owner, self.image1.owner)
+        self.assertIs(image.status, self.image1.status)
+        self.assertFalse(hasattr(image, '__dict__'))
+
+    def test_pickle(self):
+        """the images can be pickled with any protocol, and also copied"""
+        self.image1.raw = {'disk_format': 'qcow2'}
+        for protocol in range(cPickle.HIGHEST_PROTOCOL + 1):
+            image = cPickle.loads(cPickle.dumps(self.image1, protocol))
+            self.assertEquals(image, self.image1)
+            self.assertIs(image.region, self.image1.region)
+        self.assertEquals(copy.deepcopy(self.image1), self.image1)
+
+    def test_unpickle_old_state(self):
+        """the state of the images pickled before using __slots__ (e.g. in
+        the cache of image lists) is restored"""
+        image = GlanceSyncImage.__new__(GlanceSyncImage)
+        image.__setstate__({'name': self.name, 'id': self.id1,
+                            'region': self.region, 'owner': self.owner,
+                            'is_public': True, 'checksum': self.checksum,
+                            'size': self.size, 'status': self.status,
+                            'user_properties': self.props, 'raw': None})
+        self.assertEquals(image, self.image1)
+
 
 class TestGlanceSyncImageCompare(unittest.TestCase):
     """Class to test compare_with_masterregion under different conditions"""
@@ -266,3 +328,82 @@ class TestGlanceSyncImageCompare(unittest.TestCase):
         self.image.status = 'pending'
         r = self.image.compare_with_masterregion(self.master_images, None)
         self.assertEquals(r, '$')
+
+    def test_fingerprint(self):
+        """the fingerprints are equal only when the images are synchronised"""
+        master = self.master_images[self.name]
+        prop_eval = set(['nid', 'type'])
+        self.assertEquals(master.fingerprint(prop_eval),
+                          self.image.fingerprint(prop_eval))
+        self.assertNotEquals(master.fingerprint(None),
+                             self.image.fingerprint(None))
+        # the values of kernel_id and ramdisk_id are ignored, not its presence
+        self.image.user_properties['kernel_id'] = 450
+        self.assertNotEquals(master.fingerprint(prop_eval),
+                             self.image.fingerprint(prop_eval))
+        master.user_properties['kernel_id'] = 350
+        self.assertEquals(master.fingerprint(prop_eval),
+                          self.image.fingerprint(prop_eval))
+        self.image.is_public = False
+        self.assertNotEquals(master.fingerprint(prop_eval),
+                             self.image.fingerprint(prop_eval))
+
+    def test_fingerprint_cache(self):
+        """the digest of the properties is cached until they are modified"""
+        prop_eval = set(['nid', 'type'])
+        fingerprint = self.image.fingerprint(prop_eval)
+        self.assertIs(self.image.fingerprint(prop_eval)[2], fingerprint[2])
+        for change in (lambda p: p.__setitem__('nid', 1),
+                       lambda p: p.update(nid=2),
+                       lambda p: p.pop('nid'),
+                       lambda p: p.setdefault('nid', 3),
+                       lambda p: p.__delitem__('nid'),
+                       lambda p: p.clear()):
+            change(self.image.user_properties)
+            new_fingerprint = self.image.fingerprint(prop_eval)
+            self.assertNotEquals(new_fingerprint, fingerprint)
+            fingerprint = new_fingerprint
+        # a plain dictionary is also supported
+        self.image.user_properties = dict(self.props1)
+        r = self.image.compare_with_masterregion(self.master_images, prop_eval)
+        self.assertEquals(r, '')
+
+    def test_compare_fingerprint_cached(self):
+        """the comparison uses the fingerprints only if they are cached"""
+        master = self.master_images[self.name]
+        prop_eval = frozenset(['nid', 'type'])
+        with patch('fiwareglancesync.glancesync_image._properties_digest',
+                   wraps=_properties_digest) as digest:
+            r = self.image.compare_with_masterregion(self.master_images,
+                                                     prop_eval)
+            self.assertEquals(r, '')
+            self.assertFalse(digest.called)
+            self.image.fingerprint(prop_eval)
+            master.fingerprint(prop_eval)
+            self.assertEquals(digest.call_count, 2)
+            r = self.image.compare_with_masterregion(self.master_images,
+                                                     prop_eval)
+            self.assertEquals(r, '')
+            self.image.user_properties['nid'] = 1
+            r = self.image.compare_with_masterregion(self.master_images,
+                                                     prop_eval)
+            self.assertEquals(r, '#')
+            self.assertEquals(digest.call_count, 2)
+            self.image.fingerprint(prop_eval)
+            r = self.image.compare_with_masterregion(self.master_images,
+                                                     prop_eval)
+            self.assertEquals(r, '#')
+            self.assertEquals(digest.call_count, 3)
+
+    def test_fingerprint_not_pickled(self):
+        """the copies do not share the cache"""
+        prop_eval = set(['nid', 'type'])
+        fingerprint = self.image.fingerprint(prop_eval)
+        image = cPickle.loads(cPickle.dumps(self.image, 2))
+        image.user_properties['nid'] = 1
+        self.assertNotEquals(image.fingerprint(prop_eval), fingerprint)
+        image = copy.deepcopy(self.image)
+        self.assertEquals(image.fingerprint(prop_eval), fingerprint)
+        image.user_properties['nid'] = 1
+        self.assertNotEquals(image.fingerprint(prop_eval), fingerprint)
+        self.assertEquals(self.image.fingerprint(prop_eval), fingerprint)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+#
+import unittest
+import os
+import hashlib
+import shutil
+import sqlite3
+import tempfile
+from mock import patch
+
+from fiwareglancesync.glancesync_index import ImagesDirIndex
+from fiwareglancesync.glancesync_image import GlanceSyncImage
+
+
+class TestImagesDirIndex(unittest.TestCase):
+    """Test the index of images_dir and its incremental update"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='glancesync_index_tmp')
+        self.images_dir = os.path.join(self.tmp, 'images')
+        os.mkdir(self.images_dir)
+        self.db_path = os.path.join(self.tmp, 'index.db')
+        self.write('01', 'content1')
+        self.write('02', 'content2')
+        self.index = ImagesDirIndex(self.images_dir, self.db_path, 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, content):
+        with open(os.path.join(self.images_dir, name), 'w') as f:
+            f.write(content)
+
+    def image(self, id, content):
+        return GlanceSyncImage('image' + id, id, 'Valladolid', 'tenant1',
+                               True, hashlib.md5(content).hexdigest(),
+                               len(content))
+
+    def test_check(self):
+        """the files are checked against the size and checksum"""
+        self.assertEquals(self.index.refresh(), 2)
+        self.assertIsNone(self.index.check(self.image('01', 'content1')))
+        self.assertEquals(self.index.check(self.image('03', 'content3')),
+                          'the file does not exist')
+        self.assertIn('the MD5 of the file is',
+                      self.index.check(self.image('02', 'content3')))
+        self.assertIn('the size of the file is',
+                      self.index.check(self.image('02', 'content22')))
+
+    def test_incremental(self):
+        """only the changed files are read again, also after reloading the
+        index from the database"""
+        self.index.refresh()
+        index = ImagesDirIndex(self.images_dir, self.db_path)
+        self.assertEquals(index.get('01'), self.index.get('01'))
+        self.assertEquals(index.refresh(), 0)
+        self.write('02', 'new content')
+        os.unlink(os.path.join(self.images_dir, '01'))
+        with patch.object(ImagesDirIndex, '_md5',
+                          return_value='md5') as md5:
+            self.assertEquals(index.refresh(), 1)
+        md5.assert_called_once_with('02')
+        self.assertIsNone(index.get('01'))
+        self.assertEquals(index.get('02')['md5'], 'md5')
+        self.assertIsNone(ImagesDirIndex(self.images_dir,
+                                         self.db_path).get('01'))
+
+    def test_database_locked(self):
+        """the index is still updated in memory when the database can not
+        be written (e.g. it is locked by other process)"""
+        with patch('fiwareglancesync.glancesync_index.sqlite3.connect',
+                   side_effect=sqlite3.OperationalError('database is '
+                                                        'locked')):
+            index = ImagesDirIndex(self.images_dir, self.db_path)
+            self.assertEquals(index.refresh(), 2)
+        self.assertIsNone(index.check(self.image('01', 'content1')))
+        self.assertIsNone(ImagesDirIndex(self.images_dir,
+                                         self.db_path).get('01'))
+
+    def test_refresh_names(self):
+        """only the specified files are indexed"""
+        self.assertEquals(self.index.refresh(['02', '03']), 1)
+        self.assertIsNone(self.index.get('01'))
+        self.assertEquals(self.index.get('02')['md5'],
+                          hashlib.md5('content2').hexdigest())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+#
+import unittest
+import StringIO
+
+from fiwareglancesync.glancesync_image import GlanceSyncImage
+from fiwareglancesync.glancesync_plan import SyncPlan, dump_plans,\
+    load_plans
+
+
+class TestSyncPlan(unittest.TestCase):
+    """Test the operations of a plan and its serialisation"""
+
+    def setUp(self):
+        self.kernel = GlanceSyncImage('kernel', '01', 'Valladolid', 'tenant',
+                                      True, 'ch1', 1000, 'active',
+                                      {'type': 'kernel'})
+        self.ami = GlanceSyncImage(
+            'ami', '02', 'Valladolid', 'tenant', True, 'ch2', 5000, 'active',
+            {'type': 'ami', 'kernel_id': 'kernel'},
+            {'disk_format': 'ami', 'container_format': 'ami'})
+        self.meta = GlanceSyncImage('meta', '03', 'Valladolid', 'tenant',
+                                    True, 'ch3', 3000, 'active',
+                                    {'type': 'new'})
+        self.region_meta = GlanceSyncImage('meta', '13', 'other:Madrid',
+                                           'tenant', True, 'ch3', 3000,
+                                           'active', {'type': 'old'})
+        self.obsolete = GlanceSyncImage('old_obsolete', '14', 'other:Madrid',
+                                        'tenant', False, 'ch4', 3000,
+                                        'active')
+        tuples = [('pending_upload', self.kernel),
+                  ('ok', self.region_meta),
+                  ('pending_metadata', self.meta),
+                  ('pending_upload', self.ami)]
+        self.plan = SyncPlan('other:Madrid', tuples,
+                             {'meta': self.region_meta}, [self.obsolete])
+
+    def test_operations(self):
+        """test the order of the operations, the sizes and the dependencies;
+        synchronised images are not included"""
+        expected = [
+            {'status': 'obsolete', 'image': 'old_obsolete', 'size': 0,
+             'depends_on': []},
+            {'status': 'pending_metadata', 'image': 'meta', 'size': 0,
+             'depends_on': []},
+            {'status': 'pending_upload', 'image': 'kernel', 'size': 1000,
+             'depends_on': []},
+            {'status': 'pending_upload', 'image': 'ami', 'size': 5000,
+             'depends_on': ['kernel']}]
+        self.assertEquals(self.plan.operations(), expected)
+        self.assertEquals(self.plan.total_bytes(), 6000)
+        self.assertFalse(self.plan.is_synchronised())
+
+    def test_empty(self):
+        """test a plan without operations"""
+        plan = SyncPlan('Burgos', [('ok', self.kernel)], dict())
+        self.assertEquals(plan.operations(), [])
+        self.assertEquals(plan.total_bytes(), 0)
+        self.assertTrue(plan.is_synchronised())
+
+    def test_serialisation(self):
+        """test that a plan is the same after dumping and loading it"""
+        stream = StringIO.StringIO()
+        dump_plans([self.plan], stream)
+        stream.seek(0)
+        plans = load_plans(stream)
+        self.assertEquals(len(plans), 1)
+        plan = plans[0]
+        self.assertEquals(plan.region, 'other:Madrid')
+        self.assertEquals(plan.tuples, self.plan.tuples)
+        self.assertEquals(plan.region_images, {'meta': self.region_meta})
+        self.assertEquals(plan.obsolete, [self.obsolete])
+        self.assertEquals(plan.operations(), self.plan.operations())
+        self.assertIsInstance(plan.tuples[0][1].name, str)
+
+    def test_load_bad_version(self):
+        """test that a file with other version is rejected"""
+        stream = StringIO.StringIO('{"version": 100, "plans": []}')
+        with self.assertRaisesRegexp(Exception, 'Unsupported version'):
+            load_plans(stream)
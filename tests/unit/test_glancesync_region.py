@@ -30,6 +30,7 @@ import logging
 
 from fiwareglancesync.glancesync_region import GlanceSyncRegion
 from fiwareglancesync.glancesync_image import GlanceSyncImage
+from fiwareglancesync.glancesync_filter import MetadataFilter, PropertyIndex
 
 
 class TestGlanceSyncRegionBasic(unittest.TestCase):
@@ -216,6 +217,23 @@ class TestGlanceSyncRegion(unittest.TestCase):
         self.assertEquals(expected, set(new_dict.keys()))
         self.assertNoWarnings()
 
+    def test_images_to_sync_dict_filter(self):
+        """test method images_to_sync, with metadata_filter, with and without
+        an index of the master images"""
+        self.targets['master']['metadata_condition'] = None
+        self.targets['master']['metadata_filter'] = MetadataFilter(
+            'okhronisable == True and not has domain and not has zone')
+        self.targets['master']['forcesyncs'] = set(['010'])
+        expected = set(['image00', 'image01', 'image02', 'image03', 'image07',
+                        'image09', 'image10'])
+        new_dict = self.region.images_to_sync_dict(self.master_region_dict)
+        self.assertEquals(expected, set(new_dict.keys()))
+        index = PropertyIndex(self.master_region_dict)
+        new_dict = self.region.images_to_sync_dict(self.master_region_dict,
+                                                   index)
+        self.assertEquals(expected, set(new_dict.keys()))
+        self.assertNoWarnings()
+
     def test_local_images_filtered(self):
         """test method region_filtered"""
         region_filtered = self.region.local_images_filtered(
@@ -458,6 +476,33 @@ class TestGlanceSyncRegion(unittest.TestCase):
         expected_as_list = list(x[1].name + '_' + x[0] for x in expected)
         self.assertEqual(expected_as_list, result_as_list)
 
+    def test_images_to_adopt(self):
+        """Check the images of the region with the checksum of a master image
+        pending to upload are adopted"""
+        self.master_region_dict['image01'].checksum = 'checksum01'
+        self.master_region_dict['image02'].checksum = 'checksum02'
+        self.master_region_dict['image09'].checksum = 'checksum09'
+        del self.region_dict['image01']
+        del self.region_dict['image02']
+        del self.region_dict['image09']
+        renamed = self.dup_image(self.master_region_dict['image01'], 'Burgos',
+                                 21, '1')
+        renamed.name = 'renamed01'
+        other_tenant = self.dup_image(self.master_region_dict['image02'],
+                                      'Burgos', 22, '1')
+        other_tenant.name = 'renamed02'
+        other_tenant.owner = 'othertenant'
+        in_master = self.dup_image(self.master_region_dict['image09'],
+                                   'Burgos', 29, '1')
+        in_master.name = 'image08'
+        images_region = self.region_dict.values() + [
+            renamed, other_tenant, in_master]
+        tuples = self.region.image_list_to_sync(self.master_region_dict,
+                                                images_region)
+        result = self.region.images_to_adopt(self.master_region_dict,
+                                             images_region, tuples)
+        self.assertEquals({'image01': renamed}, result)
+
 
 class TestGlanceSyncRegionObsoletedImages(unittest.TestCase):
     def _create_images(self, name):
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+#
+import unittest
+import threading
+import StringIO
+
+from fiwareglancesync.glancesync_scheduler import TokenBucket, UploadScheduler
+from fiwareglancesync.glancesync_streams import ThrottledReader
+
+
+class FakeClock(object):
+    """clock that only advances when sleeping"""
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = list()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test the rate limit"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(100, clock=self.clock.time,
+                                  sleep=self.clock.sleep)
+
+    def test_burst(self):
+        """the capacity is consumed without waiting"""
+        self.bucket.consume(60)
+        self.bucket.consume(40)
+        self.assertEquals(self.clock.sleeps, [])
+
+    def test_wait(self):
+        """when the budget is exhausted, wait the time needed to transfer
+        the data at the configured rate"""
+        self.bucket.consume(100)
+        self.bucket.consume(50)
+        self.assertEquals(self.clock.sleeps, [0.5])
+        self.bucket.consume(100)
+        self.assertEquals(self.clock.sleeps, [0.5, 1.0])
+
+    def test_refill(self):
+        """the budget is recovered with the time"""
+        self.bucket.consume(100)
+        self.clock.now += 1
+        self.bucket.consume(100)
+        self.assertEquals(self.clock.sleeps, [])
+
+    def test_no_limit(self):
+        """a rate of zero means no limit"""
+        bucket = TokenBucket(0, clock=self.clock.time, sleep=self.clock.sleep)
+        bucket.consume(10 ** 12)
+        self.assertEquals(self.clock.sleeps, [])
+
+    def test_throttled_reader(self):
+        """the reads of ThrottledReader consume the bucket"""
+        reader = ThrottledReader(StringIO.StringIO('a' * 250), self.bucket)
+        self.assertEquals(''.join(reader), 'a' * 250)
+        self.assertEquals(self.clock.sleeps, [1.5])
+
+
+class TestUploadScheduler(unittest.TestCase):
+    """Test the order of the uploads, the limits and the errors"""
+
+    def setUp(self):
+        self.order = list()
+        self.lock = threading.Lock()
+
+    def upload(self, region, name, error=False):
+        def function(bucket):
+            with self.lock:
+                self.order.append((region, name))
+            if error:
+                raise Exception('upload error')
+        return function
+
+    def add(self, scheduler, region, name, size, depends_on=None,
+            error=False, after=None):
+        scheduler.add(region, name, size, self.upload(region, name, error),
+                      depends_on, after)
+
+    def _add_jobs(self, scheduler):
+        self.add(scheduler, 'r1', 'big', 300)
+        self.add(scheduler, 'r1', 'small', 10)
+        self.add(scheduler, 'r2', 'medium', 100)
+        self.add(scheduler, 'r3', 'image', 200)
+
+    def test_smallest(self):
+        """the smallest image goes first"""
+        scheduler = UploadScheduler(policy='smallest')
+        self._add_jobs(scheduler)
+        self.assertEquals(scheduler.run(), [])
+        self.assertEquals(self.order, [('r1', 'small'), ('r2', 'medium'),
+                                       ('r3', 'image'), ('r1', 'big')])
+
+    def test_priority(self):
+        """the regions in preferable_order go first"""
+        scheduler = UploadScheduler(policy='priority',
+                                    preferable_order=['r3', 'r1'])
+        self._add_jobs(scheduler)
+        scheduler.run()
+        self.assertEquals(self.order, [('r3', 'image'), ('r1', 'small'),
+                                       ('r1', 'big'), ('r2', 'medium')])
+
+    def test_completion(self):
+        """the region with less bytes pending goes first"""
+        scheduler = UploadScheduler(policy='completion')
+        self._add_jobs(scheduler)
+        scheduler.run()
+        self.assertEquals(self.order, [('r2', 'medium'), ('r3', 'image'),
+                                       ('r1', 'small'), ('r1', 'big')])
+
+    def test_dependencies(self):
+        """an upload waits for the images it depends on, even if they are
+        bigger"""
+        scheduler = UploadScheduler(max_uploads=4)
+        scheduler.add_region('r1', 4)
+        self.add(scheduler, 'r1', 'ami', 10, ['kernel', 'ramdisk'])
+        self.add(scheduler, 'r1', 'kernel', 100)
+        self.add(scheduler, 'r1', 'ramdisk', 200)
+        self.assertEquals(scheduler.run(), [])
+        self.assertEquals(self.order[2], ('r1', 'ami'))
+
+    def test_error(self):
+        """after an error, the pending uploads of the region are discarded,
+        but not the uploads of other regions"""
+        scheduler = UploadScheduler()
+        self.add(scheduler, 'r1', 'image1', 10, error=True)
+        self.add(scheduler, 'r1', 'image2', 20)
+        self.add(scheduler, 'r2', 'image3', 30)
+        self.assertEquals(scheduler.run(), ['r1'])
+        self.assertEquals(self.order, [('r1', 'image1'), ('r2', 'image3')])
+
+    def test_missing_dependency(self):
+        """an upload whose dependency is not scheduled fails"""
+        scheduler = UploadScheduler()
+        self.add(scheduler, 'r1', 'ami', 10, ['kernel'])
+        self.assertEquals(scheduler.run(), ['r1'])
+        self.assertEquals(self.order, [])
+
+    def test_after(self):
+        """an upload waits for the uploads of other regions it goes after,
+        even if they fail"""
+        scheduler = UploadScheduler(max_uploads=4)
+        self.add(scheduler, 'r2', 'image', 10, after=[('r1', 'image')])
+        self.add(scheduler, 'r3', 'image', 10, after=[('r2', 'image')])
+        self.add(scheduler, 'r1', 'image', 100, error=True)
+        self.assertEquals(scheduler.run(), ['r1'])
+        self.assertEquals(self.order, [('r1', 'image'), ('r2', 'image'),
+                                       ('r3', 'image')])
+
+    def test_after_not_scheduled(self):
+        """an upload is not delayed by the uploads that are not scheduled"""
+        scheduler = UploadScheduler()
+        self.add(scheduler, 'r2', 'image', 10, after=[('r1', 'image')])
+        self.assertEquals(scheduler.run(), [])
+        self.assertEquals(self.order, [('r2', 'image')])
+
+    def test_limits(self):
+        """check the global limit and the limit by region"""
+        running = dict()
+        maximum = dict()
+        barrier = threading.Semaphore(0)
+
+        def upload(region):
+            def function(bucket):
+                with self.lock:
+                    running[region] = running.get(region, 0) + 1
+                    running['all'] = running.get('all', 0) + 1
+                    for key in (region, 'all'):
+                        maximum[key] = max(maximum.get(key, 0), running[key])
+                barrier.acquire()
+                with self.lock:
+                    running[region] -= 1
+                    running['all'] -= 1
+            return function
+
+        scheduler = UploadScheduler(max_uploads=3)
+        scheduler.add_region('r1', 2)
+        for i in range(4):
+            scheduler.add('r1', 'image' + str(i), i, upload('r1'))
+            scheduler.add('r2', 'image' + str(i), i, upload('r2'))
+        for i in range(8):
+            barrier.release()
+        self.assertEquals(scheduler.run(), [])
+        self.assertTrue(maximum['all'] <= 3)
+        self.assertTrue(maximum['r1'] <= 2)
+        self.assertEquals(maximum['r2'], 1)
@@ -28,11 +28,17 @@ import os
 import tempfile
 import unittest
 import copy
+import StringIO
+import threading
+import time
 from mock import patch, MagicMock, call, ANY
 from keystoneclient.auth.identity import v2, v3
 from multiprocessing import TimeoutError
 
+from fiwareglancesync import glancesync_serversfacade
 from fiwareglancesync.glancesync_serversfacade import ServersFacade, GlanceFacadeException
+from fiwareglancesync.glancesync_serversfacade import ServersFacadeV2
+from fiwareglancesync.glancesync_serversfacade import GlanceFacadeChecksumException
 from fiwareglancesync.glancesync_image import GlanceSyncImage
 from fiwareglancesync.glancesync_region import GlanceSyncRegion
 
@@ -126,7 +132,7 @@ class TestGlanceServersFacadeM(unittest.TestCase):
         ]
         self.assertListEqual(mock_osclients.mock_calls, calls)
 
-    @patch('fiwareglancesync.glancesync_serversfacade.Pool')
+    @patch('fiwareglancesync.glancesync_serversfacade._get_pool')
     def test_list(self, mock_pool):
         """test list method. Check that apply_async method of the pool is
         invoked passing the glance_client"""
@@ -136,7 +142,7 @@ class TestGlanceServersFacadeM(unittest.TestCase):
         mock_pool.return_value.apply_async.assert_called_once_with(
             ANY, (glance_client,))
 
-    @patch('fiwareglancesync.glancesync_serversfacade.Pool')
+    @patch('fiwareglancesync.glancesync_serversfacade._get_pool')
     def test_list_ex_timeout(self, mock_pool):
         """test TimeoutError exception with list operation"""
         config = {'apply_async.return_value.get.side_effect': TimeoutError()}
@@ -145,7 +151,7 @@ class TestGlanceServersFacadeM(unittest.TestCase):
         with self.assertRaisesRegexp(GlanceFacadeException, msg):
             self.facade.get_imagelist(self.region_obj)
 
-    @patch('fiwareglancesync.glancesync_serversfacade.Pool')
+    @patch('fiwareglancesync.glancesync_serversfacade._get_pool')
     def test_list_ex(self, mock_pool):
         """test an exception with list operation"""
         config = {'apply_async.return_value.get.side_effect': Exception('not found')}
@@ -154,6 +160,101 @@ class TestGlanceServersFacadeM(unittest.TestCase):
         with self.assertRaisesRegexp(GlanceFacadeException, msg):
             self.facade.get_imagelist(self.region_obj)
 
+    def test_list_real_pool(self):
+        """test list method using the shared pool; the images are converted
+        to GlanceSyncImage objects"""
+        raw = {'name': 'imagetest', 'id': '01', 'owner': 'tenantid1',
+               'is_public': True, 'checksum': 'ch1', 'size': 10,
+               'status': 'active', 'properties': {'type': 'baseimage'}}
+        glance_image = MagicMock()
+        glance_image.to_dict.return_value = raw
+        config = {'get_glanceclient.return_value.images.list.return_value':
+                  [glance_image]}
+        self.facade.osclients.configure_mock(**config)
+        images = self.facade.get_imagelist(self.region_obj)
+        self.assertEquals(len(images), 1)
+        self.assertEquals(images[0].name, 'imagetest')
+        self.assertEquals(images[0].user_properties, {'type': 'baseimage'})
+
+    def test_list_real_timeout(self):
+        """test that the timeout works with the shared pool"""
+        config = {'get_glanceclient.return_value.images.list.side_effect':
+                  lambda: time.sleep(1) or []}
+        self.facade.osclients.configure_mock(**config)
+        self.region_obj.target['list_images_timeout'] = 0.1
+        msg = 'fakeregion: Timeout while retrieving image list.'
+        with self.assertRaisesRegexp(GlanceFacadeException, msg):
+            self.facade.get_imagelist(self.region_obj)
+
+    def test_list_socket_timeout(self):
+        """test that the client used to list has a socket timeout, so a
+        request to a hung server releases its thread of the pool"""
+        config = {'get_glanceclient.return_value.images.list.return_value':
+                  []}
+        self.facade.osclients.configure_mock(**config)
+        self.region_obj.target['list_images_timeout'] = 10
+        self.facade.get_imagelist(self.region_obj)
+        self.facade.osclients.get_glanceclient.assert_called_with(
+            'fakeregion', timeout=20)
+
+    def test_list_queue_not_counted(self):
+        """test that the time waiting for a free thread of the pool is not
+        part of the timeout"""
+        config = {'get_glanceclient.return_value.images.list.side_effect':
+                  lambda: time.sleep(0.3) or []}
+        self.facade.osclients.configure_mock(**config)
+        self.region_obj.target['list_images_timeout'] = 0.5
+        with patch.object(glancesync_serversfacade, '_list_workers', 1):
+            with patch.object(glancesync_serversfacade, '_pool', None):
+                threads = list(threading.Thread(
+                    target=self.facade.get_imagelist,
+                    args=(self.region_obj,)) for i in range(2))
+                for thread in threads:
+                    thread.start()
+                time.sleep(0.05)
+                # the third listing waits 0.6 seconds in the queue
+                self.assertEquals(
+                    self.facade.get_imagelist(self.region_obj), [])
+                for thread in threads:
+                    thread.join()
+                glancesync_serversfacade._pool.terminate()
+        self.facade.osclients.get_glanceclient.return_value.images.list.\
+            side_effect = None
+
+    def test_fingerprint(self):
+        """test that the fingerprint is the id and updated_at of the last
+        updated image, including the deleted ones"""
+        glance_image = MagicMock(id='01', updated_at='2016-01-01T10:00:00')
+        config = {'get_glanceclient.return_value.images.list.return_value':
+                  [glance_image]}
+        self.facade.osclients.configure_mock(**config)
+        self.assertEquals(
+            self.facade.get_imagelist_fingerprint(self.region_obj),
+            ('01', '2016-01-01T10:00:00'))
+        self.facade.osclients.get_glanceclient.return_value.images.list.\
+            assert_called_once_with(
+                sort_key='updated_at', sort_dir='desc', limit=1, page_size=1,
+                filters={'changes-since': '1970-01-01T00:00:00'})
+
+    def test_fingerprint_empty(self):
+        """test the fingerprint of a region without images"""
+        config = {'get_glanceclient.return_value.images.list.return_value':
+                  []}
+        self.facade.osclients.configure_mock(**config)
+        self.assertEquals(
+            self.facade.get_imagelist_fingerprint(self.region_obj), ())
+
+    def test_pool_shared(self):
+        """test that the pool is created only once, unless the process is
+        forked"""
+        pool = glancesync_serversfacade._get_pool()
+        self.assertIs(pool, glancesync_serversfacade._get_pool())
+        with patch('fiwareglancesync.glancesync_serversfacade.os.getpid',
+                   return_value=-1):
+            new_pool = glancesync_serversfacade._get_pool()
+        new_pool.terminate()
+        self.assertIsNot(pool, new_pool)
+
     def test_upload(self):
         """test the upload method: the id is the passed to the glancesync
         mock"""
@@ -168,6 +269,73 @@ class TestGlanceServersFacadeM(unittest.TestCase):
         result = self.facade.upload_image(self.region_obj, self.image)
         self.assertEquals(result, self.image.id)
 
+    def test_upload_data(self):
+        """test the upload method with a file-like object: images_dir is not
+        used and the size is passed explicitly"""
+        config = {'get_glanceclient.return_value.images.create.return_value':
+                  self.image}
+        self.facade.osclients.configure_mock(**config)
+        data = StringIO.StringIO('test content')
+        result = self.facade.upload_image(self.region_obj, self.image, data)
+        self.assertEquals(result, self.image.id)
+        create = self.facade.osclients.get_glanceclient.return_value.images.\
+            create
+        self.assertEquals(create.call_args[1]['data'], data)
+        self.assertEquals(create.call_args[1]['size'], self.image.size)
+
+    def upload_checked(self, content, checksum, glance):
+        """upload an image with the content and checksum, using a client
+        that reads the data as glanceclient does"""
+        def create(**kwargs):
+            while kwargs['data'].read(4):
+                pass
+            return MagicMock(id='05')
+        self.facade._get_glanceclient = MagicMock(return_value=glance)
+        glance.images.create.side_effect = create
+        self.image.checksum = checksum
+        self.image.size = len(content)
+        return self.facade.upload_image(self.region_obj, self.image,
+                                        StringIO.StringIO(content))
+
+    def test_upload_verified(self):
+        """test that the content is verified while it is uploaded"""
+        glance = MagicMock()
+        result = self.upload_checked('test content',
+                                     '9473fdd0d880a43c21b7778d34872157',
+                                     glance)
+        self.assertEquals(result, '05')
+        self.assertFalse(glance.images.get.called)
+
+    def test_upload_corrupt(self):
+        """test that the upload fails if the content does not match the
+        checksum"""
+        glance = MagicMock()
+        msg = 'fakeregion: Content of imagetest is corrupt. Cause: md5 '\
+            'mismatch'
+        with self.assertRaisesRegexp(GlanceFacadeChecksumException, msg):
+            self.upload_checked('test content', 'bad', glance)
+
+    def test_upload_corrupt_swallowed(self):
+        """test that the new image is deleted when the client does not
+        propagate the error of the content"""
+        glance = MagicMock()
+
+        def create(**kwargs):
+            try:
+                kwargs['data'].read()
+            except IOError:
+                pass
+            return MagicMock(id='05')
+        self.facade._get_glanceclient = MagicMock(return_value=glance)
+        glance.images.create.side_effect = create
+        self.image.checksum = 'bad'
+        self.image.size = 12
+        with self.assertRaises(GlanceFacadeChecksumException):
+            self.facade.upload_image(self.region_obj, self.image,
+                                     StringIO.StringIO('test content'))
+        glance.images.get.assert_called_with('05')
+        glance.images.get.return_value.delete.assert_called_with()
+
     def test_upload_ex(self):
         """test an exception in the upload method"""
         config = {'get_glanceclient.return_value.images.create.side_effect':
@@ -193,6 +361,84 @@ class TestGlanceServersFacadeM(unittest.TestCase):
         with self.assertRaisesRegexp(GlanceFacadeException, msg):
             self.facade.upload_image(self.region_obj, self.image)
 
+    @patch('fiwareglancesync.glancesync_serversfacade.time.sleep')
+    def test_copy(self, sleep):
+        """test that the image is created with copy_from and the status is
+        polled until it is active"""
+        glance = MagicMock()
+        self.facade._get_glanceclient = MagicMock(return_value=glance)
+        glance.images.create.return_value = MagicMock(id='05')
+        glance.images.get.side_effect = [
+            MagicMock(status='queued'), MagicMock(status='saving'),
+            MagicMock(status='active')]
+        result = self.facade.copy_image(self.region_obj, self.image,
+                                        'http://master/01')
+        self.assertEquals(result, '05')
+        self.assertEquals(glance.images.create.call_args[1]['copy_from'],
+                          'http://master/01')
+        self.assertEquals(sleep.call_count, 2)
+
+    @patch('fiwareglancesync.glancesync_serversfacade.time.sleep')
+    def test_copy_killed(self, sleep):
+        """test that an image that can not be downloaded is deleted"""
+        glance = MagicMock()
+        self.facade._get_glanceclient = MagicMock(return_value=glance)
+        glance.images.create.return_value = MagicMock(id='05')
+        glance.images.get.return_value = MagicMock(status='killed')
+        msg = 'fakeregion: Copy of imagetest Failed. Cause: the image is '\
+            'killed'
+        with self.assertRaisesRegexp(GlanceFacadeException, msg):
+            self.facade.copy_image(self.region_obj, self.image,
+                                   'http://master/01')
+        glance.images.get.return_value.delete.assert_called_with()
+
+    @patch('fiwareglancesync.glancesync_serversfacade.time')
+    def test_copy_timeout(self, time_mock):
+        """test that the copy fails if the image is not active before the
+        timeout"""
+        glance = MagicMock()
+        self.facade._get_glanceclient = MagicMock(return_value=glance)
+        glance.images.create.return_value = MagicMock(id='05')
+        glance.images.get.return_value = MagicMock(status='saving')
+        time_mock.time.side_effect = [1000, 1005, 1011]
+        msg = 'fakeregion: Copy of imagetest Failed. Cause: timeout; the '\
+            'image is saving'
+        with self.assertRaisesRegexp(GlanceFacadeException, msg):
+            self.facade.copy_image(self.region_obj, self.image,
+                                   'http://master/01', 10)
+        self.assertEquals(time_mock.sleep.call_count, 1)
+
+    def test_register_location(self):
+        """test that the image is created with the location"""
+        glance = MagicMock()
+        self.facade._get_glanceclient = MagicMock(return_value=glance)
+        glance.images.create.return_value = MagicMock(id='05')
+        result = self.facade.register_location(self.region_obj, self.image,
+                                               'rbd://fsid/images/01/snap')
+        self.assertEquals(result, '05')
+        self.assertEquals(glance.images.create.call_args[1]['location'],
+                          'rbd://fsid/images/01/snap')
+
+    def test_download(self):
+        """test that the content of the image is returned as a file"""
+        glance = MagicMock()
+        self.facade._get_glanceclient = MagicMock(return_value=glance)
+        glance.images.data.return_value = iter(['abc', 'def', 'g'])
+        data = self.facade.download_image(self.region_obj, '01')
+        self.assertEquals(data.read(4), 'abcd')
+        self.assertEquals(data.read(), 'efg')
+        self.assertEquals(data.read(), '')
+        glance.images.data.assert_called_with('01')
+
+    def test_download_ex(self):
+        """test an exception downloading the image"""
+        glance = MagicMock()
+        self.facade._get_glanceclient = MagicMock(return_value=glance)
+        glance.images.data.side_effect = Exception('not found')
+        msg = 'fakeregion: Download of the image 01 Failed. Cause: not found'
+        with self.assertRaisesRegexp(GlanceFacadeException, msg):
+            self.facade.download_image(self.region_obj, '01')
+
     def test_update(self):
         """test update metadata. Check that the last call is the update over
         the image with the expected params"""
@@ -234,6 +480,221 @@ class TestGlanceServersFacadeM(unittest.TestCase):
         self.assertEquals(str(cm.exception), msg)
 
 
+class TestGlanceServersFacadeV2M(unittest.TestCase):
+    """Test the facade of the glance API v2 using a mock"""
+    @patch('fiwareglancesync.glancesync_serversfacade.OpenStackClients')
+    def setUp(self, osclients):
+        """create self.facade, using the version 2 of the API, and a
+        GlanceSyncImage object"""
+        target = {'target_name': 'master', 'user': 'fakeuser',
+                  'password': 'fakepassword',
+                  'keystone_url': 'http://127.0.0.1/',
+                  'tenant': 'faketenant', 'use_keystone_v3': False}
+        self.region_obj = GlanceSyncRegion('fakeregion', {'master': target})
+        self.facade = ServersFacadeV2(target)
+        self.facade.images_dir = None
+
+        self.image = GlanceSyncImage('imagetest', '01', 'fakeregion', None,
+                                     False)
+        self.image.raw = {'disk_format': 'qcow2', 'protected': False,
+                          'container_format': 'bare', 'min_ram': '0',
+                          'min_disk': '0'}
+        self.glance = self.facade.osclients.get_glanceclient.return_value
+        self.raw_images = [
+            {'id': '01', 'name': 'image1', 'owner': 'tenantid1',
+             'visibility': 'public', 'checksum': 'ch1', 'size': 1000,
+             'status': 'active', 'disk_format': 'qcow2', 'protected': False,
+             'type': 'base', 'kernel_id': '02'},
+            {'id': '03', 'name': 'image3', 'owner': 'tenantid1',
+             'visibility': 'private', 'checksum': None, 'size': None,
+             'status': 'queued', 'disk_format': 'qcow2', 'protected': False}]
+
+    def tearDown(self):
+        """delete the tempfile use to test the upload method"""
+        if self.facade.images_dir:
+            os.unlink(self.facade.images_dir + '/01')
+            os.rmdir(self.facade.images_dir)
+
+    def test_list(self):
+        """test that the images are converted and the filters are passed to
+        the server"""
+        self.glance.images.list.return_value = self.raw_images
+        images = self.facade.get_imagelist(
+            self.region_obj, {'owner': 'tenantid1', 'status': 'active'})
+        self.facade.osclients.get_glanceclient.assert_called_with(
+            'fakeregion', version='2', timeout=60)
+        self.glance.images.list.assert_called_once_with(
+            filters={'owner': 'tenantid1', 'status': 'active'},
+            page_size=glancesync_serversfacade._v2_page_size)
+        images.sort(key=lambda image: image.id)
+        self.assertEquals(len(images), 2)
+        self.assertEquals(images[0].user_properties,
+                          {'type': 'base', 'kernel_id': '02'})
+        self.assertTrue(images[0].is_public)
+        self.assertEquals(images[0].raw['disk_format'], 'qcow2')
+        self.assertFalse(images[1].is_public)
+        self.assertEquals(images[1].size, 0)
+        self.assertEquals(images[1].user_properties, {})
+
+    def test_fingerprint(self):
+        """test that the API v2 does not support the fingerprint: it is
+        None, without listing the images"""
+        self.assertIsNone(
+            self.facade.get_imagelist_fingerprint(self.region_obj))
+        self.assertFalse(self.glance.images.list.called)
+
+    def test_list_names(self):
+        """test that the names are requested in batches and the duplicated
+        images are ignored"""
+        self.glance.images.list.return_value = self.raw_images[:1]
+        names = set('image' + str(i) for i in range(60))
+        images = self.facade.get_imagelist(self.region_obj, {'names': names})
+        self.assertEquals(len(images), 1)
+        self.assertEquals(self.glance.images.list.call_count, 2)
+        query = self.glance.images.list.call_args_list[0][1]['filters']
+        self.assertTrue(query['name'].startswith('in:"image0","image1",'))
+        self.assertEquals(query['name'].count(','), 49)
+
+    def test_list_names_unsupported(self):
+        """test that all the images are listed if the server does not
+        support the 'in:' operator"""
+        def list_images(filters, page_size):
+            if 'name' in filters:
+                raise Exception('Invalid filter')
+            return self.raw_images
+        self.glance.images.list.side_effect = list_images
+        images = self.facade.get_imagelist(self.region_obj,
+                                           {'names': set(['image1'])})
+        self.assertEquals(len(images), 2)
+
+    def test_list_ex(self):
+        """test that an error listing is converted to GlanceFacadeException"""
+        self.glance.images.list.side_effect = Exception('connection refused')
+        msg = 'fakeregion: Error retrieving image list. Cause: connection '\
+            'refused'
+        with self.assertRaisesRegexp(GlanceFacadeException, msg):
+            self.facade.get_imagelist(self.region_obj)
+
+    def test_update(self):
+        """test that the properties are sent as attributes and the
+        properties not included in the image are removed"""
+        self.glance.images.get.return_value = {
+            'id': '01', 'name': 'imagetest', 'old_property': 'old',
+            'status': 'active'}
+        self.image.user_properties['new_property'] = 1
+        self.facade.update_metadata(self.region_obj, self.image)
+        self.glance.images.update.assert_called_with(
+            '01', remove_props=['old_property'], name='imagetest',
+            visibility='private', protected=False, new_property='1')
+
+    def test_update_unicode(self):
+        """test that the unicode values (as returned by the API v2) with
+        non-ASCII characters are sent unchanged"""
+        self.glance.images.get.return_value = {
+            'id': '01', 'name': 'imagetest', 'status': 'active'}
+        self.image.user_properties['description'] = u'Telef\xf3nica'
+        self.facade.update_metadata(self.region_obj, self.image)
+        self.assertEquals(
+            self.glance.images.update.call_args[1]['description'],
+            u'Telef\xf3nica')
+
+    def test_update_ex(self):
+        """test and exception during the update"""
+        self.glance.images.get.side_effect = Exception('bad attribute')
+        msg = 'fakeregion: Update of imagetest failed. Cause: bad attribute'
+        with self.assertRaisesRegexp(GlanceFacadeException, msg):
+            self.facade.update_metadata(self.region_obj, self.image)
+
+    def test_upload(self):
+        """test that the image is created and then the content is
+        uploaded"""
+        self.glance.images.create.return_value = {'id': '05'}
+        self.facade.images_dir = tempfile.mkdtemp(prefix='imagesdir_tmp')
+        with open(self.facade.images_dir + '/01', 'w') as file_obj:
+            file_obj.write('test content')
+
+        result = self.facade.upload_image(self.region_obj, self.image)
+        self.assertEquals(result, '05')
+        self.assertEquals(self.glance.images.create.call_args[1]['visibility'],
+                          'private')
+        self.assertEquals(self.glance.images.upload.call_args[0][0], '05')
+
+    def test_upload_data(self):
+        """test the upload method with a file-like object: the size is
+        passed explicitly"""
+        self.glance.images.create.return_value = {'id': '05'}
+        data = StringIO.StringIO('test content')
+        self.image.size = 12
+        self.facade.upload_image(self.region_obj, self.image, data)
+        self.glance.images.upload.assert_called_with('05', data,
+                                                     image_size=12)
+
+    @patch('fiwareglancesync.glancesync_serversfacade.time.sleep')
+    def test_copy(self, sleep):
+        """test that the image is imported with the web-download method"""
+        self.glance.images.create.return_value = {'id': '05'}
+        self.glance.images.get.return_value = MagicMock(status='active')
+        result = self.facade.copy_image(self.region_obj, self.image,
+                                        'http://master/01')
+        self.assertEquals(result, '05')
+        self.glance.images.image_import.assert_called_with(
+            '05', method='web-download', uri='http://master/01')
+
+    def test_upload_multihash(self):
+        """test that the multihash of the image is verified too, and that
+        the new image is deleted if the content is corrupt"""
+        def upload(id, data, image_size=None):
+            data.read()
+        self.glance.images.create.return_value = {'id': '05'}
+        self.glance.images.upload.side_effect = upload
+        self.image.checksum = '9473fdd0d880a43c21b7778d34872157'
+        self.image.size = 12
+        self.image.raw['os_hash_algo'] = 'sha256'
+        self.image.raw['os_hash_value'] = 'bad'
+        msg = 'fakeregion: Content of imagetest is corrupt. Cause: sha256 '\
+            'mismatch'
+        with self.assertRaisesRegexp(GlanceFacadeChecksumException, msg):
+            self.facade.upload_image(self.region_obj, self.image,
+                                     StringIO.StringIO('test content'))
+        self.glance.images.delete.assert_called_with('05')
+
+    def test_register_location(self):
+        """test that the location is added to the new image"""
+        self.glance.images.create.return_value = {'id': '05'}
+        result = self.facade.register_location(self.region_obj, self.image,
+                                               'rbd://fsid/images/01/snap')
+        self.assertEquals(result, '05')
+        self.glance.images.add_location.assert_called_with(
+            '05', 'rbd://fsid/images/01/snap', {})
+
+    def test_register_location_ex(self):
+        """test that the image is deleted if the location can not be
+        added"""
+        self.glance.images.create.return_value = {'id': '05'}
+        self.glance.images.add_location.side_effect = Exception('forbidden')
+        msg = 'fakeregion: Registration of the location of imagetest '\
+            'Failed. Cause: forbidden'
+        with self.assertRaisesRegexp(GlanceFacadeException, msg):
+            self.facade.register_location(self.region_obj, self.image,
+                                          'rbd://fsid/images/01/snap')
+        self.glance.images.delete.assert_called_with('05')
+
+    def test_delete(self):
+        """test that the delete method of the API v2 is called"""
+        self.facade.delete_image(self.region_obj, self.image.id, False)
+        self.glance.images.delete.assert_called_with('01')
+
+    def test_delete_ex(self):
+        """test and exception during the delete operation"""
+        self.glance.images.delete.side_effect = Exception('image is '
+                                                          'protected')
+        msg = 'fakeregion: Deletion of image 01 Failed. Cause: image is '\
+            'protected'
+        with self.assertRaises(GlanceFacadeException) as cm:
+            self.facade.delete_image(self.region_obj, self.image.id, False)
+        self.assertEquals(str(cm.exception), msg)
+
+
 def _unset_environment():
     """Clean environment, to ensure that osclients get information from
     setter methods. Environment is restored after the test
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+#
+import unittest
+import hashlib
+import os
+import shutil
+import StringIO
+import tempfile
+import threading
+import time
+from mock import MagicMock
+
+from fiwareglancesync.glancesync_source import LocalImageSource
+from fiwareglancesync.glancesync_source import RemoteImageSource
+from fiwareglancesync.glancesync_image import GlanceSyncImage
+from fiwareglancesync.glancesync_region import GlanceSyncRegion
+
+
+class TestLocalImageSource(unittest.TestCase):
+    """Test that the images are read from images_dir"""
+
+    def test_open(self):
+        images_dir = tempfile.mkdtemp(prefix='glancesync_source_tmp')
+        try:
+            with open(os.path.join(images_dir, '01'), 'w') as f:
+                f.write('content')
+            source = LocalImageSource(images_dir)
+            image = GlanceSyncImage('image1', '01', 'Valladolid')
+            file_obj = source.open(image)
+            self.assertEquals(file_obj.read(), 'content')
+            file_obj.close()
+            image.id = '02'
+            self.assertRaises(IOError, source.open, image)
+        finally:
+            shutil.rmtree(images_dir)
+
+
+class TestRemoteImageSource(unittest.TestCase):
+    """Test the staging cache of the images downloaded from the master
+    glance server"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='glancesync_source_tmp')
+        self.staging_dir = os.path.join(self.tmp, 'staging')
+        self.facade = MagicMock()
+        self.facade.download_image.side_effect = \
+            lambda region, id: StringIO.StringIO(id * 1024 * 256)
+        targets = {'master': {'target_name': 'master',
+                              'facade': self.facade}}
+        self.region = GlanceSyncRegion('Valladolid', targets)
+        # each image is 256 KB (1 character ids) and the capacity is 1 MB
+        self.images = dict(
+            (id, GlanceSyncImage('image' + id, id, 'Valladolid', size=262144))
+            for id in 'abcdef')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def read(self, source, id):
+        file_obj = source.open(self.images[id])
+        try:
+            return file_obj.read()
+        finally:
+            file_obj.close()
+
+    def downloads(self):
+        return list(c[0][1] for c in self.facade.download_image.call_args_list)
+
+    def test_downloaded_once(self):
+        """an image is downloaded once and read from the staging area"""
+        source = RemoteImageSource(self.region, self.staging_dir, 1)
+        self.assertEquals(self.read(source, 'a'), 'a' * 262144)
+        self.assertEquals(self.read(source, 'a'), 'a' * 262144)
+        self.assertEquals(self.downloads(), ['a'])
+        self.assertEquals(os.listdir(self.staging_dir), ['a'])
+
+    def test_lru(self):
+        """the least recently used images are removed when the capacity is
+        exceeded"""
+        source = RemoteImageSource(self.region, self.staging_dir, 1)
+        for id in 'abcd':
+            self.read(source, id)
+        self.read(source, 'a')
+        self.read(source, 'e')
+        self.assertEquals(sorted(os.listdir(self.staging_dir)),
+                          ['a', 'c', 'd', 'e'])
+        self.assertEquals(source.staged_bytes(), 4 * 262144)
+        self.read(source, 'b')
+        self.assertEquals(self.downloads(), list('abcdeb'))
+
+    def test_pinned(self):
+        """the images being read are not removed"""
+        source = RemoteImageSource(self.region, self.staging_dir, 1)
+        opened = list(source.open(self.images[id]) for id in 'abcde')
+        self.assertEquals(len(os.listdir(self.staging_dir)), 5)
+        self.assertEquals(opened[0].read(1), 'a')
+        for file_obj in opened:
+            file_obj.close()
+        self.assertEquals(sorted(os.listdir(self.staging_dir)),
+                          ['b', 'c', 'd', 'e'])
+
+    def test_previous_run(self):
+        """the images staged by a previous run are reused and the abandoned
+        partial downloads are removed, but not the ones in progress"""
+        source = RemoteImageSource(self.region, self.staging_dir, 1)
+        self.read(source, 'a')
+        for name in ('.staging_x', '.staging_y'):
+            with open(os.path.join(self.staging_dir, name), 'w') as f:
+                f.write('partial')
+        old = time.time() - 7200
+        os.utime(os.path.join(self.staging_dir, '.staging_x'), (old, old))
+        source = RemoteImageSource(self.region, self.staging_dir, 1)
+        self.assertEquals(self.read(source, 'a'), 'a' * 262144)
+        self.assertEquals(self.downloads(), ['a'])
+        self.assertEquals(sorted(os.listdir(self.staging_dir)),
+                          ['.staging_y', 'a'])
+
+    def test_removed_by_other_process(self):
+        """a staged image removed by other process (e.g. a child of
+        --parallel sharing the staging area) is downloaded again"""
+        source = RemoteImageSource(self.region, self.staging_dir, 1)
+        other = RemoteImageSource(self.region, self.staging_dir, 1)
+        self.read(source, 'a')
+        os.unlink(os.path.join(self.staging_dir, 'a'))
+        self.assertEquals(self.read(other, 'a'), 'a' * 262144)
+        self.assertEquals(self.downloads(), ['a', 'a'])
+        self.assertEquals(other.staged_bytes(), 262144)
+
+    def test_download_error(self):
+        """a failed download raises IOError and leaves nothing staged"""
+        self.facade.download_image.side_effect = Exception('unauthorized')
+        source = RemoteImageSource(self.region, self.staging_dir, 1)
+        with self.assertRaisesRegexp(IOError, 'unauthorized'):
+            source.open(self.images['a'])
+        self.assertEquals(os.listdir(self.staging_dir), [])
+
+    def test_checksum(self):
+        """the download is verified against the checksum of the image and
+        nothing is staged if it does not match"""
+        self.images['a'].checksum = hashlib.md5('a' * 262144).hexdigest()
+        self.images['b'].checksum = hashlib.md5('corrupted').hexdigest()
+        source = RemoteImageSource(self.region, self.staging_dir, 1)
+        self.assertEquals(self.read(source, 'a'), 'a' * 262144)
+        self.assertRaises(IOError, source.open, self.images['b'])
+        self.assertEquals(os.listdir(self.staging_dir), ['a'])
+        self.assertEquals(source.staged_bytes(), 262144)
+
+    def test_concurrent(self):
+        """an image requested by several threads is downloaded once"""
+        def download(region, id):
+            time.sleep(0.05)
+            return StringIO.StringIO(id)
+        self.facade.download_image.side_effect = download
+        source = RemoteImageSource(self.region, self.staging_dir, 1)
+        results = list()
+        threads = list(threading.Thread(
+            target=lambda: results.append(self.read(source, 'a')))
+            for i in range(4))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(results, ['a'] * 4)
+        self.assertEquals(self.downloads(), ['a'])
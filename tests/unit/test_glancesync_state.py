@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+#
+import unittest
+import os
+import shutil
+import tempfile
+
+from fiwareglancesync.glancesync_state import SyncState, master_fingerprint
+from fiwareglancesync.glancesync_image import GlanceSyncImage
+
+
+class TestSyncState(unittest.TestCase):
+    """Test the state saved between synchronisations"""
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp(prefix='glancesync_state_tmp')
+        self.path = os.path.join(self.state_dir, 'state')
+        self.images = {
+            'image1': GlanceSyncImage('image1', '01', 'Madrid', 'tenant1',
+                                      True, 'ch1', 1000, 'active',
+                                      {'type': 'base', 'nid': 1}),
+            'image2': GlanceSyncImage('image2', '02', 'Madrid', 'tenant1',
+                                      True, 'ch2', 1000, 'active', {})}
+        self.target = {'metadata_set': set(['type']),
+                       'metadata_condition': compile('True', 'c', 'eval'),
+                       'replace': set(), 'rename': set(['image2'])}
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+    def test_update_master(self):
+        """the changed, new and removed images are returned"""
+        state = SyncState(self.path)
+        self.assertEquals(state.update_master(self.images),
+                          set(['image1', 'image2']))
+        self.assertEquals(state.update_master(self.images), set())
+        self.images['image1'].checksum = 'ch3'
+        self.images['image3'] = self.images.pop('image2')
+        self.assertEquals(state.update_master(self.images),
+                          set(['image1', 'image2', 'image3']))
+
+    def test_master_fingerprint(self):
+        """only the properties in metadata_set and the options of the target
+        that affect the synchronisation are considered"""
+        fingerprint = master_fingerprint(self.images, self.target)
+        self.images['image1'].user_properties['nid'] = 2
+        self.assertEquals(master_fingerprint(self.images, self.target),
+                          fingerprint)
+        self.images['image1'].user_properties['type'] = 'other'
+        fingerprint2 = master_fingerprint(self.images, self.target)
+        self.assertNotEquals(fingerprint2, fingerprint)
+        self.target['rename'] = set()
+        self.assertNotEquals(master_fingerprint(self.images, self.target),
+                             fingerprint2)
+
+    def test_converged(self):
+        """the marker is saved and read by other object"""
+        state = SyncState(self.path)
+        state.update_master(self.images)
+        self.assertFalse(state.is_converged('Madrid', 'm1', ('01', 't1')))
+        state.set_converged('Madrid', 'm1', ('01', 't1'))
+        state = SyncState(self.path)
+        self.assertTrue(state.is_converged('Madrid', 'm1', ('01', 't1')))
+        self.assertFalse(state.is_converged('Madrid', 'm2', ('01', 't1')))
+        self.assertFalse(state.is_converged('Madrid', 'm1', ('01', 't2')))
+        self.assertEquals(state.update_master(self.images), set())
+
+    def test_converged_max_age(self):
+        """a marker older than max_age is ignored"""
+        state = SyncState(self.path, max_age=60)
+        state.set_converged('Madrid', 'm1', 'r1')
+        self.assertTrue(state.is_converged('Madrid', 'm1', 'r1'))
+        state.regions['Madrid']['time'] -= 60
+        self.assertFalse(state.is_converged('Madrid', 'm1', 'r1'))
+        self.assertTrue(SyncState(self.path).is_converged('Madrid', 'm1',
+                                                          'r1'))
+
+    def test_forget_region(self):
+        """a forgotten region is not converged"""
+        state = SyncState(self.path)
+        state.set_converged('Madrid', 'm1', None)
+        state.forget_region('Madrid')
+        self.assertFalse(SyncState(self.path).is_converged('Madrid', 'm1',
+                                                           None))
+
+    def test_concurrent_writers(self):
+        """the regions saved by other process are preserved"""
+        state1 = SyncState(self.path)
+        state2 = SyncState(self.path)
+        state1.set_converged('Madrid', 'm1', 'r1')
+        state2.set_converged('Burgos', 'm1', 'r2')
+        state = SyncState(self.path)
+        self.assertTrue(state.is_converged('Madrid', 'm1', 'r1'))
+        self.assertTrue(state.is_converged('Burgos', 'm1', 'r2'))
+
+    def test_corrupted(self):
+        """a file that can not be read is ignored"""
+        with open(self.path, 'w') as f:
+            f.write('garbage')
+        state = SyncState(self.path)
+        self.assertFalse(state.is_converged('Madrid', 'm1', 'r1'))
+        state.set_converged('Madrid', 'm1', 'r1')
+        self.assertTrue(SyncState(self.path).is_converged('Madrid', 'm1',
+                                                          'r1'))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+#
+import unittest
+import os
+import shutil
+import tempfile
+
+from fiwareglancesync.glancesync_status import SyncStatusStore
+from fiwareglancesync.glancesync_image import GlanceSyncImage
+
+
+class TestSyncStatusStore(unittest.TestCase):
+    """Test the store of the synchronisation status of the images"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='glancesync_status_tmp')
+        self.db_path = os.path.join(self.tmp, 'status.db')
+        self.store = SyncStatusStore(self.db_path)
+        self.image1 = GlanceSyncImage('image1', '01', 'Valladolid', size=100)
+        self.image2 = GlanceSyncImage('image2', '02', 'Valladolid', size=50)
+        self.region_image = GlanceSyncImage('image1', 'r01', 'Burgos')
+        self.tuples = [('ok', self.image1), ('pending_upload', self.image2)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_update_region(self):
+        """the status of the images is saved, with the UUID of the region
+        images, and read by other objects"""
+        self.store.update_region('Burgos', self.tuples,
+                                 {'image1': self.region_image}, timestamp=10)
+        rows = SyncStatusStore(self.db_path).get_region('Burgos')
+        self.assertEquals(rows, [
+            {'region': 'Burgos', 'name': 'image2', 'status': 'pending_upload',
+             'id': None, 'size': 50, 'checked': 10},
+            {'region': 'Burgos', 'name': 'image1', 'status': 'ok',
+             'id': 'r01', 'size': 100, 'checked': 10}])
+        self.assertEquals(self.store.get_region('master:Burgos'), rows)
+        self.assertEquals(self.store.get_region('Burgos', 'image1'),
+                          rows[1:])
+        self.assertEquals(self.store.get_region('Madrid'), [])
+
+    def test_update_region_complete(self):
+        """a complete update replaces the status of all the images of the
+        region; a partial update, only the status of its images"""
+        self.store.update_region('Burgos', self.tuples)
+        self.store.update_region('other:Madrid', self.tuples)
+        self.store.update_region('Burgos', self.tuples[1:], complete=False)
+        self.assertEquals(len(self.store.get_region('Burgos')), 2)
+        self.store.update_region('Burgos', self.tuples[1:])
+        self.assertEquals(
+            list(row['name'] for row in self.store.get_region('Burgos')),
+            ['image2'])
+        self.assertEquals(len(self.store.get_region('other:Madrid')), 2)
+        self.assertEquals(self.store.get_regions(), ['Burgos',
+                                                     'other:Madrid'])
+
+    def test_set_image(self):
+        """the status of an image is updated, keeping the UUID if the new
+        one is unknown"""
+        self.store.update_region('Burgos', self.tuples,
+                                 {'image1': self.region_image}, timestamp=10)
+        self.store.set_image('Burgos', 'image2', 'ok', 'r02', timestamp=20)
+        self.store.set_image('Burgos', 'image1', 'ok', timestamp=30)
+        rows = self.store.get_region('Burgos')
+        self.assertEquals(list((r['status'], r['id'], r['checked'])
+                               for r in rows),
+                          [('ok', 'r02', 20), ('ok', 'r01', 30)])
+
+    def test_touch_and_forget(self):
+        """touch_region updates the time of verification and forget_region
+        removes the status of the region"""
+        self.store.update_region('Burgos', self.tuples, timestamp=10)
+        self.store.update_region('Madrid', self.tuples, timestamp=10)
+        self.store.touch_region('Burgos', timestamp=20)
+        self.assertEquals(set(r['checked'] for r in
+                              self.store.get_region('Burgos')), set([20]))
+        self.store.forget_region('Burgos')
+        self.assertEquals(self.store.get_region('Burgos'), [])
+        self.assertEquals(self.store.get_regions(), ['Madrid'])
+
+    def test_utf8_names(self):
+        """the names are returned as UTF-8 strings"""
+        image = GlanceSyncImage(u'imagen\xf1', '03', 'Valladolid')
+        self.store.update_region('Burgos', [('ok', image)])
+        name = self.store.get_region('Burgos')[0]['name']
+        self.assertEquals(name, 'imagen\xc3\xb1')
+        self.assertIsInstance(name, str)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -- encoding: utf-8 --
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+#
+import unittest
+import hashlib
+import StringIO
+import threading
+
+from fiwareglancesync.glancesync_streams import TeeReader, IterableReader
+from fiwareglancesync.glancesync_streams import ChecksumReader, ChecksumError
+
+
+class FailingFile(object):
+    """file-like object that fails after the first read"""
+    def __init__(self):
+        self.reads = 0
+
+    def read(self, size):
+        self.reads += 1
+        if self.reads > 1:
+            raise IOError('disk error')
+        return 'a' * size
+
+    def close(self):
+        pass
+
+
+class TestTeeReader(unittest.TestCase):
+    """Test that the content of a file is read once and copied to all the
+    branches"""
+
+    def setUp(self):
+        self.content = ''.join(str(i) for i in range(10000))
+        self.file_obj = StringIO.StringIO(self.content)
+
+    def _read_all(self, branches, sizes):
+        """read all the branches at the same time, using a thread for each
+        branch"""
+        results = dict()
+
+        def consume(index, branch, size):
+            data = list()
+            chunk = branch.read(size)
+            while chunk:
+                data.append(chunk)
+                chunk = branch.read(size)
+            results[index] = ''.join(data)
+
+        threads = list()
+        for index, branch in enumerate(branches):
+            thread = threading.Thread(target=consume,
+                                      args=(index, branch, sizes[index]))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_content(self):
+        """all the branches get the full content"""
+        tee = TeeReader(self.file_obj, 3, buffer_size=1000, chunk_size=100)
+        tee.start()
+        results = self._read_all(tee.branches, [1, 1000, 333])
+        tee.join()
+        self.assertEquals(len(results), 3)
+        for result in results.values():
+            self.assertEquals(result, self.content)
+        self.assertTrue(self.file_obj.closed)
+
+    def test_read_all(self):
+        """read without size returns the full content"""
+        tee = TeeReader(self.file_obj, 1, chunk_size=100)
+        tee.start()
+        self.assertEquals(tee.branches[0].read(), self.content)
+        self.assertEquals(tee.branches[0].read(), '')
+        tee.join()
+
+    def test_iter(self):
+        """iterate over the chunks of a branch"""
+        tee = TeeReader(self.file_obj, 1, chunk_size=100)
+        tee.start()
+        self.assertEquals(''.join(tee.branches[0]), self.content)
+        tee.join()
+
+    def test_back_pressure(self):
+        """the reading stops when the buffer of a branch is full"""
+        tee = TeeReader(self.file_obj, 2, buffer_size=300, chunk_size=100)
+        tee.start()
+        tee.branches[0].read(100)
+        tee._thread.join(0.2)
+        self.assertTrue(tee._thread.is_alive())
+        # the second branch has three chunks in its buffer and the fourth
+        # chunk is waiting
+        self.assertEquals(self.file_obj.tell(), 400)
+        tee.branches[0].close()
+        tee.branches[1].close()
+        tee.join()
+
+    def test_closed_branch(self):
+        """a closed branch does not stall the others"""
+        tee = TeeReader(self.file_obj, 2, buffer_size=100, chunk_size=100)
+        tee.branches[0].close()
+        tee.start()
+        self.assertEquals(tee.branches[1].read(), self.content)
+        tee.join()
+        self.assertRaises(ValueError, tee.branches[0].read)
+
+    def test_error(self):
+        """an error reading the file is raised in all the branches"""
+        tee = TeeReader(FailingFile(), 2, buffer_size=1000, chunk_size=100)
+        tee.start()
+        for branch in tee.branches:
+            self.assertEquals(branch.read(100), 'a' * 100)
+            self.assertRaises(IOError, branch.read, 100)
+        tee.join()
+
+
+class TestIterableReader(unittest.TestCase):
+    """Test the file-like object over an iterable of chunks"""
+
+    def test_read(self):
+        """the chunks are split and joined as requested"""
+        reader = IterableReader(['ab', 'cde', '', 'f'])
+        self.assertEquals(reader.read(1), 'a')
+        self.assertEquals(reader.read(3), 'bcd')
+        self.assertEquals(reader.read(), 'ef')
+        self.assertEquals(reader.read(10), '')
+
+    def test_iter_and_close(self):
+        """the content can be iterated and the iterable is closed"""
+        chunks = StringIO.StringIO('x' * 100000)
+        reader = IterableReader(chunks)
+        self.assertEquals(''.join(reader), 'x' * 100000)
+        reader.close()
+        self.assertTrue(chunks.closed)
+
+
+class TestChecksumReader(unittest.TestCase):
+    """Test the verification of the content while it is read"""
+
+    def setUp(self):
+        self.content = 'a' * 1000
+        self.md5 = hashlib.md5(self.content).hexdigest()
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+
+    def test_verified(self):
+        """the digests are available after reading the content"""
+        reader = ChecksumReader(StringIO.StringIO(self.content), self.md5,
+                                1000, {'sha256': self.sha256})
+        self.assertEquals(''.join(reader), self.content)
+        self.assertEquals(reader.digests, {'md5': self.md5,
+                                           'sha256': self.sha256})
+        self.assertIsNone(reader.error)
+
+    def test_mismatch_before_last_bytes(self):
+        """with the size known, the error is raised instead of returning the
+        last bytes"""
+        reader = ChecksumReader(StringIO.StringIO(self.content), 'bad', 1000)
+        self.assertEquals(len(reader.read(600)), 600)
+        with self.assertRaises(ChecksumError):
+            reader.read(600)
+        self.assertIs(reader.error.__class__, ChecksumError)
+
+    def test_truncated(self):
+        """a file shorter than the expected size is detected at the end"""
+        reader = ChecksumReader(StringIO.StringIO(self.content), self.md5,
+                                2000)
+        self.assertEquals(reader.read(1000), self.content)
+        with self.assertRaisesRegexp(ChecksumError, 'size mismatch'):
+            reader.read(1000)
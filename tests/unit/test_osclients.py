@@ -23,10 +23,13 @@
 
 
 from os import environ
+import threading
+import time
 from unittest import TestCase
 from mock import patch, MagicMock
 from fiwareglancesync.utils.osclients import OpenStackClients
 import glanceclient.v1.client
+import glanceclient.v2.client
 import keystoneclient.v2_0.client
 import keystoneclient.session
 
@@ -157,6 +160,54 @@ class TestOSClients(TestCase):
 
         self.assertIsInstance(glanceClient, glanceclient.v1.client.Client)
 
+    @patch('fiwareglancesync.utils.osclients.session', mock_session)
+    def test_get_glanceclient_cached(self):
+        """check that the glance client of each region is reused until the
+        credential or the token change"""
+        osclients = OpenStackClients(modules="glance")
+        osclients.set_keystone_version(use_v3=False)
+        client1 = osclients.get_glanceclient('Spain2')
+        self.assertIs(osclients.get_glanceclient('Spain2'), client1)
+        osclients.set_region('Spain2')
+        self.assertIs(osclients.get_glanceclient(), client1)
+
+        client2 = osclients.get_glanceclient('Madrid')
+        self.assertIsNot(client2, client1)
+        self.assertIs(osclients.get_glanceclient('Madrid'), client2)
+
+        osclients.set_credential('user', 'password', tenant_name='tenant')
+        self.assertIsNot(osclients.get_glanceclient('Spain2'), client1)
+
+        client3 = osclients.get_glanceclient('Spain2')
+        with patch.object(MySessionMock, 'get_token', return_value='other'):
+            self.assertIsNot(osclients.get_glanceclient('Spain2'), client3)
+
+    @patch('fiwareglancesync.utils.osclients.session', mock_session)
+    def test_get_glanceclient_timeout(self):
+        """check that the socket timeout is passed to the client and the
+        clients with other timeout are cached separately"""
+        osclients = OpenStackClients(modules="glance")
+        osclients.set_keystone_version(use_v3=False)
+        client1 = osclients.get_glanceclient('Spain2')
+        client2 = osclients.get_glanceclient('Spain2', timeout=60)
+        self.assertIsNot(client2, client1)
+        self.assertIs(osclients.get_glanceclient('Spain2', timeout=60),
+                      client2)
+        self.assertEquals(client2.http_client.timeout, 60)
+
+    @patch('fiwareglancesync.utils.osclients.session', mock_session)
+    def test_get_glanceclient_v2(self):
+        """check that the clients of the glance API v1 and v2 are different
+        objects"""
+        osclients = OpenStackClients(modules="glance")
+        osclients.set_keystone_version(use_v3=False)
+        client2 = osclients.get_glanceclient('Spain2', version='2')
+        self.assertIsInstance(client2, glanceclient.v2.client.Client)
+        self.assertIs(osclients.get_glanceclient('Spain2', version=2),
+                      client2)
+        self.assertIsInstance(osclients.get_glanceclient('Spain2'),
+                              glanceclient.v1.client.Client)
+
     def test_get_keystoneclient_v2(self):
         """test_get_keystoneclient_v2 check that we could retrieve a Session client to work with keystone v2"""
         osclients = OpenStackClients()
@@ -263,6 +314,29 @@ class TestOSClients(TestCase):
         osclients.set_region(region)
         self.assertEqual(osclients.region, region)
 
+    def test_get_session_concurrent(self):
+        """check that the threads that get the session at the same time
+        share only one session"""
+        osclients = OpenStackClients()
+        sessions = []
+
+        def new_session(auth):
+            time.sleep(0.05)
+            return MagicMock()
+
+        with patch('fiwareglancesync.utils.osclients.session.Session',
+                   side_effect=new_session) as session_class:
+            threads = list(threading.Thread(
+                target=lambda: sessions.append(osclients.get_session()))
+                for i in range(4))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEquals(session_class.call_count, 1)
+        self.assertEquals(len(set(id(session) for session in sessions)), 1)
+
     def test_get_session_without_auth_url(self):
         """test_get_session_without_auth_url check that we could not retrieve a session without auth_url"""
 
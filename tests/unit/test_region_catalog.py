@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import threading
+import time
+from mock import MagicMock
+
+from fiwareglancesync.app.mod_auth.region_catalog import RegionCatalog
+
+
+class TestRegionCatalog(TestCase):
+
+    """
+    Class to test the cache of the regions registered in keystone.
+    """
+
+    def setUp(self):
+        """
+        Create a catalog with a fake clock.
+
+        :return: Nothing.
+        """
+        self.now = 1000
+        self.fetch = MagicMock(return_value=['Trento', 'Budapest2'])
+        self.catalog = RegionCatalog(self.fetch, ttl=600, retry=10, max_retry=60, clock=lambda: self.now)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Remove the temporal directory.
+
+        :return: Nothing.
+        """
+        shutil.rmtree(self.tmp_dir)
+
+    def wait_refresh(self):
+        """
+        Wait until the background refresh is finished.
+
+        :return: Nothing.
+        """
+        for i in range(500):
+            if not self.catalog._refreshing:
+                break
+
+            time.sleep(0.01)
+
+    def test_contains(self):
+        """
+        Check that the catalog is obtained once and used by the following lookups.
+
+        :return: Nothing.
+        """
+        self.assertTrue(self.catalog.contains('Trento'))
+        self.assertTrue(self.catalog.contains('Budapest2'))
+        self.assertFalse(self.catalog.contains('fake'))
+
+        self.assertEquals(self.fetch.call_count, 1)
+
+    def test_get_regions(self):
+        """
+        Check that the regions are returned as a frozenset.
+
+        :return: Nothing.
+        """
+        self.assertEquals(self.catalog.get_regions(), frozenset(['Trento', 'Budapest2']))
+
+    def test_stale_refresh_background(self):
+        """
+        Check that a stale catalog is still used while it is obtained again in background.
+
+        :return: Nothing.
+        """
+        self.catalog.get_regions()
+        self.now += 600
+        release = threading.Event()
+
+        def fetch():
+            release.wait()
+            return ['Trento', 'Madrid']
+
+        self.fetch.side_effect = fetch
+
+        self.assertTrue(self.catalog.contains('Budapest2'))
+        self.assertTrue(self.catalog.contains('Budapest2'))
+
+        release.set()
+        self.wait_refresh()
+
+        self.assertEquals(self.fetch.call_count, 2)
+        self.assertTrue(self.catalog.contains('Madrid'))
+        self.assertFalse(self.catalog.contains('Budapest2'))
+
+    def test_stale_refresh_error(self):
+        """
+        Check that a stale catalog is kept when keystone fails, and it is not asked again until the backoff delay.
+
+        :return: Nothing.
+        """
+        self.catalog.get_regions()
+        self.now += 600
+        self.fetch.side_effect = Exception('Boom!')
+
+        self.assertTrue(self.catalog.contains('Trento'))
+        self.wait_refresh()
+        self.assertTrue(self.catalog.contains('Trento'))
+        self.wait_refresh()
+
+        self.assertEquals(self.fetch.call_count, 2)
+
+        self.now += 10
+        self.assertTrue(self.catalog.contains('Trento'))
+        self.wait_refresh()
+
+        self.assertEquals(self.fetch.call_count, 3)
+
+    def test_error_backoff(self):
+        """
+        Check that without catalog the lookups raise the last error without asking keystone during the backoff
+        delay, which is doubled after each error up to max_retry.
+
+        :return: Nothing.
+        """
+        self.fetch.side_effect = Exception('Boom!')
+
+        self.assertRaises(Exception, self.catalog.contains, 'Trento')
+        self.assertRaises(Exception, self.catalog.contains, 'Trento')
+        self.assertEquals(self.fetch.call_count, 1)
+
+        for delay in (10, 20, 40, 60, 60):
+            self.now += delay - 1
+            self.assertRaises(Exception, self.catalog.contains, 'Trento')
+            calls = self.fetch.call_count
+            self.now += 1
+            self.assertRaises(Exception, self.catalog.contains, 'Trento')
+            self.assertEquals(self.fetch.call_count, calls + 1)
+
+    def test_error_recovery(self):
+        """
+        Check that the catalog is obtained when keystone recovers from an error.
+
+        :return: Nothing.
+        """
+        self.fetch.side_effect = [Exception('Boom!'), ['Trento']]
+
+        self.assertRaises(Exception, self.catalog.contains, 'Trento')
+        self.now += 10
+
+        self.assertTrue(self.catalog.contains('Trento'))
+        self.assertEquals(self.catalog._failures, 0)
+
+    def test_shared_db(self):
+        """
+        Check that a catalog obtained by a worker is used by other worker with the same database until it is stale.
+
+        :return: Nothing.
+        """
+        db_path = os.path.join(self.tmp_dir, 'regions.db')
+        catalog1 = RegionCatalog(self.fetch, ttl=600, db_path=db_path, clock=lambda: self.now)
+        catalog2 = RegionCatalog(self.fetch, ttl=600, db_path=db_path, clock=lambda: self.now)
+
+        catalog1.get_regions()
+        self.now += 300
+
+        self.assertEquals(catalog2.get_regions(), frozenset(['Trento', 'Budapest2']))
+        self.assertEquals(self.fetch.call_count, 1)
+
+        # The catalog of the database expires at the same time in both workers
+        self.now += 300
+        self.catalog = catalog2
+        catalog2.get_regions()
+        self.wait_refresh()
+
+        self.assertEquals(self.fetch.call_count, 2)
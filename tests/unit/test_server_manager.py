@@ -25,6 +25,8 @@
 import httplib
 import json
 import os
+import shutil
+import tempfile
 import unittest
 
 import requests_mock
@@ -36,8 +38,10 @@ from flask_sqlalchemy import SQLAlchemy
 from fiwareglancesync.app import app
 from fiwareglancesync.app.app import db
 from fiwareglancesync.app.mod_auth.models import User
+from fiwareglancesync.app.mod_auth.controllers import engine
 from fiwareglancesync.glancesync_image import GlanceSyncImage
-from fiwareglancesync.utils.utils import Task
+from fiwareglancesync.glancesync_status import SyncStatusStore
+from fiwareglancesync.utils.utils import Image, Task
 from fiwareglancesync.app.settings.settings import KEYSTONE_URL
 
 
@@ -256,6 +260,7 @@ class TestServerRequests(unittest.TestCase):
         app.app.config['SQLALCHEMY_DATABASE_URI'] = TEST_SQLALCHEMY_DATABASE_URI
 
         db.create_all()
+        engine.stop()
 
         image1 = GlanceSyncImage(region='Valladolid', name='image10', id='010', status='active',
                                  size=1073741914, checksum='b1d5781111d84f7b3fe45a0852e59758cd7a87e5',
@@ -268,7 +273,8 @@ class TestServerRequests(unittest.TestCase):
         images_region = [image1, image2]
 
         self.config = {
-            'return_value.get_images_region.return_value': images_region
+            'return_value.get_images_region.return_value': images_region,
+            'get_status_store.return_value': None
         }
 
     def tearDown(self):
@@ -285,6 +291,9 @@ class TestServerRequests(unittest.TestCase):
         # Delete the SQLite file
         os.remove(db.session.bind.url.database)
 
+        # Discard the GlanceSync object built with the mock
+        engine.stop()
+
     def test_badrequest_statuscode(self, m):
         """
         Check that we receive a BAD REQUEST if the requested region is not supported in the FIWARE Lab.
@@ -327,6 +336,128 @@ class TestServerRequests(unittest.TestCase):
         self.assertTrue(data['images'][0]['id'] == u'010', 'The expected id of the first image is not 010')
         self.assertTrue(data['images'][1]['id'] == u'020', 'The expected id of the first image is not 020')
 
+    @patch('fiwareglancesync.app.mod_auth.controllers.GlanceSync', auto_spec=True)
+    def test_get_stored_status(self, m, glancesync):
+        """
+        Test that the status saved by the last synchronisation is returned, without listing the region.
+
+        :param m: The request mock.
+        :return: Nothing.
+        """
+        m.get(KEYSTONE_URL + '/v2.0/tokens/token', json=self.validate_info_v2)
+        m.post(KEYSTONE_URL + '/v2.0/tokens', json=self.validate_info_v2)
+
+        m.get(KEYSTONE_URL + '/v3/OS-EP-FILTER/endpoint_groups', json=self.region_list)
+
+        tmp = tempfile.mkdtemp(prefix='glancesync_status_tmp')
+        try:
+            store = SyncStatusStore(os.path.join(tmp, 'status.db'))
+            image = GlanceSyncImage(region='Valladolid', name='image10', id='010', size=1073741914)
+            store.update_region('Trento', [('pending_upload', image)], timestamp=1462876400)
+            glancesync.configure_mock(**{'get_status_store.return_value': store})
+
+            result = self.app.get('/regions/Trento', headers={'X-Auth-Token': 'token'})
+        finally:
+            shutil.rmtree(tmp)
+
+        data = json.loads(result.data)
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(data['images'], [{'id': None, 'name': 'image10', 'status': 'pending_upload',
+                                           'message': None, 'checked': '2016-05-10T10:33:20Z'}])
+        self.assertFalse(glancesync.called, 'The region should not be listed')
+
+    @patch('fiwareglancesync.app.mod_auth.controllers.GlanceSync', auto_spec=True)
+    def test_get_stored_status_file_and_adopt(self, m, glancesync):
+        """
+        Test that the error_file and pending_adopt status saved by the last synchronisation are returned.
+
+        :param m: The request mock.
+        :return: Nothing.
+        """
+        m.get(KEYSTONE_URL + '/v2.0/tokens/token', json=self.validate_info_v2)
+        m.post(KEYSTONE_URL + '/v2.0/tokens', json=self.validate_info_v2)
+
+        m.get(KEYSTONE_URL + '/v3/OS-EP-FILTER/endpoint_groups', json=self.region_list)
+
+        tmp = tempfile.mkdtemp(prefix='glancesync_status_tmp')
+        try:
+            store = SyncStatusStore(os.path.join(tmp, 'status.db'))
+            image10 = GlanceSyncImage(region='Valladolid', name='image10', id='010', size=1073741914)
+            image20 = GlanceSyncImage(region='Valladolid', name='image20', id='020', size=1073741914)
+            store.update_region('Trento', [(Image.ERROR_FILE, image10), (Image.PENDING_ADOPT, image20)],
+                                timestamp=1462876400)
+            glancesync.configure_mock(**{'get_status_store.return_value': store})
+
+            result = self.app.get('/regions/Trento', headers={'X-Auth-Token': 'token'})
+        finally:
+            shutil.rmtree(tmp)
+
+        data = json.loads(result.data)
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(sorted(image['status'] for image in data['images']), ['error_file', 'pending_adopt'])
+        for image in data['images']:
+            self.assertIn(image['status'], Image.glancestatus)
+
+    @patch('fiwareglancesync.app.mod_auth.controllers.GlanceSync', auto_spec=True)
+    def test_get_stored_status_image_not_found(self, m, glancesync):
+        """
+        Test that an image absent from the status saved for the region is not found, without listing the region.
+
+        :param m: The request mock.
+        :return: Nothing.
+        """
+        m.get(KEYSTONE_URL + '/v2.0/tokens/token', json=self.validate_info_v2)
+        m.post(KEYSTONE_URL + '/v2.0/tokens', json=self.validate_info_v2)
+
+        m.get(KEYSTONE_URL + '/v3/OS-EP-FILTER/endpoint_groups', json=self.region_list)
+
+        tmp = tempfile.mkdtemp(prefix='glancesync_status_tmp')
+        try:
+            store = SyncStatusStore(os.path.join(tmp, 'status.db'))
+            image = GlanceSyncImage(region='Valladolid', name='image10', id='010', size=1073741914)
+            store.update_region('Trento', [('pending_upload', image)], timestamp=1462876400)
+            glancesync.configure_mock(**{'get_status_store.return_value': store})
+
+            result = self.app.get('/regions/Trento?image=image20', headers={'X-Auth-Token': 'token'})
+        finally:
+            shutil.rmtree(tmp)
+
+        self.assertEqual(result.status_code, httplib.NOT_FOUND)
+        self.assertFalse(glancesync.called, 'The region should not be listed')
+
+    @patch('fiwareglancesync.app.mod_auth.controllers.GlanceSync', auto_spec=True)
+    def test_get_status_region_not_stored(self, m, glancesync):
+        """
+        Test that the region is listed if there is not a status saved for it.
+
+        :param m: The request mock.
+        :return: Nothing.
+        """
+        m.get(KEYSTONE_URL + '/v2.0/tokens/token', json=self.validate_info_v2)
+        m.post(KEYSTONE_URL + '/v2.0/tokens', json=self.validate_info_v2)
+
+        m.get(KEYSTONE_URL + '/v3/OS-EP-FILTER/endpoint_groups', json=self.region_list)
+
+        tmp = tempfile.mkdtemp(prefix='glancesync_status_tmp')
+        try:
+            store = SyncStatusStore(os.path.join(tmp, 'status.db'))
+            image = GlanceSyncImage(region='Valladolid', name='image10', id='010', size=1073741914)
+            store.update_region('Other', [('pending_upload', image)], timestamp=1462876400)
+            self.config['get_status_store.return_value'] = store
+            glancesync.configure_mock(**self.config)
+
+            result = self.app.get('/regions/Trento?image=image20', headers={'X-Auth-Token': 'token'})
+        finally:
+            shutil.rmtree(tmp)
+
+        data = json.loads(result.data)
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual([item['id'] for item in data['images']], [u'020'])
+        self.assertTrue(glancesync.called, 'The region should be listed')
+
     @patch('threading.Thread')
     def test_synchronize(self, m, threading):
         """
@@ -30,8 +30,13 @@ import os
 import logging
 import time
 import re
+import tempfile
+import StringIO
 
-from fiwareglancesync.sync import Sync
+from fiwareglancesync.sync import Sync, show_stored_status
+from fiwareglancesync.glancesync_plan import SyncPlan
+from fiwareglancesync.glancesync_status import SyncStatusStore
+from fiwareglancesync.glancesync_image import GlanceSyncImage
 
 
 class TestSync(unittest.TestCase):
@@ -60,6 +65,54 @@ class TestSync(unittest.TestCase):
         calls = [call('region1', dry_run=True), call('region2', dry_run=True)]
         self.glancesync.return_value.sync_region.assert_has_calls(calls)
 
+    def test_fanout_sync(self):
+        """check that sync_regions_fanout is called with all the regions"""
+        self.sync.regions = ['region1', 'region2']
+        config = {'return_value.sync_regions_fanout.return_value': []}
+        self.glancesync.configure_mock(**config)
+        self.sync.fanout_sync(dry_run=True)
+        self.glancesync.return_value.sync_regions_fanout.assert_called_once_with(
+            ['region1', 'region2'], dry_run=True)
+
+    def test_scheduled_sync(self):
+        """check that sync_regions_scheduled is called with all the regions"""
+        self.sync.regions = ['region1', 'region2']
+        config = {'return_value.sync_regions_scheduled.return_value': []}
+        self.glancesync.configure_mock(**config)
+        self.sync.scheduled_sync(dry_run=True)
+        self.glancesync.return_value.sync_regions_scheduled.\
+            assert_called_once_with(['region1', 'region2'], dry_run=True)
+
+    def test_sync_images(self):
+        """check that sync_images is called with the names and all the
+        regions"""
+        self.sync.regions = ['region1', 'region2']
+        config = {'return_value.sync_images.return_value': ['region2']}
+        self.glancesync.configure_mock(**config)
+        self.sync.sync_images(['image1', 'image2'])
+        self.glancesync.return_value.sync_images.assert_called_once_with(
+            ['image1', 'image2'], ['region1', 'region2'], dry_run=False)
+
+    def test_write_and_apply_plans(self):
+        """check that the plans written by write_plans are executed by
+        apply_plans"""
+        self.sync.regions = ['region1', 'other:region2']
+        config = {'return_value.plan_region.side_effect':
+                  lambda region: SyncPlan(region, [], dict())}
+        self.glancesync.configure_mock(**config)
+        (fd, path) = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.sync.write_plans(path)
+            self.sync.apply_plans(path, dry_run=True)
+        finally:
+            os.unlink(path)
+        calls = self.glancesync.return_value.execute_plan.call_args_list
+        self.assertEquals(len(calls), 2)
+        self.assertEquals(list(c[0][0].region for c in calls),
+                          ['region1', 'other:region2'])
+        self.assertEquals(calls[0][1], {'dry_run': True})
+
     def test_show_regions(self):
         """check that calls to get_regions are done"""
         targets = {'master': None, 'other_target': None}
@@ -85,6 +138,38 @@ class TestSync(unittest.TestCase):
             assert_called_with('MasterRegion', dir_name)
 
 
+class TestShowStoredStatus(unittest.TestCase):
+    """Test the report of the status saved in status_db"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='glancesync_status_tmp')
+        self.store = SyncStatusStore(os.path.join(self.tmp, 'status.db'))
+        image = GlanceSyncImage('image1', '01', 'Valladolid')
+        for region in ('r1', 'other:r1', 'other:r2'):
+            self.store.update_region(region, [('ok', image)],
+                                     timestamp=1462876400)
+
+    def tearDown(self):
+        for name in os.listdir(self.tmp):
+            os.unlink(os.path.join(self.tmp, name))
+        os.rmdir(self.tmp)
+
+    @patch('fiwareglancesync.sync.sys.stdout', new_callable=StringIO.StringIO)
+    @patch('fiwareglancesync.sync.GlanceSync', auto_spec=True)
+    def test_show_stored_status(self, glancesync, stdout):
+        """the status is read from the store, without creating a GlanceSync
+        object; a target is expanded with its regions in the store"""
+        glancesync.get_status_store.return_value = self.store
+        self.assertTrue(show_stored_status(['r1', 'other:']))
+        self.assertEqual(stdout.getvalue().splitlines(), [
+            'ok,r1,image1,2016-05-10T10:33:20Z',
+            'ok,other:r1,image1,2016-05-10T10:33:20Z',
+            'ok,other:r2,image1,2016-05-10T10:33:20Z'])
+        self.assertFalse(glancesync.called)
+        glancesync.get_status_store.return_value = None
+        self.assertFalse(show_stored_status([]))
+
+
 class TestSyncConstr(unittest.TestCase):
     """tests to check constructor, the expansion of the target and the
     configuration parameter preferable_order"""
@@ -206,6 +291,35 @@ class TestSyncParallel(unittest.TestCase):
         self.glancesync.configure_mock(**config)
         diff = self._check_sync_invoked(datetime_mock)
         assert(diff <= 1)
+        # the master images are filtered before forking the children
+        self.glancesync.return_value.images_to_sync.assert_any_call('region1')
+        self.glancesync.return_value.images_to_sync.assert_any_call('region2')
+        # and the index of images_dir is updated once, by the parent
+        self.glancesync.return_value.refresh_images_index.\
+            assert_called_once_with()
+
+    @patch('fiwareglancesync.sync.datetime')
+    def test_parallel_sync_filter_error(self, datetime_mock):
+        """a region whose master images cannot be filtered is skipped and
+        the other regions are synchronised"""
+        def images_to_sync(region):
+            if region == 'region1':
+                raise Exception('invalid metadata_condition')
+        config = {
+            'return_value.max_children': 2,
+            'return_value.images_to_sync.side_effect': images_to_sync
+        }
+        self.glancesync.configure_mock(**config)
+        dt = datetime.datetime(2020, 2, 6, 23, 57)
+        datetime_mock.configure_mock(**{'datetime.now.return_value': dt})
+        with patch.object(self.log, 'error') as error:
+            self.sync.parallel_sync()
+        self.assertFalse(
+            os.path.exists(os.path.join(self.dir_name, 'region1.txt')))
+        self.assertTrue(
+            os.path.exists(os.path.join(self.dir_name, 'region2.txt')))
+        self.assertEquals(error.call_count, 1)
+        self.assertIn('region1', error.call_args[0][0])
 
     @patch('fiwareglancesync.sync.datetime')
     def test_noparallel_sync(self, datetime_mock):
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Copyright 2015-2016 Telefónica Investigación y Desarrollo, S.A.U
+#
+# This file is part of FI-WARE project.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at:
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For those usages not covered by the Apache version 2.0 License please
+# contact with opensource@tid.es
+#
+
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import threading
+import time
+from mock import MagicMock
+
+from fiwareglancesync.app.mod_auth.token_cache import TokenCache, parse_expires
+from fiwareglancesync.utils.utils import TokenModel
+
+# 2016-02-10T11:16:56Z
+EXPIRES = 1455103016
+
+
+class CountingEvent(threading._Event):
+    """
+    Event that counts the threads that wait for it.
+    """
+
+    def __init__(self):
+        threading._Event.__init__(self)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def wait(self, timeout=None):
+        with self.lock:
+            self.count += 1
+        return threading._Event.wait(self, timeout)
+
+
+class TestTokenCache(TestCase):
+
+    """
+    Class to test the cache of the tokens validated by keystone.
+    """
+
+    def setUp(self):
+        """
+        Create a cache with a fake clock and a validation function that returns a new TokenModel each time.
+
+        :return: Nothing.
+        """
+        self.now = EXPIRES - 1000
+        self.validate = MagicMock(side_effect=lambda token: TokenModel(username='joe', id=token,
+                                                                       expires='2016-02-10T11:16:56Z'))
+        self.cache = TokenCache(ttl=300, max_size=2, clock=lambda: self.now)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Remove the temporal directory.
+
+        :return: Nothing.
+        """
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parse_expires(self):
+        """
+        Check the formats of the expiration time of keystone v2 and v3.
+
+        :return: Nothing.
+        """
+        self.assertEquals(parse_expires('2016-02-10T11:16:56Z'), EXPIRES)
+        self.assertEquals(parse_expires('2016-02-10T11:16:56.000000Z'), EXPIRES)
+        self.assertIsNone(parse_expires('fake date'))
+        self.assertIsNone(parse_expires(None))
+
+    def test_get_cached(self):
+        """
+        Check that a token is validated only once while it is in the cache.
+
+        :return: Nothing.
+        """
+        token = self.cache.get('token1', self.validate)
+
+        self.assertIs(self.cache.get('token1', self.validate), token)
+        self.assertEquals(self.validate.call_count, 1)
+
+    def test_get_ttl(self):
+        """
+        Check that a token is validated again after ttl seconds.
+
+        :return: Nothing.
+        """
+        self.cache.get('token1', self.validate)
+        self.now += 300
+
+        self.cache.get('token1', self.validate)
+
+        self.assertEquals(self.validate.call_count, 2)
+
+    def test_get_expires(self):
+        """
+        Check that a token is not kept beyond its expiration time.
+
+        :return: Nothing.
+        """
+        self.now = EXPIRES - 10
+        self.cache.get('token1', self.validate)
+        self.now = EXPIRES
+
+        self.cache.get('token1', self.validate)
+
+        self.assertEquals(self.validate.call_count, 2)
+
+    def test_get_not_cached(self):
+        """
+        Check that the tokens already expired or with an unknown expiration time are not cached.
+
+        :return: Nothing.
+        """
+        self.now = EXPIRES
+        self.cache.get('token1', self.validate)
+        self.cache.get('token1', self.validate)
+        self.validate.side_effect = lambda token: TokenModel(username='joe', id=token, expires='fake date')
+        self.cache.get('token2', self.validate)
+        self.cache.get('token2', self.validate)
+
+        self.assertEquals(self.validate.call_count, 4)
+
+    def test_get_error(self):
+        """
+        Check that the invalid tokens are not cached.
+
+        :return: Nothing.
+        """
+        self.validate.side_effect = Exception('Boom!')
+
+        self.assertRaises(Exception, self.cache.get, 'token1', self.validate)
+        self.assertRaises(Exception, self.cache.get, 'token1', self.validate)
+
+        self.assertEquals(self.validate.call_count, 2)
+
+    def test_get_disabled(self):
+        """
+        Check that all the tokens are validated when ttl is zero.
+
+        :return: Nothing.
+        """
+        cache = TokenCache(ttl=0)
+        cache.get('token1', self.validate)
+        cache.get('token1', self.validate)
+
+        self.assertEquals(self.validate.call_count, 2)
+
+    def test_max_size(self):
+        """
+        Check that the least recently used token is discarded when the cache is full.
+
+        :return: Nothing.
+        """
+        self.cache.get('token1', self.validate)
+        self.cache.get('token2', self.validate)
+        self.cache.get('token1', self.validate)
+        self.cache.get('token3', self.validate)
+
+        self.cache.get('token1', self.validate)
+        self.assertEquals(self.validate.call_count, 3)
+        self.cache.get('token2', self.validate)
+        self.assertEquals(self.validate.call_count, 4)
+
+    def test_invalidate(self):
+        """
+        Check that an invalidated token is validated again.
+
+        :return: Nothing.
+        """
+        self.cache.get('token1', self.validate)
+        self.cache.invalidate('token1')
+
+        self.cache.get('token1', self.validate)
+
+        self.assertEquals(self.validate.call_count, 2)
+
+    def test_single_flight(self):
+        """
+        Check that the requests with a token that is being validated wait for that validation.
+
+        :return: Nothing.
+        """
+        started = threading.Event()
+        release = threading.Event()
+        token = TokenModel(username='joe', id='token1', expires='fake date')
+
+        def validate(access_token):
+            started.set()
+            release.wait()
+            return token
+
+        validate_mock = MagicMock(side_effect=validate)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get('token1', validate_mock)))
+                   for i in range(5)]
+        threads[0].start()
+        started.wait()
+        waiting = CountingEvent()
+        self.cache._calls.values()[0].done = waiting
+        for thread in threads[1:]:
+            thread.start()
+
+        # Wait until the other requests are waiting for the first validation
+        while waiting.count < 4:
+            time.sleep(0.01)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(validate_mock.call_count, 1)
+        self.assertEquals(results, [token] * 5)
+
+    def test_single_flight_error(self):
+        """
+        Check that the requests waiting for a validation receive its error.
+
+        :return: Nothing.
+        """
+        started = threading.Event()
+        release = threading.Event()
+
+        def validate(access_token):
+            started.set()
+            release.wait()
+            raise Exception('Boom!')
+
+        errors = []
+
+        def get():
+            try:
+                self.cache.get('token1', validate)
+            except Exception as e:
+                errors.append(e.message)
+
+        threads = [threading.Thread(target=get) for i in range(2)]
+        threads[0].start()
+        started.wait()
+        waiting = CountingEvent()
+        self.cache._calls.values()[0].done = waiting
+        threads[1].start()
+
+        while waiting.count < 1:
+            time.sleep(0.01)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(errors, ['Boom!'] * 2)
+        self.assertEquals(self.cache._calls, {})
+
+    def test_shared_db(self):
+        """
+        Check that a token validated by a worker is not validated again by other worker using the same database.
+
+        :return: Nothing.
+        """
+        db_path = os.path.join(self.tmp_dir, 'tokens.db')
+        cache1 = TokenCache(ttl=300, db_path=db_path, clock=lambda: self.now)
+        cache2 = TokenCache(ttl=300, db_path=db_path, clock=lambda: self.now)
+
+        token = cache1.get('token1', self.validate)
+        shared_token = cache2.get('token1', self.validate)
+
+        self.assertEquals(self.validate.call_count, 1)
+        self.assertEquals(shared_token.username, token.username)
+        self.assertEquals(shared_token.expires, token.expires)
+        self.assertEquals(shared_token.id, 'token1')
+
+    def test_shared_db_without_token(self):
+        """
+        Check that the database saves a hash of the tokens, not the tokens.
+
+        :return: Nothing.
+        """
+        db_path = os.path.join(self.tmp_dir, 'tokens.db')
+        cache = TokenCache(ttl=300, db_path=db_path, clock=lambda: self.now)
+
+        cache.get('f81de7d47c00449380cc6c2ac3a7b81e', self.validate)
+
+        with open(db_path, 'rb') as f:
+            self.assertNotIn('f81de7d47c00449380cc6c2ac3a7b81e', f.read())
+
+    def test_shared_db_invalidate(self):
+        """
+        Check that an invalidated token is removed from the database too.
+
+        :return: Nothing.
+        """
+        db_path = os.path.join(self.tmp_dir, 'tokens.db')
+        cache1 = TokenCache(ttl=300, db_path=db_path, clock=lambda: self.now)
+        cache2 = TokenCache(ttl=300, db_path=db_path, clock=lambda: self.now)
+
+        cache1.get('token1', self.validate)
+        cache1.invalidate('token1')
+        cache2.get('token1', self.validate)
+
+        self.assertEquals(self.validate.call_count, 2)